@@ -1,14 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import ClientDisconnected
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps, lru_cache
+from itertools import groupby
+from operator import attrgetter
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Engine
 import os
+import base64
+import hashlib
+import hmac
 import csv
 import json
+import re
+import uuid
+import time
+import threading
+import multiprocessing
+import zipfile
+import shutil
+import tempfile
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from PIL import Image as PILImage
@@ -43,6 +67,264 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 # Crear directorio de files si no existe
 os.makedirs('files', exist_ok=True)
 
+# ==================== FUENTES PDF ====================
+
+# Variantes de la familia tipográfica y sufijo del archivo TTF en FONTS_FOLDER
+VARIANTES_FUENTE = {
+    'normal': 'Regular',
+    'bold': 'Bold',
+    'italic': 'Italic',
+    'boldItalic': 'BoldItalic'
+}
+# Familia estándar de los PDF (no necesita archivos): la predeterminada y el respaldo si faltan los TTF
+FUENTES_ESTANDAR = {
+    'normal': 'Helvetica',
+    'bold': 'Helvetica-Bold',
+    'italic': 'Helvetica-Oblique',
+    'boldItalic': 'Helvetica-BoldOblique'
+}
+
+def registrar_fuentes_pdf():
+    """
+    Registra una sola vez (al iniciar el proceso) la familia PDF_FONT_FAMILY desde FONTS_FOLDER.
+    Retorna el nombre de fuente de cada variante; si faltan archivos avisa y usa Helvetica.
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    
+    familia = app.config['PDF_FONT_FAMILY']
+    if familia == 'Helvetica':
+        return dict(FUENTES_ESTANDAR)
+    
+    carpeta = app.config['FONTS_FOLDER']
+    faltantes = [f"{familia}-{sufijo}.ttf" for sufijo in VARIANTES_FUENTE.values()
+                 if not os.path.exists(os.path.join(carpeta, f"{familia}-{sufijo}.ttf"))]
+    if faltantes:
+        print(f"ADVERTENCIA: faltan las fuentes de los PDF en {carpeta} ({', '.join(faltantes)}); "
+              f"los PDF usarán Helvetica. Ejecute instalar_dependencias.py para descargar {familia}")
+        return dict(FUENTES_ESTANDAR)
+    
+    fuentes = {}
+    try:
+        for variante, sufijo in VARIANTES_FUENTE.items():
+            nombre = f"{familia}-{sufijo}"
+            pdfmetrics.registerFont(TTFont(nombre, os.path.join(carpeta, f"{nombre}.ttf")))
+            fuentes[variante] = nombre
+        
+        pdfmetrics.registerFontFamily(familia, normal=fuentes['normal'], bold=fuentes['bold'],
+                                      italic=fuentes['italic'], boldItalic=fuentes['boldItalic'])
+    except Exception as e:
+        print(f"ADVERTENCIA: no se pudo registrar la fuente {familia}, los PDF usarán Helvetica: {e}")
+        return dict(FUENTES_ESTANDAR)
+    return fuentes
+
+FUENTES_PDF = registrar_fuentes_pdf()
+
+# Variante de cada fuente estándar que usan los estilos de ReportLab por defecto
+_VARIANTE_ESTANDAR = {nombre: variante for variante, nombre in FUENTES_ESTANDAR.items()}
+
+def estilos_pdf():
+    """getSampleStyleSheet() con la familia de FUENTES_PDF en lugar de Helvetica"""
+    styles = getSampleStyleSheet()
+    for estilo in styles.byName.values():
+        if getattr(estilo, 'fontName', None) in _VARIANTE_ESTANDAR:  # los ListStyle no tienen fuente
+            estilo.fontName = FUENTES_PDF[_VARIANTE_ESTANDAR[estilo.fontName]]
+    return styles
+
+# ==================== MÉTRICAS DE PDF ====================
+
+# Registro en memoria del proceso: generador -> acumulados (se consulta en /metricas)
+METRICAS_PDF = {}
+_bloqueo_metricas = threading.Lock()
+_contexto_metricas = threading.local()
+
+class MedicionPDF:
+    """
+    Tiempos de una generación de PDF. Cada etapa acumula tiempo exclusivo
+    (las etapas anidadas se descuentan de la que las contiene) y el resto
+    del tiempo queda como 'preparacion'.
+    """
+    
+    def __init__(self, generador):
+        self.generador = generador
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.pila = [0.0]
+        self.imagenes = 0
+        self.bytes = 0
+    
+    def agregar_etapa(self, nombre, duracion, hijos=0.0):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + duracion - hijos
+        self.pila[-1] += duracion
+
+def medicion_pdf_actual():
+    return getattr(_contexto_metricas, 'medicion', None)
+
+@contextmanager
+def medir_etapa(nombre):
+    """Mide una etapa del PDF en curso; sin medición activa no hace nada"""
+    medicion = medicion_pdf_actual()
+    if medicion is None:
+        yield
+        return
+    
+    inicio = time.perf_counter()
+    medicion.pila.append(0.0)
+    try:
+        yield
+    finally:
+        hijos = medicion.pila.pop()
+        medicion.agregar_etapa(nombre, time.perf_counter() - inicio, hijos)
+
+def contar_imagen_pdf(cantidad=1):
+    medicion = medicion_pdf_actual()
+    if medicion is not None:
+        medicion.imagenes += cantidad
+
+def registrar_bytes_pdf(cantidad):
+    medicion = medicion_pdf_actual()
+    if medicion is not None:
+        medicion.bytes += cantidad
+
+def registrar_metrica_pdf(medicion, error=False):
+    """Acumula la medición en el registro y escribe una línea de log JSON"""
+    total = time.perf_counter() - medicion.inicio
+    medicion.etapas['preparacion'] = max(0.0, total - medicion.pila[0])
+    
+    with _bloqueo_metricas:
+        metrica = METRICAS_PDF.setdefault(medicion.generador, {
+            'generaciones': 0,
+            'errores': 0,
+            'segundos_total': 0.0,
+            'segundos_max': 0.0,
+            'imagenes_total': 0,
+            'bytes_total': 0,
+            'etapas_segundos': {}
+        })
+        metrica['generaciones'] += 1
+        metrica['errores'] += 1 if error else 0
+        metrica['segundos_total'] += total
+        metrica['segundos_max'] = max(metrica['segundos_max'], total)
+        metrica['imagenes_total'] += medicion.imagenes
+        metrica['bytes_total'] += medicion.bytes
+        for etapa, segundos in medicion.etapas.items():
+            metrica['etapas_segundos'][etapa] = metrica['etapas_segundos'].get(etapa, 0.0) + segundos
+    
+    print(json.dumps({
+        'evento': 'pdf_generado',
+        'generador': medicion.generador,
+        'segundos': round(total, 4),
+        'imagenes': medicion.imagenes,
+        'bytes': medicion.bytes,
+        'etapas': {etapa: round(segundos, 4) for etapa, segundos in sorted(medicion.etapas.items())},
+        'error': error,
+        'pid': os.getpid()
+    }, ensure_ascii=False))
+
+def instrumentar_pdf(generador):
+    """Decorador para los generadores de PDF: mide etapas, imágenes y bytes producidos"""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            # Un generador llamado desde otro se mide dentro de la medición exterior
+            if medicion_pdf_actual() is not None:
+                return funcion(*args, **kwargs)
+            
+            medicion = MedicionPDF(generador)
+            _contexto_metricas.medicion = medicion
+            error = True
+            try:
+                resultado = funcion(*args, **kwargs)
+                error = resultado is None
+                return resultado
+            finally:
+                _contexto_metricas.medicion = None
+                registrar_metrica_pdf(medicion, error)
+        return envoltura
+    return decorador
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _inicio_consulta_pdf(conn, cursor, statement, parameters, context, executemany):
+    if medicion_pdf_actual() is not None:
+        conn.info['inicio_consulta_pdf'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _fin_consulta_pdf(conn, cursor, statement, parameters, context, executemany):
+    medicion = medicion_pdf_actual()
+    inicio = conn.info.pop('inicio_consulta_pdf', None)
+    if medicion is not None and inicio is not None:
+        medicion.agregar_etapa('consulta', time.perf_counter() - inicio)
+
+@app.route('/metricas')
+def metricas():
+    """
+    Métricas de generación de PDF del proceso. Accesible para administradores con sesión iniciada
+    o, para el recolector de Prometheus, con el encabezado "Authorization: Bearer <METRICAS_TOKEN>".
+    """
+    token = app.config['METRICAS_TOKEN']
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(token) and hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode())
+    es_administrador = current_user.is_authenticated and current_user.rol.nombre == 'Administrador'
+    if not (con_token or es_administrador):
+        abort(404)
+    
+    with _bloqueo_metricas:
+        datos = json.loads(json.dumps(METRICAS_PDF))
+    
+    if request.args.get('formato') == 'json':
+        return jsonify(datos)
+    
+    # Formato de texto de Prometheus
+    lineas = []
+    for nombre, campo in [('erp_pdf_generaciones_total', 'generaciones'),
+                          ('erp_pdf_errores_total', 'errores'),
+                          ('erp_pdf_segundos_total', 'segundos_total'),
+                          ('erp_pdf_segundos_max', 'segundos_max'),
+                          ('erp_pdf_imagenes_total', 'imagenes_total'),
+                          ('erp_pdf_bytes_total', 'bytes_total')]:
+        lineas.append(f'# TYPE {nombre} {"gauge" if campo == "segundos_max" else "counter"}')
+        for generador, metrica in sorted(datos.items()):
+            lineas.append(f'{nombre}{{generador="{generador}"}} {metrica[campo]}')
+    lineas.append('# TYPE erp_pdf_etapa_segundos_total counter')
+    for generador, metrica in sorted(datos.items()):
+        for etapa, segundos in sorted(metrica['etapas_segundos'].items()):
+            lineas.append(f'erp_pdf_etapa_segundos_total{{generador="{generador}",etapa="{etapa}"}} {segundos:.6f}')
+    
+    return Response('\n'.join(lineas) + '\n', mimetype='text/plain; version=0.0.4')
+
+# ==================== ESPACIO DE TRABAJO PDF ====================
+
+# Directorio temporal de la generación de PDF en curso en este hilo
+_contexto_espacio_trabajo = threading.local()
+
+@contextmanager
+def espacio_trabajo_pdf():
+    """
+    Directorio temporal propio de una generación de PDF, eliminado completo al terminar
+    (también si falla). ReportLab lee las imágenes al construir el documento, por eso los
+    archivos viven hasta el final de la generación. Se usa también como decorador; un
+    generador llamado desde otro comparte el directorio del exterior.
+    """
+    actual = getattr(_contexto_espacio_trabajo, 'directorio', None)
+    if actual is not None:
+        yield actual
+        return
+    
+    directorio = tempfile.mkdtemp(prefix='erp_pdf_')
+    _contexto_espacio_trabajo.directorio = directorio
+    try:
+        yield directorio
+    finally:
+        _contexto_espacio_trabajo.directorio = None
+        shutil.rmtree(directorio, ignore_errors=True)
+
+def ruta_temporal_pdf(nombre):
+    """Ruta para un archivo temporal dentro del espacio de trabajo de la generación en curso"""
+    directorio = getattr(_contexto_espacio_trabajo, 'directorio', None)
+    if directorio is None:
+        raise RuntimeError('ruta_temporal_pdf requiere un espacio_trabajo_pdf activo')
+    return os.path.join(directorio, secure_filename(nombre) or 'temporal')
+
 # Ruta para servir archivos estáticos desde la carpeta files
 @app.route('/files/<filename>')
 def serve_file(filename):
@@ -165,6 +447,7 @@ class Formulario(db.Model):
     activo = db.Column(db.Boolean, default=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     creado_por = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Aumenta con cada cambio en la estructura del formulario
     
     # Relaciones
     creador = db.relationship('User', backref='formularios_creados')
@@ -193,13 +476,28 @@ class RespuestaFormulario(db.Model):
     fecha_diligenciamiento = db.Column(db.DateTime, default=datetime.utcnow)
     estado = db.Column(db.String(20), default='Completado')  # Completado, Borrador
     archivo_pdf = db.Column(db.String(500))  # Ruta del PDF generado
+    estado_pdf = db.Column(db.String(20))  # Generando, Listo, Error (vacío en respuestas anteriores)
+    fecha_estado_pdf = db.Column(db.DateTime)  # Cuándo se pidió el PDF (detecta generaciones abandonadas)
+    id_cliente = db.Column(db.String(64), unique=True, index=True)  # Identificador generado en el dispositivo (sincronización sin conexión)
     
     # Relaciones
     usuario = db.relationship('User', backref='formularios_diligenciados')
     respuestas_campos = db.relationship('RespuestaCampo', backref='respuesta_formulario', cascade='all, delete-orphan')
 
+# Minutos sin avances tras los que una regeneración "En curso" se considera abandonada
+REGENERACION_PDF_INACTIVIDAD_MIN = 10
+
+# Caracteres de valor_texto que cubre el índice de búsqueda (MySQL solo indexa un prefijo de las columnas TEXT)
+PREFIJO_INDICE_VALOR_TEXTO = 100
+
 class RespuestaCampo(db.Model):
     """Modelo para las respuestas individuales de cada campo"""
+    __table_args__ = (
+        # Búsqueda de respuestas por valor de un campo (buscar_respuestas_formulario)
+        db.Index('ix_respuesta_campo_campo_texto', 'campo_id', 'valor_texto',
+                 mysql_length={'valor_texto': PREFIJO_INDICE_VALOR_TEXTO}),
+        db.Index('ix_respuesta_campo_campo_fecha', 'campo_id', 'valor_fecha'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     respuesta_formulario_id = db.Column(db.Integer, db.ForeignKey('respuesta_formulario.id'), nullable=False)
     campo_id = db.Column(db.Integer, db.ForeignKey('campo_formulario.id'), nullable=False)
@@ -214,6 +512,46 @@ class RespuestaCampo(db.Model):
     empresa_firmante = db.Column(db.String(100))
     cargo_firmante = db.Column(db.String(100))
 
+class SubidaArchivo(db.Model):
+    """Sesión de subida reanudable por fragmentos de una foto o adjunto"""
+    id = db.Column(db.String(32), primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    nombre_archivo = db.Column(db.String(255), nullable=False)
+    tamano = db.Column(db.BigInteger, nullable=False)
+    recibido = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes contiguos confirmados desde el inicio
+    completa = db.Column(db.Boolean, default=False)  # Tamaño y suma de verificación comprobados
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class RegeneracionPDF(db.Model):
+    """Trabajo de regeneración masiva de los PDF de formularios; se reanuda desde ultimo_id"""
+    id = db.Column(db.Integer, primary_key=True)
+    formulario_id = db.Column(db.Integer, db.ForeignKey('formulario.id'))  # Vacío = todos los formularios
+    fecha_desde = db.Column(db.Date)
+    fecha_hasta = db.Column(db.Date)
+    estado = db.Column(db.String(20), default='Pendiente')  # Pendiente, En curso, Completada, Cancelada, Interrumpida
+    total = db.Column(db.Integer, default=0)
+    procesadas = db.Column(db.Integer, default=0)
+    errores = db.Column(db.Integer, default=0)
+    ultimo_id = db.Column(db.Integer, default=0)  # Última respuesta procesada (en orden de ID)
+    creado_por = db.Column(db.Integer, db.ForeignKey('user.id'))  # Vacío si se lanzó desde la línea de comandos
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relaciones
+    formulario = db.relationship('Formulario')
+    
+    @property
+    def porcentaje(self):
+        return int(self.procesadas * 100 / self.total) if self.total else 0
+    
+    @property
+    def reanudable(self):
+        """Interrumpida, o en curso sin avances recientes (el proceso que la ejecutaba terminó)"""
+        if self.estado in ('Pendiente', 'Interrumpida'):
+            return True
+        return self.estado == 'En curso' and self.fecha_actualizacion < datetime.utcnow() - timedelta(minutes=REGENERACION_PDF_INACTIVIDAD_MIN)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -228,7 +566,68 @@ def obtener_incidencias_por_rol():
         # Técnicos solo ven las incidencias asignadas a ellos
         return Incidencia.query.filter_by(tecnico_asignado=current_user.id)
 
+# ==================== INSTANTÁNEAS PARA INFORMES ====================
+
+# Copias inmutables y serializables (pickle) de lo que leen los generadores de informes.
+# Conservan los nombres de atributo del modelo para que los generadores no cambien.
+ReferenciaInforme = namedtuple('ReferenciaInforme', ['id', 'nombre'])
+IncidenciaInforme = namedtuple('IncidenciaInforme', [
+    'id', 'indice', 'titulo', 'descripcion', 'estado', 'fecha_inicio', 'fecha_cambio_estado',
+    'adjuntos', 'titulos_imagenes', 'configuracion_imagenes',
+    'cliente', 'sede', 'sistema', 'tecnico', 'creador'
+])
+
+def _referencia_informe(objeto):
+    return ReferenciaInforme(objeto.id, objeto.nombre) if objeto is not None else None
+
+def cargar_instantaneas_incidencias(incidencias_ids):
+    """
+    Carga en una sola consulta (con sus relaciones) las incidencias de un informe
+    y devuelve la conexión al pool antes del renderizado, que es CPU intensivo.
+    Termina la transacción de la sesión sin cerrarla: current_user y los demás objetos
+    de la vista quedan expirados (no desconectados) y el renderizado usa solo las instantáneas.
+    """
+    from sqlalchemy.orm import joinedload
+    
+    ids = [int(incidencia_id) for incidencia_id in incidencias_ids]
+    if not ids:
+        return []
+    
+    consulta = db.select(Incidencia).options(
+        joinedload(Incidencia.cliente),
+        joinedload(Incidencia.sede),
+        joinedload(Incidencia.sistema),
+        joinedload(Incidencia.tecnico),
+        joinedload(Incidencia.creador)
+    ).where(Incidencia.id.in_(ids)).order_by(Incidencia.id)
+    
+    instantaneas = [
+        IncidenciaInforme(
+            id=incidencia.id,
+            indice=incidencia.indice,
+            titulo=incidencia.titulo,
+            descripcion=incidencia.descripcion,
+            estado=incidencia.estado,
+            fecha_inicio=incidencia.fecha_inicio,
+            fecha_cambio_estado=incidencia.fecha_cambio_estado,
+            adjuntos=incidencia.adjuntos,
+            titulos_imagenes=incidencia.titulos_imagenes,
+            configuracion_imagenes=incidencia.configuracion_imagenes,
+            cliente=_referencia_informe(incidencia.cliente),
+            sede=_referencia_informe(incidencia.sede),
+            sistema=_referencia_informe(incidencia.sistema),
+            tecnico=_referencia_informe(incidencia.tecnico),
+            creador=_referencia_informe(incidencia.creador)
+        )
+        for incidencia in db.session.scalars(consulta).unique()
+    ]
+    
+    # Fin de la transacción (solo lectura): la conexión vuelve al pool antes de renderizar
+    db.session.commit()
+    return instantaneas
+
 # Función helper para obtener el logo con proporciones correctas
+@medir_etapa('logo')
 def obtener_logo_pdf(max_width=100, max_height=50):
     """Retorna el logo para PDF manteniendo la relación 1:1"""
     logo_path = 'files/logo.jpg'
@@ -355,7 +754,7 @@ def nueva_incidencia():
             # Si no se selecciona técnico, queda como None (sin asignar)
         
         # Manejar archivos adjuntos y configuración de imágenes
-        archivos = request.files.getlist('adjuntos')
+        archivos = archivos_recibidos(request.form, request.files, 'adjuntos')
         titulos_imagenes = request.form.getlist('titulos_imagenes')
         
         nombres_archivos = []
@@ -458,7 +857,7 @@ def editar_incidencia(id):
                 incidencia.tecnico_asignado = None
         
         # Manejar archivos adjuntos y títulos
-        archivos = request.files.getlist('adjuntos')
+        archivos = archivos_recibidos(request.form, request.files, 'adjuntos')
         titulos_imagenes = request.form.getlist('titulos_imagenes')
         
         # Si se subieron nuevos archivos, reemplazar los existentes
@@ -492,6 +891,168 @@ def editar_incidencia(id):
     
     return render_template('editar_incidencia.html', incidencia=incidencia, tecnicos=tecnicos, clientes=clientes, sedes=sedes, sistemas=sistemas)
 
+# ==================== SUBIDAS POR FRAGMENTOS ====================
+
+# Las fotos y adjuntos pueden subirse antes del formulario en fragmentos (PUT con offset) que se
+# escriben directamente en disco; el formulario solo envía los identificadores (subida_<campo>).
+SUBIDAS_SUBCARPETA = 'subidas'
+BLOQUE_SUBIDA = 64 * 1024
+
+def ruta_subida(subida_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], SUBIDAS_SUBCARPETA, f'{subida_id}.parte')
+
+def _purgar_subidas_vencidas():
+    """Elimina las sesiones abandonadas (sin actividad en SUBIDA_EXPIRACION_HORAS) y sus archivos"""
+    limite = datetime.utcnow() - timedelta(hours=app.config['SUBIDA_EXPIRACION_HORAS'])
+    for subida in SubidaArchivo.query.filter(SubidaArchivo.fecha_actualizacion < limite).all():
+        if os.path.exists(ruta_subida(subida.id)):
+            os.remove(ruta_subida(subida.id))
+        db.session.delete(subida)
+
+def _obtener_subida(subida_id):
+    subida = db.session.get(SubidaArchivo, subida_id)
+    if subida is None or subida.usuario_id != current_user.id:
+        abort(404)
+    return subida
+
+def _estado_subida(subida, **extra):
+    datos = {'success': True, 'id': subida.id, 'recibido': subida.recibido, 'tamano': subida.tamano,
+             'completa': bool(subida.completa), 'tamano_fragmento': app.config['SUBIDA_TAMANO_FRAGMENTO']}
+    datos.update(extra)
+    return datos
+
+@app.route('/api/subidas', methods=['POST'])
+@login_required
+def crear_subida():
+    """Abre una sesión de subida: {"nombre": "foto.jpg", "tamano": 1234567}"""
+    data = request.get_json(silent=True) or {}
+    nombre = (data.get('nombre') or '').strip()
+    tamano = data.get('tamano')
+    # bool es subclase de int: "tamano": true no es un tamaño
+    if not nombre or not isinstance(tamano, int) or isinstance(tamano, bool) or tamano <= 0:
+        return jsonify({'success': False, 'message': 'Nombre y tamaño del archivo son obligatorios'}), 400
+    if tamano > app.config['SUBIDA_TAMANO_MAX']:
+        return jsonify({'success': False, 'message': 'El archivo supera el tamaño máximo permitido'}), 413
+    
+    _purgar_subidas_vencidas()
+    subida = SubidaArchivo(id=uuid.uuid4().hex, usuario_id=current_user.id, nombre_archivo=nombre[-255:], tamano=tamano)
+    os.makedirs(os.path.dirname(ruta_subida(subida.id)), exist_ok=True)
+    open(ruta_subida(subida.id), 'wb').close()
+    db.session.add(subida)
+    db.session.commit()
+    return jsonify(_estado_subida(subida)), 201
+
+@app.route('/api/subidas/<subida_id>', methods=['GET'])
+@login_required
+def estado_subida(subida_id):
+    """Bytes confirmados de la sesión, para retomar la subida tras un corte"""
+    return jsonify(_estado_subida(_obtener_subida(subida_id)))
+
+@app.route('/api/subidas/<subida_id>', methods=['PUT'])
+@login_required
+def recibir_fragmento_subida(subida_id):
+    """
+    Escribe en disco el fragmento del cuerpo a partir de ?offset=N, leyéndolo por bloques.
+    El offset puede repetir bytes ya confirmados (reenvío tras un corte) pero no dejar huecos.
+    """
+    subida = _obtener_subida(subida_id)
+    offset = request.args.get('offset', type=int)
+    longitud = request.content_length
+    if subida.completa or offset is None or offset < 0 or offset > subida.recibido:
+        return jsonify(_estado_subida(subida, success=False, message='Offset no válido, continúe desde recibido')), 409
+    if not longitud or offset + longitud > subida.tamano:
+        return jsonify(_estado_subida(subida, success=False, message='El fragmento excede el tamaño declarado')), 400
+    
+    escritos = 0
+    try:
+        with open(ruta_subida(subida.id), 'r+b') as f:
+            f.seek(offset)
+            while escritos < longitud:
+                bloque = request.stream.read(min(BLOQUE_SUBIDA, longitud - escritos))
+                if not bloque:
+                    break
+                f.write(bloque)
+                escritos += len(bloque)
+    except (OSError, ClientDisconnected) as e:
+        print(f"Subida {subida.id}: fragmento interrumpido en {offset + escritos} ({e})")
+    
+    # Lo escrito es contiguo a lo ya confirmado, así que cuenta aunque el fragmento llegara incompleto
+    subida.recibido = max(subida.recibido, offset + escritos)
+    subida.fecha_actualizacion = datetime.utcnow()
+    db.session.commit()
+    return jsonify(_estado_subida(subida, success=escritos == longitud))
+
+@app.route('/api/subidas/<subida_id>/finalizar', methods=['POST'])
+@login_required
+def finalizar_subida(subida_id):
+    """Comprueba que llegó todo el archivo y, si el cliente la envía, su suma SHA-256: {"sha256": "..."}"""
+    subida = _obtener_subida(subida_id)
+    if subida.completa:
+        return jsonify(_estado_subida(subida))
+    if subida.recibido != subida.tamano:
+        return jsonify(_estado_subida(subida, success=False, message='Faltan fragmentos por subir')), 409
+    
+    sha256 = ((request.get_json(silent=True) or {}).get('sha256') or '').lower()
+    if sha256:
+        resumen = hashlib.sha256()
+        with open(ruta_subida(subida.id), 'rb') as f:
+            for bloque in iter(lambda: f.read(BLOQUE_SUBIDA), b''):
+                resumen.update(bloque)
+        if resumen.hexdigest() != sha256:
+            # Contenido corrupto: se reinicia la sesión para volver a subirlo completo
+            subida.recibido = 0
+            db.session.commit()
+            return jsonify(_estado_subida(subida, success=False, message='La suma de verificación no coincide, se reinicia la subida')), 422
+    
+    subida.completa = True
+    subida.fecha_actualizacion = datetime.utcnow()
+    db.session.commit()
+    return jsonify(_estado_subida(subida))
+
+class ArchivoSubido:
+    """Subida completa con la interfaz de FileStorage que usan los formularios (filename y save)"""
+    
+    def __init__(self, subida):
+        self.subida = subida
+        self.filename = subida.nombre_archivo
+    
+    def save(self, destino):
+        # Enlace (o copia) en lugar de mover: si la transacción se revierte, la sesión de subida sigue
+        # completa y el archivo .parte se puede volver a usar. Se elimina solo cuando se confirma
+        try:
+            os.link(ruta_subida(self.subida.id), destino)
+        except OSError:
+            shutil.copyfile(ruta_subida(self.subida.id), destino)
+        db.session.delete(self.subida)
+        db.session.info.setdefault('subidas_consumidas', []).append(self.subida)
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _eliminar_partes_consumidas(session, transaccion):
+    """Al terminar la transacción principal, borra los .parte de las subidas cuyo registro se eliminó de verdad"""
+    if transaccion.parent is not None:
+        return
+    for subida in session.info.pop('subidas_consumidas', []):
+        # Si la eliminación se deshizo (rollback o punto de guardado revertido) el registro sigue vigente
+        if inspect(subida).was_deleted and os.path.exists(ruta_subida(subida.id)):
+            os.remove(ruta_subida(subida.id))
+
+def archivos_recibidos(form, files, nombre):
+    """Archivos de un campo: los enviados en el propio formulario más las subidas completas referenciadas en subida_<nombre>"""
+    archivos = list(files.getlist(nombre))
+    ids = list(dict.fromkeys(form.getlist(f'subida_{nombre}')))
+    if ids:
+        subidas = {subida.id: subida for subida in SubidaArchivo.query.filter(
+            SubidaArchivo.id.in_(ids),
+            SubidaArchivo.usuario_id == current_user.id,
+            SubidaArchivo.completa.is_(True)
+        )}
+        for subida_id in ids:
+            if subida_id in subidas:
+                archivos.append(ArchivoSubido(subidas[subida_id]))
+            else:
+                print(f"Subida {subida_id} no encontrada o incompleta, se omite")
+    return archivos
+
 @app.route('/usuarios')
 @login_required
 def usuarios():
@@ -805,7 +1366,8 @@ def informes():
                          clientes=clientes,
                          sedes=sedes,
                          sistemas=sistemas,
-                         tecnicos=tecnicos)
+                         tecnicos=tecnicos,
+                         informes_pregenerados=listar_informes_cache())
 
 @app.route('/informes/estructurado', methods=['GET', 'POST'])
 @login_required
@@ -819,28 +1381,59 @@ def informe_estructurado():
         cliente_id = request.form['cliente_id']
         incidencias_ids = request.form.getlist('incidencias')
         
-        datos_informe = {
-            'cliente': request.form['cliente'],
-            'atencion': request.form['atencion'],
-            'cargo': request.form['cargo'],
-            'alcance': request.form['alcance'],
-            'fecha': request.form['fecha'],
-            'introduccion': request.form['introduccion'],
-            'conclusiones': request.form.get('conclusiones', ''),
-            'version': request.form.get('version', '1')
-        }
+        datos_informe = obtener_datos_informe_estructurado(request.form)
         
         if not incidencias_ids:
             flash('Debe seleccionar al menos una incidencia', 'error')
             return redirect(url_for('informe_estructurado'))
         
-        incidencias = Incidencia.query.filter(Incidencia.id.in_(incidencias_ids)).all()
+        incidencias = cargar_instantaneas_incidencias(incidencias_ids)
         return generar_pdf_informe_html_format(incidencias, datos_informe)
     
     # Obtener clientes para el formulario
     clientes = Cliente.query.filter_by(activo=True).all()
     return render_template('informe_estructurado.html', clientes=clientes)
 
+@app.route('/informes/estructurado/vista-previa', methods=['POST'])
+@login_required
+def vista_previa_informe_estructurado():
+    """
+    Vista previa rápida del informe estructurado: mismo diseño con marcadores en lugar
+    de imágenes. Con respuesta=json solo retorna las páginas y el peso estimados.
+    """
+    if current_user.rol.nombre not in ['Administrador', 'Coordinador']:
+        return jsonify({'error': 'No tienes permisos para acceder a esta sección'}), 403
+    
+    incidencias_ids = request.form.getlist('incidencias')
+    if not incidencias_ids:
+        return jsonify({'error': 'Debe seleccionar al menos una incidencia'}), 400
+    
+    modo_borrador = request.form.get('modo_borrador', 'miniaturas')
+    if modo_borrador not in MODOS_BORRADOR:
+        modo_borrador = 'miniaturas'
+    
+    datos_informe = obtener_datos_informe_estructurado(request.form)
+    incidencias = cargar_instantaneas_incidencias(incidencias_ids)
+    
+    estadisticas = {}
+    pdf_bytes = construir_pdf_informe_html_format(incidencias, datos_informe,
+                                                  modo_borrador=modo_borrador,
+                                                  estadisticas=estadisticas)
+    
+    if request.form.get('respuesta') == 'json':
+        return jsonify({
+            'paginas_estimadas': estadisticas['paginas'],
+            'paginas_exactas': modo_borrador == 'miniaturas',
+            'figuras': estadisticas['figuras'],
+            'tamano_estimado': estadisticas['bytes_estimados']
+        })
+    
+    respuesta = Response(pdf_bytes, mimetype='application/pdf')
+    respuesta.headers['Content-Disposition'] = 'inline; filename=vista_previa_informe.pdf'
+    respuesta.headers['X-Paginas-Estimadas'] = str(estadisticas['paginas'])
+    respuesta.headers['X-Tamano-Estimado'] = str(estadisticas['bytes_estimados'])
+    return respuesta
+
 @app.route('/informes/descargar', methods=['POST'])
 @login_required
 def descargar_informe():
@@ -859,7 +1452,7 @@ def descargar_informe():
     
     # Validar que las incidencias seleccionadas estén dentro del rango permitido para el usuario
     incidencias_permitidas_query = obtener_incidencias_por_rol()
-    incidencias_permitidas_ids = [inc.id for inc in incidencias_permitidas_query.all()]
+    incidencias_permitidas_ids = {incidencia_id for (incidencia_id,) in incidencias_permitidas_query.with_entities(Incidencia.id)}
     
     # Filtrar solo las incidencias que el usuario puede ver
     incidencias_ids_validas = [id for id in incidencias_ids if int(id) in incidencias_permitidas_ids]
@@ -868,7 +1461,7 @@ def descargar_informe():
         flash('No tiene permisos para generar informes con las incidencias seleccionadas', 'error')
         return redirect(url_for('informes'))
     
-    incidencias = Incidencia.query.filter(Incidencia.id.in_(incidencias_ids_validas)).all()
+    incidencias = cargar_instantaneas_incidencias(incidencias_ids_validas)
     
     if formato == 'csv':
         return generar_csv(incidencias)
@@ -884,6 +1477,13 @@ def descargar_informe():
             'conclusiones': request.form.get('conclusiones', 'Se han completado exitosamente todas las actividades programadas.'),
             'version': '1'
         }
+        
+        # Selecciones muy grandes: dividir en volúmenes renderizados en paralelo
+        division = request.form.get('division_volumenes', '')
+        if division in ('incidencias', 'paginas'):
+            limite = request.form.get('limite_volumen', type=int)
+            return generar_informe_por_volumenes(incidencias, datos_informe, division, limite)
+        
         return generar_pdf_informe_html_format(incidencias, datos_informe)
     
     return redirect(url_for('informes'))
@@ -994,6 +1594,15 @@ def api_incidencias_cliente(cliente_id):
     return jsonify(incidencias_data)
 
 def generar_csv(incidencias):
+    return send_file(
+        io.BytesIO(construir_csv(incidencias)),
+        mimetype='text/csv; charset=utf-8',
+        as_attachment=True,
+        download_name=f'informe_incidencias_{datetime.now().strftime("%Y%m%d_%H%M")}.csv'
+    )
+
+def construir_csv(incidencias):
+    """Construye el CSV de incidencias y retorna los bytes"""
     output = io.StringIO()
     writer = csv.writer(output)
     
@@ -1023,16 +1632,20 @@ def generar_csv(incidencias):
     csv_content = output.getvalue()
     
     # Codificar con UTF-8 BOM para compatibilidad con Excel
-    csv_bytes = csv_content.encode('utf-8-sig')
-    
+    return csv_content.encode('utf-8-sig')
+
+def generar_pdf_profesional(incidencias, agrupacion='estado'):
     return send_file(
-        io.BytesIO(csv_bytes),
-        mimetype='text/csv; charset=utf-8',
+        io.BytesIO(construir_pdf_profesional(incidencias, agrupacion)),
+        mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'informe_incidencias_{datetime.now().strftime("%Y%m%d_%H%M")}.csv'
+        download_name=f'informe_profesional_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
     )
 
-def generar_pdf_profesional(incidencias, agrupacion='estado'):
+@instrumentar_pdf('profesional')
+@espacio_trabajo_pdf()
+def construir_pdf_profesional(incidencias, agrupacion='estado'):
+    """Construye el PDF profesional de incidencias y retorna los bytes"""
     buffer = io.BytesIO()
     
     # Configuración de página A4
@@ -1041,7 +1654,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
                           leftMargin=50, rightMargin=50,
                           topMargin=50, bottomMargin=50)
     
-    styles = getSampleStyleSheet()
+    styles = estilos_pdf()
     story = []
     
     # Crear estilos personalizados más elegantes
@@ -1052,7 +1665,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         spaceAfter=20,
         alignment=1,  # Centrado
         textColor=colors.HexColor('#2c3e50'),
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     empresa_style = ParagraphStyle(
@@ -1061,7 +1674,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         fontSize=12,
         alignment=1,  # Centrado
         textColor=colors.HexColor('#7f8c8d'),
-        fontName='Helvetica'
+        fontName=FUENTES_PDF['normal']
     )
     
     info_style = ParagraphStyle(
@@ -1070,7 +1683,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         fontSize=10,
         alignment=2,  # Derecha
         textColor=colors.HexColor('#34495e'),
-        fontName='Helvetica'
+        fontName=FUENTES_PDF['normal']
     )
     
     section_style = ParagraphStyle(
@@ -1080,7 +1693,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         spaceAfter=15,
         spaceBefore=25,
         textColor=colors.white,
-        fontName='Helvetica-Bold',
+        fontName=FUENTES_PDF['bold'],
         alignment=1,  # Centrado
         backColor=colors.HexColor('#3498db'),
         borderPadding=10,
@@ -1095,7 +1708,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         spaceAfter=10,
         spaceBefore=15,
         textColor=colors.HexColor('#2c3e50'),
-        fontName='Helvetica-Bold',
+        fontName=FUENTES_PDF['bold'],
         leftIndent=0,
         backColor=colors.HexColor('#ecf0f1'),
         borderPadding=8,
@@ -1109,7 +1722,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         fontSize=11,
         spaceAfter=10,
         spaceBefore=10,
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         leftIndent=0,
         textColor=colors.HexColor('#2c3e50')
     )
@@ -1119,7 +1732,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         parent=styles['Normal'],
         fontSize=9,
         textColor=colors.HexColor('#7f8c8d'),
-        fontName='Helvetica-Italic',
+        fontName=FUENTES_PDF['italic'],
         alignment=1  # Centrado
     )
     
@@ -1146,12 +1759,12 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
         ('ALIGN', (2, 0), (2, 0), 'RIGHT'),  # Info a la derecha
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('FONTSIZE', (1, 0), (1, 0), 20),
-        ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
         ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#2c3e50')),
         ('FONTSIZE', (2, 0), (2, 0), 10),
-        ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+        ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
         ('FONTSIZE', (1, 1), (1, 1), 12),
-        ('FONTNAME', (1, 1), (1, 1), 'Helvetica'),
+        ('FONTNAME', (1, 1), (1, 1), FUENTES_PDF['normal']),
         ('TEXTCOLOR', (1, 1), (1, 1), colors.HexColor('#7f8c8d')),
         ('LINEBELOW', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
         ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
@@ -1205,7 +1818,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
                     if os.path.exists(archivo_path):
                         try:
                             # Verificar si es una imagen
-                            with PILImage.open(archivo_path) as img:
+                            with medir_etapa('imagenes'), PILImage.open(archivo_path) as img:
                                 # Redimensionar imagen para mejor presentación
                                 max_width = 500
                                 max_height = 400
@@ -1219,7 +1832,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
                                     new_height = img.height
                                 
                                 # Guardar imagen temporalmente con máxima calidad y DPI original
-                                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{archivo}')
+                                temp_path = ruta_temporal_pdf(archivo)
                                 img.save(temp_path, quality=100, optimize=False)
                                 
                                 # Agregar espacio antes de la imagen
@@ -1232,6 +1845,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
                                 
                                 # Agregar imagen centrada con borde usando dimensiones más grandes para mejor resolución
                                 pdf_image = Image(temp_path, width=new_width*2, height=new_height*2)
+                                contar_imagen_pdf()
                                 
                                 # Crear tabla para centrar la imagen con borde
                                 image_table = Table([[pdf_image]], colWidths=[img.width])
@@ -1245,8 +1859,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
                                 story.append(image_table)
                                 contador_imagen += 1
                                 
-                                # Eliminar archivo temporal
-                                os.remove(temp_path)
+                                # El archivo temporal se elimina con el espacio de trabajo al terminar el PDF
                                 
                         except Exception as e:
                             print(f"Error procesando imagen {archivo}: {e}")
@@ -1259,7 +1872,7 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
     # Agregar pie de página profesional
     footer_text = f"""
     <para align=center>
-    <font name="Helvetica" size="8" color="#7f8c8d">
+    <font size="8" color="#7f8c8d">
     Informe generado automáticamente por el Sistema ERP BACS<br/>
     Building Automation and Control System - Versión {version}<br/>
     Fecha de generación: {fecha_actual}
@@ -1270,16 +1883,15 @@ def generar_pdf_profesional(incidencias, agrupacion='estado'):
     story.append(footer)
     
     # Construir el PDF
-    doc.build(story)
-    buffer.seek(0)
+    with medir_etapa('maquetacion'):
+        doc.build(story)
+    pdf_bytes = buffer.getvalue()
+    registrar_bytes_pdf(len(pdf_bytes))
     
-    return send_file(
-        buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'informe_profesional_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
-    )
+    return pdf_bytes
 
+@instrumentar_pdf('multipagina_profesional')
+@espacio_trabajo_pdf()
 def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
     """
     Genera un PDF profesional con formato de páginas múltiples,
@@ -1293,7 +1905,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                           leftMargin=40, rightMargin=40,
                           topMargin=40, bottomMargin=40)
     
-    styles = getSampleStyleSheet()
+    styles = estilos_pdf()
     story = []
     
     # Crear estilos personalizados para formato multipágina
@@ -1304,7 +1916,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         spaceAfter=30,
         alignment=1,  # Centrado
         textColor=colors.HexColor('#1a1a1a'),
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     empresa_style = ParagraphStyle(
@@ -1313,7 +1925,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         fontSize=14,
         alignment=1,  # Centrado
         textColor=colors.HexColor('#666666'),
-        fontName='Helvetica'
+        fontName=FUENTES_PDF['normal']
     )
     
     info_style = ParagraphStyle(
@@ -1322,7 +1934,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         fontSize=11,
         alignment=2,  # Derecha
         textColor=colors.HexColor('#333333'),
-        fontName='Helvetica'
+        fontName=FUENTES_PDF['normal']
     )
     
     section_style = ParagraphStyle(
@@ -1332,7 +1944,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         spaceAfter=20,
         spaceBefore=30,
         textColor=colors.white,
-        fontName='Helvetica-Bold',
+        fontName=FUENTES_PDF['bold'],
         alignment=1,  # Centrado
         backColor=colors.HexColor('#2c3e50'),
         borderPadding=15,
@@ -1346,7 +1958,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         fontSize=12,
         spaceAfter=15,
         spaceBefore=15,
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         leftIndent=0,
         textColor=colors.HexColor('#2c3e50'),
         alignment=0  # Justificado
@@ -1357,7 +1969,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         parent=styles['Normal'],
         fontSize=10,
         textColor=colors.HexColor('#666666'),
-        fontName='Helvetica-Italic',
+        fontName=FUENTES_PDF['italic'],
         alignment=1  # Centrado
     )
     
@@ -1383,12 +1995,12 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('FONTSIZE', (1, 0), (1, 0), 22),
-        ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
         ('TEXTCOLOR', (1, 0), (1, 0), colors.HexColor('#1a1a1a')),
         ('FONTSIZE', (2, 0), (2, 0), 11),
-        ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+        ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
         ('FONTSIZE', (1, 1), (1, 1), 14),
-        ('FONTNAME', (1, 1), (1, 1), 'Helvetica'),
+        ('FONTNAME', (1, 1), (1, 1), FUENTES_PDF['normal']),
         ('TEXTCOLOR', (1, 1), (1, 1), colors.HexColor('#666666')),
         ('LINEBELOW', (0, 0), (-1, -1), 2, colors.HexColor('#bdc3c7')),
         ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
@@ -1438,7 +2050,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                     if os.path.exists(archivo_path):
                         try:
                             # Verificar si es una imagen
-                            with PILImage.open(archivo_path) as img:
+                            with medir_etapa('imagenes'), PILImage.open(archivo_path) as img:
                                 # Redimensionar imagen para ocupar la mayor parte de la página
                                 max_width = 600
                                 max_height = 700
@@ -1450,7 +2062,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                                     img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
                                 
                                 # Guardar imagen temporalmente con máxima calidad y DPI muy alto
-                                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{archivo}')
+                                temp_path = ruta_temporal_pdf(archivo)
                                 img.save(temp_path, quality=100, optimize=False, dpi=(1200, 1200))
                                 
                                 # Salto de página antes de cada imagen
@@ -1463,6 +2075,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                                 
                                 # Agregar imagen centrada ocupando la mayor parte de la página
                                 pdf_image = Image(temp_path, width=img.width, height=img.height)
+                                contar_imagen_pdf()
                                 
                                 # Crear tabla para centrar la imagen con marco elegante
                                 image_table = Table([[pdf_image]], colWidths=[img.width])
@@ -1480,7 +2093,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                                 # Información adicional de la imagen
                                 img_info_text = f"""
                                 <para align=center>
-                                <font name="Helvetica" size="10" color="#666666">
+                                <font size="10" color="#666666">
                                 <b>Incidencia:</b> {incidencia.titulo}<br/>
                                 <b>Cliente:</b> {incidencia.cliente.nombre if incidencia.cliente else 'N/A'}<br/>
                                 <b>Fecha:</b> {incidencia.fecha_inicio.strftime('%d/%m/%Y')}
@@ -1492,8 +2105,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
                                 
                                 contador_imagen += 1
                                 
-                                # Eliminar archivo temporal
-                                os.remove(temp_path)
+                                # El archivo temporal se elimina con el espacio de trabajo al terminar el PDF
                                 
                         except Exception as e:
                             print(f"Error procesando imagen {archivo}: {e}")
@@ -1506,7 +2118,7 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
     # Agregar pie de página profesional
     footer_text = f"""
     <para align=center>
-    <font name="Helvetica" size="9" color="#666666">
+    <font size="9" color="#666666">
     Informe generado automáticamente por el Sistema ERP BACS<br/>
     Building Automation and Control System - Versión {version}<br/>
     Fecha de generación: {fecha_actual} | Total de imágenes: {contador_imagen - 1}
@@ -1517,8 +2129,10 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
     story.append(footer)
     
     # Construir el PDF
-    doc.build(story)
+    with medir_etapa('maquetacion'):
+        doc.build(story)
     buffer.seek(0)
+    registrar_bytes_pdf(buffer.getbuffer().nbytes)
     
     return send_file(
         buffer,
@@ -1527,6 +2141,8 @@ def generar_pdf_multipagina_profesional(incidencias, agrupacion='estado'):
         download_name=f'informe_multipagina_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
     )
 
+@instrumentar_pdf('informe_estructurado')
+@espacio_trabajo_pdf()
 def generar_pdf_informe_estructurado(incidencias, datos_informe):
     """
     Genera un PDF con formato estructurado similar al HTML proporcionado.
@@ -1540,7 +2156,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
                           leftMargin=40, rightMargin=40,
                           topMargin=40, bottomMargin=40)
     
-    styles = getSampleStyleSheet()
+    styles = estilos_pdf()
     story = []
     
     # Crear estilos personalizados basados en el HTML proporcionado
@@ -1551,7 +2167,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         spaceAfter=15,
         alignment=1,  # Centrado
         textColor=colors.black,
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     info_style = ParagraphStyle(
@@ -1559,7 +2175,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         parent=styles['Normal'],
         fontSize=12,
         spaceAfter=8,
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         lineHeight=1.6
     )
     
@@ -1570,7 +2186,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         spaceAfter=12,
         spaceBefore=20,
         textColor=colors.black,
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     caption_style = ParagraphStyle(
@@ -1578,7 +2194,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         parent=styles['Normal'],
         fontSize=10,
         textColor=colors.HexColor('#666666'),
-        fontName='Helvetica-Italic',
+        fontName=FUENTES_PDF['italic'],
         alignment=1  # Centrado
     )
     
@@ -1588,7 +2204,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         fontSize=12,
         textColor=colors.HexColor('#666666'),
         alignment=1,  # Centrado
-        fontName='Helvetica'
+        fontName=FUENTES_PDF['normal']
     )
     
     # Crear encabezado con logo (similar al HTML)
@@ -1604,9 +2220,9 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('FONTSIZE', (1, 0), (1, 0), 18),
-        ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
         ('FONTSIZE', (2, 0), (2, 0), 10),
-        ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+        ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
         ('LINEBELOW', (0, 0), (-1, -1), 2, colors.black),
     ]))
     
@@ -1658,7 +2274,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
                 if os.path.exists(archivo_path):
                     try:
                         # Verificar si es una imagen
-                        with PILImage.open(archivo_path) as img:
+                        with medir_etapa('imagenes'), PILImage.open(archivo_path) as img:
                             # Redimensionar imagen para el formato HTML (max-width: 600px)
                             max_width = 600
                             max_height = 400
@@ -1670,7 +2286,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
                                 img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
                             
                             # Guardar imagen temporalmente con máxima calidad y DPI muy alto
-                            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{archivo}')
+                            temp_path = ruta_temporal_pdf(archivo)
                             img.save(temp_path, quality=100, optimize=False, dpi=(1200, 1200))
                             
                             # Agregar espacio antes de la imagen
@@ -1684,6 +2300,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
                             
                             # Agregar imagen centrada con borde (similar al HTML)
                             pdf_image = Image(temp_path, width=img.width, height=img.height)
+                            contar_imagen_pdf()
                             
                             # Crear tabla para centrar la imagen con borde
                             image_table = Table([[pdf_image]], colWidths=[img.width])
@@ -1697,8 +2314,7 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
                             story.append(image_table)
                             contador_imagen += 1
                             
-                            # Eliminar archivo temporal
-                            os.remove(temp_path)
+                            # El archivo temporal se elimina con el espacio de trabajo al terminar el PDF
                             
                     except Exception as e:
                         print(f"Error procesando imagen {archivo}: {e}")
@@ -1721,8 +2337,10 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
     story.append(footer)
     
     # Construir el PDF
-    doc.build(story)
+    with medir_etapa('maquetacion'):
+        doc.build(story)
     buffer.seek(0)
+    registrar_bytes_pdf(buffer.getbuffer().nbytes)
     
     return send_file(
         buffer,
@@ -1731,10 +2349,28 @@ def generar_pdf_informe_estructurado(incidencias, datos_informe):
         download_name=f'informe_estructurado_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
     )
 
+# Tamaño máximo del collage (6cm = 170 puntos en ReportLab)
+COLLAGE_MAX_SIZE = 170
+
+def disposicion_collage(num_imagenes):
+    """Número de filas y columnas del collage (2x2, 3x3 o 4x4)"""
+    if num_imagenes <= 4:
+        return 2
+    elif num_imagenes <= 9:
+        return 3
+    return 4
+
+def dimensiones_collage(num_imagenes):
+    """Lado en píxeles del collage cuadrado, sin necesidad de abrir las imágenes"""
+    cols = disposicion_collage(num_imagenes)
+    return (COLLAGE_MAX_SIZE // cols) * cols
+
+@medir_etapa('collages')
 def crear_collage_imagenes(imagenes_paths, titulo_collage):
     """
     Crear un collage de imágenes manteniendo la relación de aspecto
     El collage resultante será cuadrado (1:1) combinando todas las imágenes
+    Retorna un buffer PNG en memoria o None si no hay imágenes
     """
     try:
         from PIL import Image as PILImage
@@ -1750,24 +2386,10 @@ def crear_collage_imagenes(imagenes_paths, titulo_collage):
             return None
         
         # Calcular el tamaño del collage (cuadrado)
-        num_imagenes = len(imagenes)
-        
-        # Determinar la disposición (2x2, 3x3, etc.)
-        if num_imagenes <= 4:
-            cols = 2
-            rows = 2
-        elif num_imagenes <= 9:
-            cols = 3
-            rows = 3
-        else:
-            cols = 4
-            rows = 4
-        
-        # Tamaño máximo del collage (6cm = 170 puntos en ReportLab)
-        max_size = 170
+        cols = rows = disposicion_collage(len(imagenes))
         
         # Calcular tamaño de cada celda
-        cell_size = max_size // max(cols, rows)
+        cell_size = COLLAGE_MAX_SIZE // max(cols, rows)
         
         # Crear imagen del collage
         collage_width = cell_size * cols
@@ -1789,16 +2411,26 @@ def crear_collage_imagenes(imagenes_paths, titulo_collage):
             
             collage.paste(img_resized, (x_offset, y_offset))
         
-        # Guardar collage temporalmente
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'collage_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png')
-        collage.save(temp_path)
+        for img in imagenes:
+            img.close()
         
-        return temp_path
+        # Retornar el collage en memoria (evita colisiones de nombres entre informes concurrentes)
+        return imagen_a_buffer(collage, 'PNG')
         
     except Exception as e:
         print(f"Error creando collage: {e}")
         return None
 
+def imagen_a_buffer(img, formato=None):
+    """Guardar una imagen PIL en un buffer en memoria listo para ReportLab"""
+    formato = formato if formato in ('JPEG', 'PNG') else 'PNG'
+    if formato == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img_buffer = io.BytesIO()
+    img.save(img_buffer, format=formato)
+    img_buffer.seek(0)
+    return img_buffer
+
 def calcular_tamaño_imagen(img_width, img_height, max_size_cm=6):
     """
     Calcular el tamaño de imagen manteniendo la relación de aspecto
@@ -1848,6 +2480,35 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
     Formato: Encabezado con logo, información del cliente, introducción, 
     actividades realizadas con imágenes, y conclusiones.
     """
+    pdf_bytes = construir_pdf_informe_html_format(incidencias, datos_informe)
+    
+    return send_file(
+        io.BytesIO(pdf_bytes),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'informe_html_format_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
+    )
+
+@instrumentar_pdf('informe_html')
+def construir_pdf_informe_html_format(incidencias, datos_informe, figura_inicial=1, actividad_inicial=1,
+                                      volumen=None, total_volumenes=None, modo_borrador=None, estadisticas=None):
+    """
+    Construye el PDF del informe con formato HTML y retorna los bytes.
+    figura_inicial y actividad_inicial permiten continuar la numeración cuando
+    el informe se divide en volúmenes; la introducción solo se incluye en el
+    primer volumen y las conclusiones en el último.
+    modo_borrador ('miniaturas' o 'sin_imagenes') genera una vista previa rápida
+    sin decodificar imágenes; si se pasa el diccionario estadisticas se completa
+    con las páginas generadas y el peso estimado de las imágenes definitivas.
+    """
+    # Las vistas previas se registran aparte para no distorsionar las métricas del informe final
+    medicion = medicion_pdf_actual()
+    if modo_borrador and medicion is not None:
+        medicion.generador = 'informe_html_borrador'
+    
+    es_primer_volumen = volumen is None or volumen == 1
+    es_ultimo_volumen = volumen is None or volumen == total_volumenes
+    
     buffer = io.BytesIO()
     
     # Configuración de página A4 con márgenes similares al HTML (40px = ~1.4cm)
@@ -1856,7 +2517,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
                           leftMargin=40, rightMargin=40,
                           topMargin=40, bottomMargin=40)
     
-    styles = getSampleStyleSheet()
+    styles = estilos_pdf()
     story = []
     
     # Estilos personalizados que replican el CSS del HTML
@@ -1867,7 +2528,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         spaceAfter=10,
         alignment=1,  # Centrado
         textColor=colors.black,
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     info_style = ParagraphStyle(
@@ -1875,7 +2536,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         parent=styles['Normal'],
         fontSize=12,
         spaceAfter=5,
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         lineHeight=1.6
     )
     
@@ -1886,7 +2547,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         spaceAfter=12,
         spaceBefore=30,
         textColor=colors.black,
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     activity_title_style = ParagraphStyle(
@@ -1896,7 +2557,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         spaceAfter=8,
         spaceBefore=15,
         textColor=colors.black,
-        fontName='Helvetica-Bold'
+        fontName=FUENTES_PDF['bold']
     )
     
     caption_style = ParagraphStyle(
@@ -1904,7 +2565,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         parent=styles['Normal'],
         fontSize=10,
         textColor=colors.HexColor('#666666'),
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         alignment=1,  # Centrado
         spaceAfter=15
     )
@@ -1915,7 +2576,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         fontSize=12,
         textColor=colors.HexColor('#666666'),
         alignment=1,  # Centrado
-        fontName='Helvetica',
+        fontName=FUENTES_PDF['normal'],
         spaceBefore=50
     )
     
@@ -1924,7 +2585,10 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
     logo_cell = obtener_logo_pdf(max_width=80, max_height=40)
     
     # Estructura del encabezado: Logo | Título | Versión
-    header_data.append([logo_cell, 'INFORME DE ACTIVIDADES', f'Versión {datos_informe.get("version", "1")}'])
+    version_text = f'Versión {datos_informe.get("version", "1")}'
+    if volumen is not None:
+        version_text = Paragraph(f'{version_text}<br/>Volumen {volumen} de {total_volumenes}', styles['Normal'])
+    header_data.append([logo_cell, 'INFORME DE ACTIVIDADES', version_text])
     
     header_table = Table(header_data, colWidths=[100, 200, 100])
     header_table.setStyle(TableStyle([
@@ -1933,9 +2597,9 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         ('ALIGN', (2, 0), (2, 0), 'RIGHT'),    # Versión a la derecha
         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
         ('FONTSIZE', (1, 0), (1, 0), 18),       # font-size: 22px
-        ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
         ('FONTSIZE', (2, 0), (2, 0), 10),
-        ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+        ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
         ('LINEBELOW', (0, 0), (-1, -1), 2, colors.black),  # border-bottom: 2px solid #000
         ('PADDING', (0, 0), (-1, -1), 15),     # padding-bottom: 15px
     ]))
@@ -1957,7 +2621,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
     story.append(Spacer(1, 20))  # margin-bottom: 20px
     
     # === INTRODUCCIÓN === (replica la sección Introducción del HTML)
-    if datos_informe.get('introduccion'):
+    if datos_informe.get('introduccion') and es_primer_volumen:
         intro_title = Paragraph("Introducción", section_style)
         story.append(intro_title)
         
@@ -1969,10 +2633,11 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
     actividades_title = Paragraph("1. Actividades Realizadas", section_style)
     story.append(actividades_title)
     
-    contador_imagen = 1
+    contador_imagen = figura_inicial
+    bytes_imagenes = 0
     
     # Procesar cada incidencia como una actividad
-    for i, incidencia in enumerate(incidencias, 1):
+    for i, incidencia in enumerate(incidencias, actividad_inicial):
         # Título de la actividad con enumeración
         actividad_titulo = f"{i}. {incidencia.titulo}"
         actividad_title_paragraph = Paragraph(actividad_titulo, activity_title_style)
@@ -2009,20 +2674,29 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
                 
                 if os.path.exists(archivo_path):
                     try:
-                        with PILImage.open(archivo_path) as img:
+                        with medir_etapa('imagenes'), PILImage.open(archivo_path) as img:
                             # Calcular tamaño optimizado según relación de aspecto
                             new_width, new_height = calcular_tamaño_imagen(img.width, img.height)
+                            bytes_imagenes += estimar_bytes_imagen(new_width, new_height, img.format)
+                            
+                            if modo_borrador:
+                                # Vista previa: solo se leyó la cabecera de la imagen
+                                agregar_marcador_imagen(story, new_width, new_height, modo_borrador)
+                                caption_text = f"Imagen {contador_imagen}. {titulo}"
+                                story.append(Paragraph(caption_text, caption_style))
+                                contador_imagen += 1
+                                continue
                             
-                            # Guardar imagen temporalmente
-                            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{archivo}')
+                            # Redimensionar en memoria (sin archivos temporales compartidos en uploads)
                             img_resized = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-                            img_resized.save(temp_path)
+                            img_buffer = imagen_a_buffer(img_resized, img.format)
                             
                             # Agregar espacio antes de la imagen
                             story.append(Spacer(1, 15))
                             
                             # Agregar imagen centrada con borde
-                            pdf_image = Image(temp_path, width=new_width, height=new_height)
+                            pdf_image = Image(img_buffer, width=new_width, height=new_height)
+                            contar_imagen_pdf()
                             
                             # Crear tabla para centrar la imagen
                             image_table = Table([[pdf_image]], colWidths=[new_width])
@@ -2056,24 +2730,36 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
                     if os.path.exists(archivo_path):
                         imagenes_paths.append(archivo_path)
                 
+                if imagenes_paths and modo_borrador:
+                    # Vista previa: el tamaño del collage se conoce sin abrir las imágenes
+                    lado = dimensiones_collage(len(imagenes_paths))
+                    new_width, new_height = calcular_tamaño_imagen(lado, lado)
+                    bytes_imagenes += estimar_bytes_imagen(new_width, new_height, 'PNG')
+                    agregar_marcador_imagen(story, new_width, new_height, modo_borrador)
+                    caption_text = f"Imagen {contador_imagen}. {titulo_collage}"
+                    story.append(Paragraph(caption_text, caption_style))
+                    contador_imagen += 1
+                    continue
+                
                 if imagenes_paths:
-                    collage_path = crear_collage_imagenes(imagenes_paths, titulo_collage)
-                    if collage_path:
+                    collage_buffer = crear_collage_imagenes(imagenes_paths, titulo_collage)
+                    if collage_buffer:
                         try:
-                            with PILImage.open(collage_path) as img:
+                            with medir_etapa('imagenes'), PILImage.open(collage_buffer) as img:
                                 # Calcular tamaño optimizado
                                 new_width, new_height = calcular_tamaño_imagen(img.width, img.height)
                                 
-                                # Guardar imagen temporalmente
-                                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_collage_{contador_imagen}.png')
+                                # Redimensionar en memoria
+                                bytes_imagenes += estimar_bytes_imagen(new_width, new_height, 'PNG')
                                 img_resized = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-                                img_resized.save(temp_path)
+                                img_buffer = imagen_a_buffer(img_resized, 'PNG')
                                 
                                 # Agregar espacio antes de la imagen
                                 story.append(Spacer(1, 15))
                                 
                                 # Agregar imagen centrada con borde
-                                pdf_image = Image(temp_path, width=new_width, height=new_height)
+                                pdf_image = Image(img_buffer, width=new_width, height=new_height)
+                                contar_imagen_pdf()
                                 
                                 # Crear tabla para centrar la imagen
                                 image_table = Table([[pdf_image]], colWidths=[new_width])
@@ -2099,7 +2785,7 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         story.append(Spacer(1, 20))  # Espacio después de cada actividad
     
     # === CONCLUSIONES === (replica la sección Conclusiones del HTML)
-    if datos_informe.get('conclusiones'):
+    if datos_informe.get('conclusiones') and es_ultimo_volumen:
         conclusiones_title = Paragraph("Conclusiones", section_style)
         story.append(conclusiones_title)
         
@@ -2107,102 +2793,697 @@ def generar_pdf_informe_html_format(incidencias, datos_informe):
         story.append(conclusiones_text)
     
     # === PIE DE PÁGINA === (replica el <footer> del HTML)
-    footer_text = f"Informe generado automáticamente - Plataforma de Incidencias | Total de imágenes: {contador_imagen - 1}"
+    footer_text = f"Informe generado automáticamente - Plataforma de Incidencias | Total de imágenes: {contador_imagen - figura_inicial}"
+    if volumen is not None:
+        footer_text += f" | Volumen {volumen} de {total_volumenes}"
     footer = Paragraph(footer_text, footer_style)
     story.append(footer)
     
     # Construir el PDF
-    doc.build(story)
-    buffer.seek(0)
-    
-    # Limpiar archivos temporales después de construir el PDF
-    temp_files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if f.startswith('temp_') or f.startswith('collage_')]
-    for temp_file in temp_files:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], temp_file))
-        except:
-            pass  # Ignorar errores al eliminar archivos temporales
-    
-    return send_file(
-        buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'informe_html_format_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
-    )
+    with medir_etapa('maquetacion'):
+        doc.build(story)
+    pdf_bytes = buffer.getvalue()
+    registrar_bytes_pdf(len(pdf_bytes))
+    
+    if estadisticas is not None:
+        estadisticas['paginas'] = doc.page
+        estadisticas['figuras'] = contador_imagen - figura_inicial
+        estadisticas['bytes_imagenes'] = int(bytes_imagenes)
+        estadisticas['bytes_pdf'] = len(pdf_bytes)
+        # En borrador los marcadores ocupan casi nada: el peso final es el texto más las imágenes
+        estadisticas['bytes_estimados'] = int(len(pdf_bytes) + bytes_imagenes) if modo_borrador else len(pdf_bytes)
+    
+    return pdf_bytes
 
-def generar_pdf(incidencias):
-    return generar_pdf_profesional(incidencias)
+# ==================== VISTA PREVIA DE INFORMES ====================
 
-# Función para inicializar la base de datos
-def init_db():
-    """Función simplificada para inicializar la base de datos"""
-    with app.app_context():
-        try:
-            print("🔧 Inicializando base de datos...")
-            
-            # Solo crear las tablas básicas
-            db.create_all()
-            print("✅ Tablas creadas correctamente")
-            
-        except Exception as e:
-            print(f"Error inicializando base de datos: {e}")
-            db.session.rollback()
+# Bytes por píxel aproximados de las imágenes incrustadas en el PDF
+# (JPEG se incrusta tal cual; PNG se guarda como RGB comprimido con Flate)
+BYTES_POR_PIXEL_JPEG = 0.2
+BYTES_POR_PIXEL_PNG = 0.6
+MODOS_BORRADOR = ('miniaturas', 'sin_imagenes')
 
-# ==================== GESTIÓN DE ÍNDICES ====================
+def estimar_bytes_imagen(ancho, alto, formato=None):
+    """Estima el peso que tendrá una imagen ya redimensionada dentro del PDF"""
+    bytes_por_pixel = BYTES_POR_PIXEL_JPEG if formato == 'JPEG' else BYTES_POR_PIXEL_PNG
+    return ancho * alto * bytes_por_pixel
 
-@app.route('/indices')
-@login_required
-def indices():
-    if current_user.rol.nombre != 'Administrador':
-        flash('No tienes permisos para acceder a esta sección', 'error')
-        return redirect(url_for('dashboard'))
-    
-    indices = Indice.query.all()
-    return render_template('indices.html', indices=indices)
+def agregar_marcador_imagen(story, ancho, alto, modo_borrador):
+    """
+    Agrega al story el sustituto de una imagen en la vista previa.
+    'miniaturas' reserva el mismo espacio que la imagen (conteo de páginas exacto);
+    'sin_imagenes' solo deja la leyenda.
+    """
+    if modo_borrador != 'miniaturas':
+        return
+    
+    story.append(Spacer(1, 15))
+    marcador = Table([['']], colWidths=[ancho], rowHeights=[alto])
+    marcador.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#eeeeee')),
+        ('BOX', (0, 0), (0, 0), 1, colors.HexColor('#ccc')),
+    ]))
+    story.append(marcador)
 
-@app.route('/nuevo_indice', methods=['GET', 'POST'])
-@login_required
-def nuevo_indice():
-    if current_user.rol.nombre != 'Administrador':
-        flash('No tienes permisos para acceder a esta sección', 'error')
-        return redirect(url_for('dashboard'))
+def obtener_datos_informe_estructurado(form):
+    """Extrae del formulario los datos comunes del informe estructurado"""
+    return {
+        'cliente': form['cliente'],
+        'atencion': form['atencion'],
+        'cargo': form['cargo'],
+        'alcance': form['alcance'],
+        'fecha': form['fecha'],
+        'introduccion': form['introduccion'],
+        'conclusiones': form.get('conclusiones', ''),
+        'version': form.get('version', '1')
+    }
+
+# ==================== INFORMES POR VOLÚMENES ====================
+
+# Altura útil de una página A4 con márgenes de 40 puntos y altura aproximada de cada bloque
+ALTURA_UTIL_PAGINA = 842 - 80
+ALTURA_FIGURA_ESTIMADA = 225  # imagen de 6cm + leyenda + espacios
+ALTURA_ACTIVIDAD_ESTIMADA = 90  # título, línea de información y espacios
+CARACTERES_POR_LINEA = 90
+ALTURA_LINEA = 19
+
+def cargar_configuracion_imagenes(incidencia):
+    """Retorna la configuración de imágenes de una incidencia como diccionario"""
+    if not incidencia.configuracion_imagenes:
+        return {}
+    try:
+        return json.loads(incidencia.configuracion_imagenes)
+    except:
+        return {'imagenes_individuales': [], 'collages': []}
+
+def contar_figuras_incidencia(incidencia):
+    """Cuenta las figuras que el informe HTML dibujará para la incidencia (imágenes y collages)"""
+    if not incidencia.adjuntos:
+        return 0
     
-    if request.method == 'POST':
-        prefijo = request.form['prefijo'].upper().strip()
-        numero_inicial = int(request.form.get('numero_inicial', 0))
-        
-        # Verificar que el prefijo no exista
-        if Indice.query.filter_by(prefijo=prefijo).first():
-            flash('Ya existe un índice con ese prefijo', 'error')
-            return redirect(url_for('indices'))
-        
-        # Crear nuevo índice
-        indice = Indice(
-            prefijo=prefijo,
-            numero_actual=numero_inicial,
-            formato='000000'
-        )
-        
-        db.session.add(indice)
-        db.session.commit()
-        
-        flash('Índice creado exitosamente', 'success')
-        return redirect(url_for('indices'))
+    configuracion = cargar_configuracion_imagenes(incidencia)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    figuras = 0
     
-    return render_template('nuevo_indice.html')
+    for img_config in configuracion.get('imagenes_individuales', []):
+        if os.path.exists(os.path.join(upload_folder, img_config['archivo'])):
+            figuras += 1
+    
+    for collage_config in configuracion.get('collages', []):
+        if any(os.path.exists(os.path.join(upload_folder, archivo.strip())) for archivo in collage_config['imagenes']):
+            figuras += 1
+    
+    return figuras
 
-@app.route('/editar_indice/<int:id>', methods=['GET', 'POST'])
-@login_required
-def editar_indice(id):
-    if current_user.rol.nombre != 'Administrador':
-        flash('No tienes permisos para acceder a esta sección', 'error')
-        return redirect(url_for('dashboard'))
+def estimar_paginas_incidencia(incidencia, figuras=None):
+    """Estimación rápida (sin renderizar) de las páginas que ocupa una incidencia en el informe"""
+    if figuras is None:
+        figuras = contar_figuras_incidencia(incidencia)
+    lineas_descripcion = len(incidencia.descripcion or '') // CARACTERES_POR_LINEA + 1
+    altura = ALTURA_ACTIVIDAD_ESTIMADA + lineas_descripcion * ALTURA_LINEA + figuras * ALTURA_FIGURA_ESTIMADA
+    return altura / ALTURA_UTIL_PAGINA
+
+def dividir_en_volumenes(incidencias, criterio='incidencias', limite=None):
+    """
+    Divide las incidencias en volúmenes por número de incidencias o por presupuesto de páginas.
+    Retorna una lista de volúmenes; cada volumen es un diccionario con las incidencias,
+    la figura y la actividad inicial para mantener la numeración continua.
+    """
+    if criterio == 'paginas':
+        limite = limite or app.config['INFORME_VOLUMEN_MAX_PAGINAS']
+    else:
+        limite = limite or app.config['INFORME_VOLUMEN_MAX_INCIDENCIAS']
     
-    indice = Indice.query.get_or_404(id)
+    volumenes = []
+    actual = None
+    figura_siguiente = 1
+    actividad_siguiente = 1
     
-    if request.method == 'POST':
-        prefijo = request.form['prefijo'].upper().strip()
-        numero_actual = int(request.form['numero_actual'])
+    for incidencia in incidencias:
+        figuras = contar_figuras_incidencia(incidencia)
+        peso = estimar_paginas_incidencia(incidencia, figuras) if criterio == 'paginas' else 1
+        
+        if actual is None or (actual['incidencias'] and actual['peso'] + peso > limite):
+            actual = {
+                'incidencias': [],
+                'peso': 0,
+                'figura_inicial': figura_siguiente,
+                'actividad_inicial': actividad_siguiente
+            }
+            volumenes.append(actual)
+        
+        actual['incidencias'].append(incidencia)
+        actual['peso'] += peso
+        figura_siguiente += figuras
+        actividad_siguiente += 1
+    
+    return volumenes
+
+def _inicializar_worker_informes():
+    """Inicializador de los procesos de renderizado: no reutilizar conexiones del proceso padre"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def _renderizar_volumen_informe(incidencias, datos_informe, figura_inicial, actividad_inicial, volumen, total_volumenes):
+    """
+    Renderiza un volumen del informe en un proceso de trabajo y retorna (nombre, bytes).
+    Recibe instantáneas de las incidencias, por lo que el proceso no consulta la base de datos.
+    """
+    with app.app_context():
+        pdf_bytes = construir_pdf_informe_html_format(
+            incidencias, datos_informe,
+            figura_inicial=figura_inicial,
+            actividad_inicial=actividad_inicial,
+            volumen=volumen,
+            total_volumenes=total_volumenes
+        )
+    
+    nombre = f'informe_vol{volumen:02d}_de_{total_volumenes:02d}.pdf'
+    return nombre, pdf_bytes
+
+class _SalidaZipStream(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula los bytes escritos hasta que se consumen"""
+    
+    def __init__(self):
+        self._fragmentos = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, datos):
+        self._fragmentos.append(bytes(datos))
+        return len(datos)
+    
+    def vaciar(self):
+        datos = b''.join(self._fragmentos)
+        self._fragmentos = []
+        return datos
+
+# Bytes leídos de disco por cada fragmento que se agrega al ZIP
+TAMANO_LECTURA_ZIP = 256 * 1024
+
+def iterar_zip(entradas):
+    """
+    Genera un archivo ZIP al vuelo a partir de pares (nombre, bytes) o (nombre, ruta en disco).
+    Cada entrada se emite en cuanto está disponible, sin construir el ZIP completo en memoria; los
+    archivos en disco se copian por fragmentos, así que tampoco se cargan completos.
+    Los PDF ya van comprimidos y se guardan sin recomprimir; el resto se comprime.
+    """
+    salida = _SalidaZipStream()
+    with zipfile.ZipFile(salida, mode='w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for nombre, contenido in entradas:
+            compresion = zipfile.ZIP_STORED if nombre.lower().endswith('.pdf') else zipfile.ZIP_DEFLATED
+            if isinstance(contenido, bytes):
+                zf.writestr(nombre, contenido, compress_type=compresion)
+            else:
+                info = zipfile.ZipInfo.from_file(contenido, nombre)
+                info.compress_type = compresion
+                with open(contenido, 'rb') as origen, zf.open(info, 'w') as destino:
+                    for fragmento in iter(lambda: origen.read(TAMANO_LECTURA_ZIP), b''):
+                        destino.write(fragmento)
+                        yield salida.vaciar()
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+def renderizar_en_paralelo(funcion, tareas):
+    """Ejecuta funcion(*args) para cada tarea en procesos de trabajo y entrega los resultados a medida que terminan"""
+    max_workers = max(1, min(app.config['INFORME_WORKERS'], len(tareas)))
+    
+    # 'spawn': un fork del proceso web (con hilos) puede heredar bloqueos tomados por otros hilos
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_inicializar_worker_informes)
+    try:
+        futuros = [executor.submit(funcion, *args) for args in tareas]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+    finally:
+        # Si el cliente se desconecta (GeneratorExit) o una tarea falla, las pendientes se descartan
+        # y solo se espera a las que ya están en ejecución
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def generar_informe_por_volumenes(incidencias, datos_informe, criterio='incidencias', limite=None):
+    """
+    Divide el informe en volúmenes, los renderiza en paralelo y los entrega como un ZIP en streaming.
+    Las incidencias deben ser instantáneas (cargar_instantaneas_incidencias) para enviarlas a los procesos.
+    """
+    volumenes = dividir_en_volumenes(incidencias, criterio, limite)
+    total = len(volumenes)
+    print(f"Informe dividido en {total} volúmenes ({criterio}, límite {limite or 'por defecto'})")
+    
+    tareas = [
+        (
+            vol['incidencias'],
+            datos_informe,
+            vol['figura_inicial'],
+            vol['actividad_inicial'],
+            numero,
+            total
+        )
+        for numero, vol in enumerate(volumenes, 1)
+    ]
+    
+    response = Response(
+        iterar_zip(renderizar_en_paralelo(_renderizar_volumen_informe, tareas)),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=informe_volumenes_{datetime.now().strftime("%Y%m%d_%H%M")}.zip'
+    return response
+
+# ==================== INFORMES RECURRENTES ====================
+
+PERIODOS_INFORME = ('mes_anterior', 'mes_actual', 'semana_anterior')
+
+class _ValoresPlantilla(dict):
+    """Deja intactos los marcadores desconocidos al formatear las plantillas de texto"""
+    def __missing__(self, clave):
+        return '{' + clave + '}'
+
+def calcular_periodo(tipo, referencia=None):
+    """Retorna (inicio, fin_exclusivo, etiqueta) del período relativo a la fecha de referencia"""
+    referencia = (referencia or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    if tipo == 'semana_anterior':
+        fin = referencia - timedelta(days=referencia.weekday())
+        inicio = fin - timedelta(days=7)
+        anio, semana, _ = inicio.isocalendar()
+        return inicio, fin, f'{anio}-S{semana:02d}'
+    
+    inicio_mes = referencia.replace(day=1)
+    if tipo == 'mes_anterior':
+        inicio = (inicio_mes - timedelta(days=1)).replace(day=1)
+        return inicio, inicio_mes, inicio.strftime('%Y-%m')
+    
+    # mes_actual
+    fin = (inicio_mes + timedelta(days=32)).replace(day=1)
+    return inicio_mes, fin, inicio_mes.strftime('%Y-%m')
+
+def preparar_datos_informe_cliente(cliente, inicio, fin, etiqueta, plantilla=None):
+    """
+    datos_informe de un cliente para un período a partir de una plantilla; los textos
+    admiten {cliente}, {periodo}, {fecha_inicio} y {fecha_fin}. fin es exclusivo.
+    """
+    valores = _ValoresPlantilla(
+        cliente=cliente.nombre,
+        periodo=etiqueta,
+        fecha_inicio=inicio.strftime('%d/%m/%Y'),
+        fecha_fin=(fin - timedelta(days=1)).strftime('%d/%m/%Y')
+    )
+    datos_informe = {
+        'cliente': cliente.nombre,
+        'atencion': cliente.contacto_principal or '',
+        'cargo': cliente.cargo_contacto or '',
+        'alcance': '',
+        'fecha': datetime.now().strftime('%d/%m/%Y'),
+        'introduccion': 'Actividades realizadas para {cliente} entre el {fecha_inicio} y el {fecha_fin}.',
+        'conclusiones': '',
+        'version': '1'
+    }
+    datos_informe.update({clave: valor for clave, valor in (plantilla or {}).items() if valor})
+    return {clave: str(valor).format_map(valores) for clave, valor in datos_informe.items()}
+
+def cargar_informes_recurrentes():
+    """Lee la configuración de informes recurrentes (lista JSON); vacía si no existe"""
+    archivo = app.config['INFORMES_RECURRENTES_ARCHIVO']
+    if not os.path.exists(archivo):
+        return []
+    try:
+        with open(archivo, encoding='utf-8') as f:
+            configuraciones = json.load(f)
+    except Exception as e:
+        print(f"Error leyendo {archivo}: {e}")
+        return []
+    
+    validas = []
+    for configuracion in configuraciones:
+        if not configuracion.get('nombre') or not configuracion.get('cliente_id'):
+            print(f"Informe recurrente ignorado (falta nombre o cliente_id): {configuracion}")
+            continue
+        if configuracion.get('periodo', 'mes_anterior') not in PERIODOS_INFORME:
+            print(f"Informe recurrente {configuracion['nombre']} ignorado: período no válido")
+            continue
+        validas.append(configuracion)
+    return validas
+
+def ruta_informe_cache(nombre, etiqueta):
+    """Ruta base (sin extensión) del informe pregenerado en la caché"""
+    return os.path.join(app.config['INFORMES_CACHE_FOLDER'], secure_filename(f'{nombre}_{etiqueta}'))
+
+def pregenerar_informe_recurrente(configuracion, referencia=None, forzar=False):
+    """
+    Renderiza un informe recurrente en la caché. Se omite si ya existe uno generado
+    después del cierre del período (los períodos abiertos se regeneran siempre).
+    Retorna el diccionario de metadatos o None si se omitió.
+    """
+    periodo = configuracion.get('periodo', 'mes_anterior')
+    inicio, fin, etiqueta = calcular_periodo(periodo, referencia)
+    ruta_base = ruta_informe_cache(configuracion['nombre'], etiqueta)
+    
+    if not forzar and os.path.exists(ruta_base + '.json'):
+        with open(ruta_base + '.json', encoding='utf-8') as f:
+            generado = datetime.fromisoformat(json.load(f)['generado'])
+        if generado >= fin:
+            return None
+    
+    cliente = Cliente.query.get(configuracion['cliente_id'])
+    if not cliente:
+        print(f"Informe recurrente {configuracion['nombre']}: cliente {configuracion['cliente_id']} no existe")
+        return None
+    
+    incidencias_ids = [incidencia_id for (incidencia_id,) in Incidencia.query.with_entities(Incidencia.id).filter(
+        Incidencia.cliente_id == cliente.id,
+        Incidencia.fecha_inicio >= inicio,
+        Incidencia.fecha_inicio < fin
+    )]
+    
+    datos_informe = preparar_datos_informe_cliente(cliente, inicio, fin, etiqueta, configuracion.get('datos_informe'))
+    nombre_cliente = cliente.nombre
+    incidencias = cargar_instantaneas_incidencias(incidencias_ids)
+    pdf_bytes = construir_pdf_informe_html_format(incidencias, datos_informe)
+    
+    # Escritura atómica: quien descargue nunca ve un PDF a medio escribir
+    os.makedirs(app.config['INFORMES_CACHE_FOLDER'], exist_ok=True)
+    with open(ruta_base + '.pdf.tmp', 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(ruta_base + '.pdf.tmp', ruta_base + '.pdf')
+    
+    metadatos = {
+        'nombre': configuracion['nombre'],
+        'cliente': nombre_cliente,
+        'periodo': periodo,
+        'etiqueta': etiqueta,
+        'incidencias': len(incidencias),
+        'bytes': len(pdf_bytes),
+        'archivo': os.path.basename(ruta_base) + '.pdf',
+        'generado': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(ruta_base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(metadatos, f, ensure_ascii=False)
+    
+    return metadatos
+
+def pregenerar_informes_recurrentes(referencia=None, forzar=False, nombres=None):
+    """Pregenera todos los informes recurrentes configurados (requiere contexto de aplicación)"""
+    generados = []
+    for configuracion in cargar_informes_recurrentes():
+        if nombres and configuracion['nombre'] not in nombres:
+            continue
+        try:
+            metadatos = pregenerar_informe_recurrente(configuracion, referencia, forzar)
+            if metadatos:
+                print(f"Informe pregenerado: {metadatos['archivo']} ({metadatos['incidencias']} incidencias)")
+                generados.append(metadatos)
+            else:
+                print(f"Informe {configuracion['nombre']} vigente en caché, omitido")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error pregenerando informe {configuracion['nombre']}: {e}")
+    return generados
+
+def listar_informes_cache():
+    """Metadatos de los informes pregenerados disponibles, del más reciente al más antiguo"""
+    carpeta = app.config['INFORMES_CACHE_FOLDER']
+    if not os.path.isdir(carpeta):
+        return []
+    
+    informes_cache = []
+    for archivo in os.listdir(carpeta):
+        if not archivo.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(carpeta, archivo), encoding='utf-8') as f:
+                metadatos = json.load(f)
+        except Exception:
+            continue
+        if os.path.exists(os.path.join(carpeta, metadatos['archivo'])):
+            informes_cache.append(metadatos)
+    
+    informes_cache.sort(key=lambda metadatos: metadatos['generado'], reverse=True)
+    return informes_cache
+
+def _segundos_hasta(hora):
+    """Segundos hasta la próxima ocurrencia de la hora 'HH:MM'"""
+    horas, minutos = (int(parte) for parte in hora.split(':'))
+    ahora = datetime.now()
+    proxima = ahora.replace(hour=horas, minute=minutos, second=0, microsecond=0)
+    if proxima <= ahora:
+        proxima += timedelta(days=1)
+    return (proxima - ahora).total_seconds()
+
+def _bucle_programador_informes():
+    while True:
+        time.sleep(_segundos_hasta(app.config['INFORMES_HORA_PREGENERACION']))
+        print("Programador: iniciando pregeneración de informes recurrentes")
+        with app.app_context():
+            try:
+                pregenerar_informes_recurrentes()
+            except Exception as e:
+                print(f"Programador: error pregenerando informes: {e}")
+            finally:
+                db.session.remove()
+
+_programador_informes = None
+
+def iniciar_programador_informes():
+    """Inicia (una sola vez por proceso) el hilo que pregenera los informes en horario valle"""
+    global _programador_informes
+    if _programador_informes is not None:
+        return
+    _programador_informes = threading.Thread(target=_bucle_programador_informes, name='programador_informes', daemon=True)
+    _programador_informes.start()
+    print(f"Programador de informes activo (diario a las {app.config['INFORMES_HORA_PREGENERACION']})")
+
+@app.route('/informes/pregenerados/<nombre_archivo>')
+@login_required
+def descargar_informe_pregenerado(nombre_archivo):
+    if current_user.rol.nombre not in ['Administrador', 'Coordinador']:
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    ruta = os.path.join(app.config['INFORMES_CACHE_FOLDER'], secure_filename(nombre_archivo))
+    if not ruta.endswith('.pdf') or not os.path.exists(ruta):
+        abort(404)
+    
+    return send_file(os.path.abspath(ruta), mimetype='application/pdf', as_attachment=True,
+                     download_name=os.path.basename(ruta))
+
+# ==================== INFORMES POR LOTE (UN PDF POR CLIENTE) ====================
+
+# Progreso de los lotes en curso de este proceso: lote_id -> estado
+PROGRESO_LOTES = {}
+_bloqueo_lotes = threading.Lock()
+DURACION_PROGRESO_LOTE = 3600  # segundos que se conserva el progreso de un lote
+
+def _renderizar_informe_cliente(nombre_archivo, incidencias, datos_informe):
+    """Renderiza el informe de un cliente en un proceso de trabajo y retorna (nombre, bytes)"""
+    with app.app_context():
+        pdf_bytes = construir_pdf_informe_html_format(incidencias, datos_informe)
+    return nombre_archivo, pdf_bytes
+
+def iniciar_progreso_lote(lote_id, archivos, omitidos):
+    with _bloqueo_lotes:
+        # Descartar progresos antiguos ya terminados (los que siguen transmitiéndose se conservan)
+        limite = time.time() - DURACION_PROGRESO_LOTE
+        for antiguo in [clave for clave, estado in PROGRESO_LOTES.items() if estado['terminado'] and estado['inicio'] < limite]:
+            del PROGRESO_LOTES[antiguo]
+        PROGRESO_LOTES[lote_id] = {
+            'total': len(archivos),
+            'completados': [],
+            'omitidos': omitidos,
+            'inicio': time.time(),
+            'terminado': False
+        }
+
+def _seguir_progreso_lote(lote_id, resultados):
+    """Pasa los resultados al ZIP registrando cada archivo completado"""
+    with _bloqueo_lotes:
+        estado = PROGRESO_LOTES.get(lote_id)
+    if estado is None:
+        # Otro envío con el mismo lote_id reemplazó el registro: se transmite sin progreso
+        estado = {'completados': []}
+    try:
+        for nombre, contenido in resultados:
+            with _bloqueo_lotes:
+                estado['completados'].append(nombre)
+            yield nombre, contenido
+    finally:
+        with _bloqueo_lotes:
+            estado['terminado'] = True
+
+def generar_lote_informes(tareas, lote_id, etiqueta):
+    """
+    Renderiza en paralelo un informe por cliente y entrega un ZIP en streaming;
+    cada PDF entra al ZIP en cuanto termina, así el lote dura lo que el cliente más lento.
+    """
+    response = Response(
+        iterar_zip(_seguir_progreso_lote(lote_id, renderizar_en_paralelo(_renderizar_informe_cliente, tareas))),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=informes_clientes_{etiqueta}.zip'
+    return response
+
+@app.route('/informes/lote', methods=['GET', 'POST'])
+@login_required
+def informe_lote():
+    if current_user.rol.nombre not in ['Administrador', 'Coordinador']:
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        try:
+            clientes_ids = [int(cliente_id) for cliente_id in request.form.getlist('clientes')]
+        except ValueError:
+            flash('Selección de clientes no válida', 'error')
+            clientes = Cliente.query.filter_by(activo=True).order_by(Cliente.nombre).all()
+            return render_template('informe_lote.html', clientes=clientes), 400
+        try:
+            inicio = datetime.strptime(request.form['fecha_inicio'], '%Y-%m-%d')
+            fin = datetime.strptime(request.form['fecha_fin'], '%Y-%m-%d') + timedelta(days=1)
+        except (KeyError, ValueError):
+            flash('Debe indicar un período válido', 'error')
+            return redirect(url_for('informe_lote'))
+        
+        if not clientes_ids or fin <= inicio:
+            flash('Debe seleccionar al menos un cliente y un período válido', 'error')
+            return redirect(url_for('informe_lote'))
+        
+        lote_id = request.form.get('lote_id', '')
+        if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', lote_id):
+            lote_id = uuid.uuid4().hex
+        
+        etiqueta = f'{inicio:%Y%m%d}-{fin - timedelta(days=1):%Y%m%d}'
+        plantilla = {
+            'alcance': request.form.get('alcance', ''),
+            'introduccion': request.form.get('introduccion', ''),
+            'conclusiones': request.form.get('conclusiones', '')
+        }
+        
+        clientes = Cliente.query.filter(Cliente.id.in_(clientes_ids)).order_by(Cliente.nombre).all()
+        incidencias_ids = [incidencia_id for (incidencia_id,) in Incidencia.query.with_entities(Incidencia.id).filter(
+            Incidencia.cliente_id.in_(clientes_ids),
+            Incidencia.fecha_inicio >= inicio,
+            Incidencia.fecha_inicio < fin
+        )]
+        datos_por_cliente = {cliente.id: preparar_datos_informe_cliente(cliente, inicio, fin, etiqueta, plantilla) for cliente in clientes}
+        nombres_clientes = {cliente.id: cliente.nombre for cliente in clientes}
+        
+        # Una sola consulta para todos los clientes; la sesión se libera antes de renderizar
+        incidencias_por_cliente = {}
+        for incidencia in cargar_instantaneas_incidencias(incidencias_ids):
+            incidencias_por_cliente.setdefault(incidencia.cliente.id, []).append(incidencia)
+        
+        tareas = []
+        omitidos = []
+        for cliente_id, nombre in nombres_clientes.items():
+            if cliente_id not in incidencias_por_cliente:
+                omitidos.append(nombre)
+                continue
+            nombre_archivo = f'informe_{cliente_id:04d}_{secure_filename(nombre) or "cliente"}_{etiqueta}.pdf'
+            tareas.append((nombre_archivo, incidencias_por_cliente[cliente_id], datos_por_cliente[cliente_id]))
+        
+        if not tareas:
+            flash('Ninguno de los clientes seleccionados tiene incidencias en el período', 'warning')
+            return redirect(url_for('informe_lote'))
+        
+        iniciar_progreso_lote(lote_id, [tarea[0] for tarea in tareas], omitidos)
+        print(f"Lote {lote_id}: {len(tareas)} informes de clientes ({len(omitidos)} sin actividad)")
+        return generar_lote_informes(tareas, lote_id, etiqueta)
+    
+    clientes = Cliente.query.filter_by(activo=True).order_by(Cliente.nombre).all()
+    return render_template('informe_lote.html', clientes=clientes)
+
+@app.route('/informes/lote/<lote_id>/progreso')
+@login_required
+def progreso_informe_lote(lote_id):
+    if current_user.rol.nombre not in ['Administrador', 'Coordinador']:
+        return jsonify({'success': False, 'message': 'No tienes permisos para realizar esta acción'}), 403
+    
+    with _bloqueo_lotes:
+        estado = PROGRESO_LOTES.get(lote_id)
+        if estado is None:
+            return jsonify({'encontrado': False})
+        return jsonify({
+            'encontrado': True,
+            'total': estado['total'],
+            'completados': len(estado['completados']),
+            'ultimo': estado['completados'][-1] if estado['completados'] else None,
+            'omitidos': estado['omitidos'],
+            'segundos': round(time.time() - estado['inicio'], 1),
+            'terminado': estado['terminado']
+        })
+
+def generar_pdf(incidencias):
+    return generar_pdf_profesional(incidencias)
+
+# Función para inicializar la base de datos
+def init_db():
+    """Función simplificada para inicializar la base de datos"""
+    with app.app_context():
+        try:
+            print("🔧 Inicializando base de datos...")
+            
+            # Solo crear las tablas básicas
+            db.create_all()
+            print("✅ Tablas creadas correctamente")
+            
+        except Exception as e:
+            print(f"Error inicializando base de datos: {e}")
+            db.session.rollback()
+
+# ==================== GESTIÓN DE ÍNDICES ====================
+
+@app.route('/indices')
+@login_required
+def indices():
+    if current_user.rol.nombre != 'Administrador':
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    indices = Indice.query.all()
+    return render_template('indices.html', indices=indices)
+
+@app.route('/nuevo_indice', methods=['GET', 'POST'])
+@login_required
+def nuevo_indice():
+    if current_user.rol.nombre != 'Administrador':
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        prefijo = request.form['prefijo'].upper().strip()
+        numero_inicial = int(request.form.get('numero_inicial', 0))
+        
+        # Verificar que el prefijo no exista
+        if Indice.query.filter_by(prefijo=prefijo).first():
+            flash('Ya existe un índice con ese prefijo', 'error')
+            return redirect(url_for('indices'))
+        
+        # Crear nuevo índice
+        indice = Indice(
+            prefijo=prefijo,
+            numero_actual=numero_inicial,
+            formato='000000'
+        )
+        
+        db.session.add(indice)
+        db.session.commit()
+        
+        flash('Índice creado exitosamente', 'success')
+        return redirect(url_for('indices'))
+    
+    return render_template('nuevo_indice.html')
+
+@app.route('/editar_indice/<int:id>', methods=['GET', 'POST'])
+@login_required
+def editar_indice(id):
+    if current_user.rol.nombre != 'Administrador':
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    indice = Indice.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        prefijo = request.form['prefijo'].upper().strip()
+        numero_actual = int(request.form['numero_actual'])
         
         # Verificar que el prefijo no exista en otro índice
         existing = Indice.query.filter(Indice.prefijo == prefijo, Indice.id != id).first()
@@ -2351,11 +3632,15 @@ def formularios():
     if current_user.rol.nombre == 'Administrador':
         # Los administradores ven todos los formularios y pueden gestionarlos
         formularios = Formulario.query.filter_by(activo=True).order_by(Formulario.fecha_creacion.desc()).all()
-        return render_template('formularios_admin.html', formularios=formularios)
+        regeneraciones = RegeneracionPDF.query.order_by(RegeneracionPDF.id.desc()).limit(10).all()
+        usuarios = User.query.order_by(User.nombre).all()
+        return render_template('formularios_admin.html', formularios=formularios, regeneraciones=regeneraciones, usuarios=usuarios)
     else:
         # Los técnicos y coordinadores ven solo los formularios disponibles para diligenciar
         formularios = Formulario.query.filter_by(activo=True).order_by(Formulario.nombre).all()
-        return render_template('formularios_usuario.html', formularios=formularios)
+        # Los coordinadores pueden descargar el ZIP de las respuestas de un usuario concreto
+        usuarios = User.query.order_by(User.nombre).all() if current_user.rol.nombre == 'Coordinador' else []
+        return render_template('formularios_usuario.html', formularios=formularios, usuarios=usuarios)
 
 @app.route('/formularios/nuevo', methods=['GET', 'POST'])
 @login_required
@@ -2439,6 +3724,201 @@ def eliminar_formulario(id):
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error al eliminar formulario: {str(e)}'})
 
+# ==================== ESQUEMA COMPILADO DE FORMULARIOS ====================
+
+# Cada formulario se compila una vez por versión: campos ordenados, configuración ya parseada
+# y el manejador de su tipo. Los cambios de estructura incrementan Formulario.version, lo que
+# invalida el esquema también en los demás procesos de la aplicación.
+CampoEsquema = namedtuple('CampoEsquema', ['id', 'tipo_campo', 'titulo', 'descripcion', 'obligatorio', 'orden', 'configuracion', 'manejador'])
+EsquemaFormulario = namedtuple('EsquemaFormulario', ['id', 'version', 'campos'])
+# Origen de los valores de una respuesta: el formulario HTML o una respuesta de un lote sincronizado.
+# guardados (opcional) recibe las rutas de las fotos y firmas escritas, para borrarlas si la respuesta falla
+EntradaFormulario = namedtuple('EntradaFormulario', ['form', 'files', 'guardados'], defaults=(None,))
+
+def eliminar_archivos_guardados(entrada):
+    """Borra las fotos y firmas que escribió una respuesta que no llegó a guardarse"""
+    for ruta in entrada.guardados or []:
+        try:
+            os.remove(ruta)
+        except OSError as e:
+            app.logger.warning('No se pudo eliminar %s: %s', ruta, e)
+
+def _valor_formulario(campo, entrada):
+    """Valor enviado para el campo, validando los obligatorios (el navegador ya lo exige)"""
+    valor = entrada.form.get(f'campo_{campo.id}', '').strip()
+    if campo.obligatorio and not valor:
+        raise ValueError(f'El campo "{campo.titulo}" es obligatorio')
+    return valor
+
+def _responder_texto(campo, valores, respuesta_formulario, entrada):
+    valores['valor_texto'] = _valor_formulario(campo, entrada)
+    return True
+
+def _responder_fecha(campo, valores, respuesta_formulario, entrada):
+    fecha_str = _valor_formulario(campo, entrada)
+    if fecha_str:
+        valores['valor_fecha'] = datetime.strptime(fecha_str, '%Y-%m-%d')
+    return True
+
+def _responder_seleccion(campo, valores, respuesta_formulario, entrada):
+    valor = _valor_formulario(campo, entrada)
+    opciones = campo.configuracion.get('opciones')
+    if valor and opciones and valor not in opciones:
+        raise ValueError(f'Opción no válida para el campo "{campo.titulo}"')
+    valores['valor_texto'] = valor
+    return True
+
+def _responder_seleccion_multiple(campo, valores, respuesta_formulario, entrada):
+    valores['valor_texto'] = entrada.form.get(f'campo_{campo.id}', '')
+    return True
+
+def _responder_firma(campo, valores, respuesta_formulario, entrada):
+    # Procesar firma con información del firmante
+    trazos_data = entrada.form.get(f'trazos_{campo.id}', '')
+    # La firma llega como archivo PNG binario; los clientes antiguos envían el data URL en el campo de texto
+    firma_archivo = entrada.files.get(f'campo_{campo.id}')
+    firma_data = firma_archivo if firma_archivo and firma_archivo.filename else entrada.form.get(f'campo_{campo.id}', '')
+    if trazos_data:
+        # Firma capturada como trazos: se guarda el JSON compacto, sin imagen
+        try:
+            valores['valor_json'] = normalizar_trazos_firma(trazos_data)
+            app.logger.debug('Firma vectorial del campo %s guardada (%d bytes)', campo.id, len(valores['valor_json']))
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            app.logger.warning('Trazos de firma no válidos en el campo %s: %s', campo.id, e)
+            trazos_data = ''
+    if firma_data and not trazos_data:
+        try:
+            # Decodificar una sola vez y almacenar SOLO la ruta del PNG canónico
+            valores['valor_archivo'] = guardar_firma(firma_data, campo.id, respuesta_formulario.id)
+            if entrada.guardados is not None:
+                entrada.guardados.append(os.path.join(app.config['UPLOAD_FOLDER'], valores['valor_archivo']))
+            app.logger.debug('Firma PNG del campo %s guardada en %s', campo.id, valores['valor_archivo'])
+        except Exception:
+            app.logger.exception('No se pudo guardar la firma PNG del campo %s', campo.id)
+            # Como fallback guarda el base64 para no perder datos
+            if isinstance(firma_data, str):
+                valores['valor_archivo'] = firma_data
+    if trazos_data or firma_data:
+        # Guardar información adicional del firmante
+        valores['nombre_firmante'] = entrada.form.get(f'nombre_{campo.id}', '')
+        valores['documento_firmante'] = entrada.form.get(f'documento_{campo.id}', '')
+        valores['telefono_firmante'] = entrada.form.get(f'telefono_{campo.id}', '')
+        valores['empresa_firmante'] = entrada.form.get(f'empresa_{campo.id}', '')
+        valores['cargo_firmante'] = entrada.form.get(f'cargo_{campo.id}', '')
+    return True
+
+def _responder_foto(campo, valores, respuesta_formulario, entrada):
+    # Procesar fotos múltiples con renombrado automático
+    imagenes_dir = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename("formularios"), 'imagenes')
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    nombres_archivos = []
+    for i, archivo in enumerate(archivos_recibidos(entrada.form, entrada.files, f'campo_{campo.id}')):
+        if archivo and archivo.filename:
+            file_extension = os.path.splitext(archivo.filename)[1].lower()
+            if not file_extension:
+                file_extension = '.jpg'  # Default para imágenes sin extensión
+            
+            # Crear nombre único: foto_campoID_respuestaID_timestamp.ext
+            os.makedirs(imagenes_dir, exist_ok=True)
+            unique_filename = f'foto_{campo.id}_{respuesta_formulario.id}_{timestamp}_{i+1}{file_extension}'
+            archivo.save(os.path.join(imagenes_dir, unique_filename))
+            nombres_archivos.append(unique_filename)
+            if entrada.guardados is not None:
+                entrada.guardados.append(os.path.join(imagenes_dir, unique_filename))
+    
+    if nombres_archivos:
+        valores['valor_archivo'] = ','.join(nombres_archivos)
+        app.logger.debug('Campo %s: %d fotos guardadas', campo.id, len(nombres_archivos))
+    return True
+
+def _responder_informativo(campo, valores, respuesta_formulario, entrada):
+    # Los campos informativos no tienen respuesta
+    return False
+
+def _responder_vacio(campo, valores, respuesta_formulario, entrada):
+    # Tipo desconocido: se registra la respuesta sin valor, como hasta ahora
+    return True
+
+# Columnas de valor de RespuestaCampo que llenan los manejadores; todas las filas llevan las mismas
+# claves para que la inserción masiva se ejecute como un único executemany
+COLUMNAS_VALOR_RESPUESTA = ('valor_texto', 'valor_fecha', 'valor_archivo', 'valor_json', 'nombre_firmante',
+                            'documento_firmante', 'telefono_firmante', 'empresa_firmante', 'cargo_firmante')
+
+MANEJADORES_CAMPO = {
+    'texto': _responder_texto,
+    'textarea': _responder_texto,
+    'fecha': _responder_fecha,
+    'seleccion': _responder_seleccion,
+    'seleccion_multiple': _responder_seleccion_multiple,
+    'firma': _responder_firma,
+    'foto': _responder_foto,
+    'texto_informativo': _responder_informativo
+}
+
+def guardar_valores_respuesta(formulario, respuesta_formulario, entrada):
+    """
+    Procesa los valores de todos los campos de una respuesta ya agregada a la sesión y los inserta
+    en un solo executemany. No confirma la transacción. Retorna cuántos campos se guardaron.
+    """
+    db.session.flush()  # Para obtener el ID
+    
+    # Construir las filas de todos los campos en una pasada
+    filas = []
+    for campo in obtener_esquema_formulario(formulario).campos:
+        valores = dict.fromkeys(COLUMNAS_VALOR_RESPUESTA)
+        # Procesar según el tipo de campo
+        if not campo.manejador(campo, valores, respuesta_formulario, entrada):
+            continue
+        valores['respuesta_formulario_id'] = respuesta_formulario.id
+        valores['campo_id'] = campo.id
+        filas.append(valores)
+    
+    if filas:
+        # INSERT de Core: un solo executemany (el INSERT del ORM reparte las filas en lotes)
+        db.session.execute(RespuestaCampo.__table__.insert(), filas)
+    app.logger.debug('Respuesta %s del formulario %s: %d campos', respuesta_formulario.id, formulario.id, len(filas))
+    return len(filas)
+
+def _congelar(valor):
+    """Copia inmutable de la configuración JSON de un campo"""
+    if isinstance(valor, dict):
+        return MappingProxyType({clave: _congelar(v) for clave, v in valor.items()})
+    if isinstance(valor, list):
+        return tuple(_congelar(v) for v in valor)
+    return valor
+
+@lru_cache(maxsize=256)
+def _compilar_esquema(formulario_id, version):
+    """Compila los campos del formulario con una sola consulta; la versión forma parte de la clave de caché"""
+    campos = CampoFormulario.query.filter_by(formulario_id=formulario_id).order_by(CampoFormulario.orden, CampoFormulario.id).all()
+    return EsquemaFormulario(formulario_id, version, tuple(
+        CampoEsquema(
+            id=campo.id,
+            tipo_campo=campo.tipo_campo,
+            titulo=campo.titulo,
+            descripcion=campo.descripcion,
+            obligatorio=bool(campo.obligatorio),
+            orden=campo.orden,
+            configuracion=_congelar(from_json(campo.configuracion)),
+            manejador=MANEJADORES_CAMPO.get(campo.tipo_campo, _responder_vacio)
+        )
+        for campo in campos
+    ))
+
+def obtener_esquema_formulario(formulario):
+    """Esquema compilado de la versión actual del formulario"""
+    return _compilar_esquema(formulario.id, formulario.version or 1)
+
+def invalidar_esquema_formulario(formulario):
+    """
+    Marca un cambio de estructura; se persiste con el commit de quien llama.
+    El incremento lo hace la base de datos para no perder el de otra petición concurrente.
+    """
+    formulario.version = db.func.coalesce(Formulario.version, 1) + 1
+    db.session.flush()
+    db.session.refresh(formulario, ['version'])
+
 @app.route('/formularios/<int:id>/diligenciar', methods=['GET', 'POST'])
 @login_required
 def diligenciar_formulario(id):
@@ -2456,150 +3936,163 @@ def diligenciar_formulario(id):
             diligenciado_por=current_user.id,
             estado='Completado'
         )
+        entrada = EntradaFormulario(request.form, request.files, [])
         
         try:
-            print(f"DEBUG: Iniciando guardado del formulario {id}")
+            # La respuesta y los valores de los campos se confirman antes de generar el PDF, que no
+            # debe mantener abierta la transacción (ni los bloqueos de las filas insertadas)
             db.session.add(respuesta_formulario)
-            db.session.flush()  # Para obtener el ID
-            print(f"DEBUG: RespuestaFormulario creada con ID: {respuesta_formulario.id}")
-            
-            # Procesar respuestas de cada campo
-            campos_procesados = 0
-            for campo in formulario.campos:
-                respuesta_campo = RespuestaCampo(
-                    respuesta_formulario_id=respuesta_formulario.id,
-                    campo_id=campo.id
-                )
-                
-                # Procesar según el tipo de campo
-                if campo.tipo_campo == 'texto':
-                    respuesta_campo.valor_texto = request.form.get(f'campo_{campo.id}', '')
-                elif campo.tipo_campo == 'textarea':
-                    respuesta_campo.valor_texto = request.form.get(f'campo_{campo.id}', '')
-                elif campo.tipo_campo == 'fecha':
-                    fecha_str = request.form.get(f'campo_{campo.id}', '')
-                    if fecha_str:
-                        respuesta_campo.valor_fecha = datetime.strptime(fecha_str, '%Y-%m-%d')
-                elif campo.tipo_campo in ['seleccion', 'seleccion_multiple']:
-                    respuesta_campo.valor_texto = request.form.get(f'campo_{campo.id}', '')
-                elif campo.tipo_campo == 'firma':
-                    # Procesar firma con información del firmante
-                    firma_data = request.form.get(f'campo_{campo.id}', '')
-                    if firma_data:
-                        try:
-                            # Guardar PNG EXACTAMENTE como en FirmasHTML y almacenar SOLO la ruta
-                            import base64
-                            from io import BytesIO
-                            from PIL import Image as PILImage
-
-                            # Separar prefijo data URL
-                            if ',' in firma_data:
-                                _, encoded = firma_data.split(',', 1)
-                            else:
-                                encoded = firma_data
-
-                            image_bytes = base64.b64decode(encoded)
-
-                            # Preparar carpetas: uploads/formularios/firmas
-                            formularios_root = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios')
-                            firmas_dir = os.path.join(formularios_root, 'firmas')
-                            os.makedirs(firmas_dir, exist_ok=True)
-
-                            # Nombre de archivo
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            png_filename = f'firma_{campo.id}_{respuesta_formulario.id}_{timestamp}.png'
-                            png_path = os.path.join(firmas_dir, png_filename)
-
-                            # Decodificar y guardar como PNG con fondo blanco
-                            img = PILImage.open(BytesIO(image_bytes)).convert('RGBA')
-                            bg = PILImage.new("RGB", img.size, (255, 255, 255))
-                            bg.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-                            bg.save(png_path, format='PNG')
-
-                            print(f"DEBUG: Firma PNG guardada (POST) en: {png_path}")
-
-                            # Guardar SOLO la ruta relativa en la DB
-                            respuesta_campo.valor_archivo = os.path.join('formularios', 'firmas', png_filename)
-                        except Exception as e:
-                            print(f"ERROR: No se pudo guardar la firma PNG: {e}")
-                            # Como fallback guarda el base64 para no perder datos
-                            respuesta_campo.valor_archivo = firma_data
-
-                        # Guardar información adicional del firmante
-                        respuesta_campo.nombre_firmante = request.form.get(f'nombre_{campo.id}', '')
-                        respuesta_campo.documento_firmante = request.form.get(f'documento_{campo.id}', '')
-                        respuesta_campo.telefono_firmante = request.form.get(f'telefono_{campo.id}', '')
-                        respuesta_campo.empresa_firmante = request.form.get(f'empresa_{campo.id}', '')
-                        respuesta_campo.cargo_firmante = request.form.get(f'cargo_{campo.id}', '')
-                elif campo.tipo_campo == 'foto':
-                    # Procesar fotos múltiples con renombrado automático
-                    archivos = request.files.getlist(f'campo_{campo.id}')
-                    print(f"DEBUG: Campo {campo.id} - Recibidos {len(archivos)} archivos")
-                    
-                    nombres_archivos = []
-                    for i, archivo in enumerate(archivos):
-                        print(f"DEBUG: Archivo {i+1}: {archivo.filename if archivo.filename else 'Sin nombre'}")
-                        if archivo and archivo.filename:
-                            # Generar nombre único con ID y timestamp
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            file_extension = os.path.splitext(archivo.filename)[1].lower()
-                            if not file_extension:
-                                file_extension = '.jpg'  # Default para imágenes sin extensión
-                            
-                            # Crear estructura de carpetas organizada para fotos
-                            formulario_nombre = secure_filename("formularios")
-                            imagenes_dir = os.path.join(app.config['UPLOAD_FOLDER'], formulario_nombre, 'imagenes')
-                            os.makedirs(imagenes_dir, exist_ok=True)
-                            
-                            # Crear nombre único: foto_campoID_respuestaID_timestamp.ext
-                            unique_filename = f'foto_{campo.id}_{respuesta_formulario.id}_{timestamp}_{i+1}{file_extension}'
-                            filepath = os.path.join(imagenes_dir, unique_filename)
-                            
-                            print(f"DEBUG: Guardando como: {unique_filename}")
-                            archivo.save(filepath)
-                            nombres_archivos.append(unique_filename)
-                            print(f"DEBUG: Archivo guardado exitosamente: {unique_filename}")
-                    
-                    if nombres_archivos:
-                        respuesta_campo.valor_archivo = ','.join(nombres_archivos)
-                        print(f"DEBUG: Valor archivo guardado: {respuesta_campo.valor_archivo}")
-                    else:
-                        print(f"DEBUG: No se guardaron archivos para el campo {campo.id}")
-                elif campo.tipo_campo == 'texto_informativo':
-                    # Los campos informativos no tienen respuesta
-                    continue
-                
-                db.session.add(respuesta_campo)
-                campos_procesados += 1
-                print(f"DEBUG: Campo {campo.id} ({campo.titulo}) procesado exitosamente")
-            
-            print(f"DEBUG: Total de campos procesados: {campos_procesados}")
+            guardar_valores_respuesta(formulario, respuesta_formulario, entrada)
+            respuesta_formulario.estado_pdf = 'Generando'
+            respuesta_formulario.fecha_estado_pdf = datetime.utcnow()
             db.session.commit()
-            print(f"DEBUG: Formulario guardado exitosamente en la base de datos")
-            
-            # Generar PDF automáticamente - USANDO LA FUNCIÓN ORIGINAL QUE FUNCIONABA
-            print(f"DEBUG: Iniciando generación de PDF para respuesta {respuesta_formulario.id}")
-            
-            pdf_path = generar_pdf_formulario(respuesta_formulario)
-            
-            if pdf_path:
-                respuesta_formulario.archivo_pdf = pdf_path
-                db.session.commit()
-                print(f"DEBUG: PDF generado exitosamente: {pdf_path}")
-                
-                # Redirigir a página de descarga
-                flash('Formulario diligenciado y PDF generado exitosamente', 'success')
-                return redirect(url_for('descargar_formulario_pdf', id=respuesta_formulario.id))
-            else:
-                print("DEBUG: Error al generar PDF")
-                flash('Formulario diligenciado exitosamente, pero hubo un error al generar el PDF', 'warning')
-                return redirect(url_for('formularios'))
-            
         except Exception as e:
             db.session.rollback()
+            eliminar_archivos_guardados(entrada)
             flash('Error al diligenciar formulario: ' + str(e), 'error')
+            return render_template('diligenciar_formulario.html', formulario=formulario, esquema=obtener_esquema_formulario(formulario))
+        
+        if app.config['FORMULARIO_PDF_WORKERS'] > 0:
+            # Responder en cuanto los datos quedan guardados; el PDF se genera en segundo plano
+            encolar_pdf_formulario(respuesta_formulario.id)
+            flash('Formulario diligenciado exitosamente, el PDF se está generando', 'success')
+            return redirect(url_for('descargar_formulario_pdf', id=respuesta_formulario.id))
+        
+        # Generar PDF automáticamente con los valores recién guardados y registrarlo en una transacción corta
+        pdf_path = generar_pdf_formulario(respuesta_formulario)
+        respuesta_formulario.archivo_pdf = pdf_path or None
+        respuesta_formulario.estado_pdf = 'Listo' if pdf_path else 'Error'
+        db.session.commit()
+        
+        if pdf_path:
+            # Redirigir a página de descarga
+            flash('Formulario diligenciado y PDF generado exitosamente', 'success')
+            return redirect(url_for('descargar_formulario_pdf', id=respuesta_formulario.id))
+        else:
+            app.logger.warning('No se pudo generar el PDF de la respuesta %s', respuesta_formulario.id)
+            flash('Formulario diligenciado exitosamente, pero hubo un error al generar el PDF', 'warning')
+            return redirect(url_for('formularios'))
     
-    return render_template('diligenciar_formulario.html', formulario=formulario)
+    return render_template('diligenciar_formulario.html', formulario=formulario, esquema=obtener_esquema_formulario(formulario))
+
+# ==================== SINCRONIZACIÓN SIN CONEXIÓN ====================
+
+def _valores_sincronizados(valores):
+    """Valores de una respuesta del lote en el formato del formulario HTML (listas = valores repetidos)"""
+    datos = MultiDict()
+    for nombre, valor in (valores or {}).items():
+        for elemento in (valor if isinstance(valor, list) else [valor]):
+            if isinstance(elemento, dict):
+                elemento = json.dumps(elemento)  # p. ej. los trazos de una firma enviados como objeto
+            datos.add(nombre, '' if elemento is None else str(elemento))
+    return datos
+
+def _fecha_sincronizada(texto):
+    """Fecha ISO del dispositivo en UTC sin zona, como fecha_diligenciamiento; None si no viene"""
+    if not texto:
+        return None
+    try:
+        fecha = datetime.fromisoformat(texto.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError('fecha_diligenciamiento no es una fecha válida (formato ISO 8601, p. ej. 2024-05-01T14:30:00Z)')
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+@app.route('/api/formularios/sincronizar', methods=['POST'])
+@login_required
+def sincronizar_formularios():
+    """
+    Recibe en un solo envío multipart varias respuestas diligenciadas sin conexión.
+    
+    La parte 'lote' es un JSON {"respuestas": [{"id_cliente", "formulario_id", "fecha_diligenciamiento",
+    "valores": {"campo_<id>": ..., "trazos_<id>": ..., "nombre_<id>": ...}}]} con los mismos nombres del
+    formulario HTML; las fotos y firmas van como partes '<id_cliente>/campo_<id>'. Todo el lote se aplica
+    en una transacción (un punto de guardado por respuesta) y las respuestas cuyo id_cliente ya existe se
+    reportan como duplicadas, así que un lote interrumpido se puede reenviar completo sin riesgo.
+    """
+    try:
+        respuestas = json.loads(request.form.get('lote') or '{}').get('respuestas')
+    except (ValueError, AttributeError):
+        respuestas = None
+    if not isinstance(respuestas, list) or not respuestas:
+        return jsonify({'success': False, 'message': 'El lote debe incluir la lista de respuestas'}), 400
+    if len(respuestas) > app.config['SINCRONIZACION_MAX_RESPUESTAS']:
+        return jsonify({'success': False, 'message': f"El lote supera {app.config['SINCRONIZACION_MAX_RESPUESTAS']} respuestas"}), 400
+    if not all(isinstance(r, dict) and isinstance(r.get('id_cliente'), str) and 0 < len(r['id_cliente']) <= 64 for r in respuestas):
+        return jsonify({'success': False, 'message': 'Cada respuesta necesita un id_cliente de hasta 64 caracteres'}), 400
+    
+    # Una consulta para los duplicados y otra para los formularios de todo el lote
+    ids_cliente = [r['id_cliente'] for r in respuestas]
+    existentes = dict(db.session.query(RespuestaFormulario.id_cliente, RespuestaFormulario.id)
+                      .filter(RespuestaFormulario.id_cliente.in_(ids_cliente)))
+    formularios = {f.id: f for f in Formulario.query.filter(
+        Formulario.id.in_({r.get('formulario_id') for r in respuestas if isinstance(r.get('formulario_id'), int)}))}
+    
+    archivos = {}
+    for nombre, archivo in request.files.items(multi=True):
+        id_cliente, _, campo = nombre.partition('/')
+        archivos.setdefault(id_cliente, []).append((campo, archivo))
+    
+    asincrono = app.config['FORMULARIO_PDF_WORKERS'] > 0
+    resultados = []
+    creadas = []
+    archivos_creadas = []
+    for datos in respuestas:
+        id_cliente = datos['id_cliente']
+        if id_cliente in existentes:
+            resultados.append({'id_cliente': id_cliente, 'estado': 'duplicada', 'id': existentes[id_cliente]})
+            continue
+        
+        formulario = formularios.get(datos.get('formulario_id'))
+        if formulario is None or not formulario.activo:
+            resultados.append({'id_cliente': id_cliente, 'estado': 'error', 'message': 'Formulario no disponible'})
+            continue
+        
+        entrada = EntradaFormulario(_valores_sincronizados(datos.get('valores')), MultiDict(archivos.get(id_cliente, [])), [])
+        try:
+            with db.session.begin_nested():
+                respuesta_formulario = RespuestaFormulario(
+                    formulario_id=formulario.id,
+                    diligenciado_por=current_user.id,
+                    estado='Completado',
+                    id_cliente=id_cliente,
+                    fecha_diligenciamiento=_fecha_sincronizada(datos.get('fecha_diligenciamiento')) or datetime.utcnow(),
+                    estado_pdf='Generando' if asincrono else None,
+                    fecha_estado_pdf=datetime.utcnow() if asincrono else None
+                )
+                db.session.add(respuesta_formulario)
+                guardar_valores_respuesta(formulario, respuesta_formulario, entrada)
+        except Exception as e:
+            eliminar_archivos_guardados(entrada)
+            resultados.append({'id_cliente': id_cliente, 'estado': 'error', 'message': str(e)})
+            continue
+        
+        existentes[id_cliente] = respuesta_formulario.id  # id_cliente repetido dentro del mismo lote
+        creadas.append(respuesta_formulario)
+        archivos_creadas.append(entrada)
+        resultados.append({'id_cliente': id_cliente, 'estado': 'creada', 'id': respuesta_formulario.id})
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otro envío del mismo lote se confirmó a la vez: al reintentar esas respuestas saldrán como duplicadas
+        db.session.rollback()
+        for entrada in archivos_creadas:
+            eliminar_archivos_guardados(entrada)
+        return jsonify({'success': False, 'message': 'El lote se está sincronizando desde otra conexión, reintente'}), 409
+    
+    for respuesta_formulario in creadas:
+        if asincrono:
+            encolar_pdf_formulario(respuesta_formulario.id)
+        else:
+            pdf_path = generar_pdf_formulario(respuesta_formulario)
+            respuesta_formulario.archivo_pdf = pdf_path or None
+            respuesta_formulario.estado_pdf = 'Listo' if pdf_path else 'Error'
+            db.session.commit()
+    
+    print(f"Sincronización de {current_user.id}: {len(creadas)} respuestas nuevas de {len(respuestas)}")
+    return jsonify({'success': True, 'message': f'{len(creadas)} respuestas sincronizadas', 'resultados': resultados})
 
 @app.route('/formularios/<int:id>/descargar-pdf')
 @login_required
@@ -2612,13 +4105,22 @@ def descargar_formulario_pdf(id):
         flash('No tienes permisos para acceder a este formulario', 'error')
         return redirect(url_for('formularios'))
     
+    if respuesta_formulario.estado_pdf == 'Generando' and recuperar_pdf_abandonado(respuesta_formulario):
+        print(f"PDF de formulario {id} abandonado en 'Generando', generado de nuevo en la petición")
+    
+    if respuesta_formulario.estado_pdf == 'Generando':
+        # La página se recarga sola hasta que el proceso de fondo termina el PDF
+        return render_template('descargar_pdf_mobile.html',
+                             generando=True,
+                             formulario_nombre=respuesta_formulario.formulario.nombre,
+                             fecha=respuesta_formulario.fecha_diligenciamiento.strftime('%d/%m/%Y %H:%M'))
+    
     if not respuesta_formulario.archivo_pdf:
         flash('No se encontró el archivo PDF', 'error')
         return redirect(url_for('formularios'))
     
     # Buscar el archivo en la estructura: uploads/formularios/nombredelformulario/nombredeldocumento.pdf
-    formulario_nombre = secure_filename(respuesta_formulario.formulario.nombre)
-    pdf_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', formulario_nombre, respuesta_formulario.archivo_pdf)
+    pdf_filepath = ruta_pdf_formulario(respuesta_formulario)
     
     if not os.path.exists(pdf_filepath):
         flash('El archivo PDF no existe', 'error')
@@ -2644,8 +4146,7 @@ def descargar_formulario_pdf_file(id):
         abort(404)
     
     # Buscar el archivo en la estructura: uploads/formularios/nombredelformulario/nombredeldocumento.pdf
-    formulario_nombre = secure_filename(respuesta_formulario.formulario.nombre)
-    pdf_filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', formulario_nombre, respuesta_formulario.archivo_pdf)
+    pdf_filepath = ruta_pdf_formulario(respuesta_formulario)
     
     if not os.path.exists(pdf_filepath):
         abort(404)
@@ -2660,6 +4161,63 @@ def descargar_formulario_pdf_file(id):
         download_name=respuesta_formulario.archivo_pdf
     )
 
+def _entradas_zip_pdfs_formularios(consulta):
+    """
+    Pares (nombre en el ZIP, ruta del PDF) de las respuestas de la consulta, leídas con un cursor del
+    lado del servidor. Las respuestas sin PDF en disco se listan al final en PDF_FALTANTES.txt.
+    """
+    faltantes = []
+    for fila in db.session.execute(consulta.execution_options(stream_results=True, yield_per=500)):
+        ruta = _ruta_pdf(fila.formulario, fila.archivo_pdf) if fila.archivo_pdf else None
+        if not ruta or not os.path.isfile(ruta):
+            faltantes.append(f'{fila.id}\t{fila.formulario}\t{fila.fecha_diligenciamiento:%Y-%m-%d %H:%M}\t{fila.estado_pdf or "Sin PDF"}')
+            continue
+        nombre = f'{secure_filename(fila.formulario)}/{fila.fecha_diligenciamiento:%Y%m%d_%H%M}_{fila.id}_{secure_filename(fila.usuario or "")}.pdf'
+        yield nombre, ruta
+    if faltantes:
+        yield 'PDF_FALTANTES.txt', ('respuesta\tformulario\tfecha\testado_pdf\n' + '\n'.join(faltantes) + '\n').encode('utf-8')
+
+@app.route('/formularios/pdfs.zip')
+@login_required
+def descargar_pdfs_formularios_zip():
+    """
+    Descargar en un ZIP los PDF de las respuestas filtradas por formulario_id, usuario_id y rango
+    desde/hasta (AAAA-MM-DD, inclusivo). El ZIP se arma al vuelo leyendo los PDF desde disco.
+    """
+    try:
+        formulario_id = int(request.args['formulario_id']) if request.args.get('formulario_id') else None
+        usuario_id = int(request.args['usuario_id']) if request.args.get('usuario_id') else None
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d') if request.args.get('desde') else None
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('hasta') else None
+    except ValueError:
+        flash('Filtros de descarga no válidos', 'error')
+        return redirect(url_for('formularios'))
+    
+    # Igual que la descarga individual: los técnicos solo obtienen sus propias respuestas
+    if current_user.rol.nombre not in ['Administrador', 'Coordinador']:
+        usuario_id = current_user.id
+    
+    consulta = (
+        db.select(RespuestaFormulario.id, RespuestaFormulario.archivo_pdf, RespuestaFormulario.estado_pdf,
+                  RespuestaFormulario.fecha_diligenciamiento, Formulario.nombre.label('formulario'),
+                  User.nombre.label('usuario'))
+        .join(Formulario, Formulario.id == RespuestaFormulario.formulario_id)
+        .outerjoin(User, User.id == RespuestaFormulario.diligenciado_por)
+        .order_by(RespuestaFormulario.id)
+    )
+    if formulario_id:
+        consulta = consulta.where(RespuestaFormulario.formulario_id == formulario_id)
+    if usuario_id:
+        consulta = consulta.where(RespuestaFormulario.diligenciado_por == usuario_id)
+    if desde:
+        consulta = consulta.where(RespuestaFormulario.fecha_diligenciamiento >= desde)
+    if hasta:
+        consulta = consulta.where(RespuestaFormulario.fecha_diligenciamiento < hasta)
+    
+    response = Response(stream_with_context(iterar_zip(_entradas_zip_pdfs_formularios(consulta))), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=formularios_pdf_{datetime.now().strftime("%Y%m%d_%H%M")}.zip'
+    return response
+
 @app.route('/api/formularios/<int:id>/campos', methods=['POST'])
 @login_required
 def agregar_campo_formulario(id):
@@ -2696,6 +4254,7 @@ def agregar_campo_formulario(id):
     
     try:
         db.session.add(campo)
+        invalidar_esquema_formulario(formulario)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Campo agregado exitosamente', 'campo_id': campo.id})
     except Exception as e:
@@ -2724,6 +4283,7 @@ def gestionar_campo_formulario(id):
             campo.configuracion = json.dumps(configuracion) if configuracion else None
         
         try:
+            invalidar_esquema_formulario(campo.formulario)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Campo actualizado exitosamente'})
         except Exception as e:
@@ -2733,6 +4293,7 @@ def gestionar_campo_formulario(id):
     elif request.method == 'DELETE':
         # Eliminar campo
         try:
+            invalidar_esquema_formulario(campo.formulario)
             db.session.delete(campo)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Campo eliminado exitosamente'})
@@ -2740,6 +4301,591 @@ def gestionar_campo_formulario(id):
             db.session.rollback()
             return jsonify({'success': False, 'message': f'Error al eliminar campo: {str(e)}'})
 
+@app.route('/api/formularios/<int:id>/campos/lote', methods=['POST'])
+@login_required
+def guardar_campos_lote(id):
+    """
+    Aplica en una sola transacción el orden, las ediciones y las eliminaciones de varios campos.
+    
+    JSON: {"version": <versión cargada en el editor>, "orden": [ids en el nuevo orden],
+    "campos": [{"id", "titulo", "descripcion", "obligatorio", "configuracion"}], "eliminar": [ids]}.
+    Si algún ID no pertenece al formulario o la versión no coincide no se aplica nada.
+    """
+    if current_user.rol.nombre != 'Administrador':
+        return jsonify({'success': False, 'message': 'No tienes permisos para realizar esta acción'}), 403
+    
+    formulario = Formulario.query.get_or_404(id)
+    data = request.get_json(silent=True) or {}
+    orden = data.get('orden') or []
+    ediciones = data.get('campos') or []
+    eliminar = data.get('eliminar') or []
+    version = data.get('version')
+    
+    def es_id(valor):
+        return isinstance(valor, int) and not isinstance(valor, bool)
+    
+    if (not isinstance(orden, list) or not isinstance(eliminar, list) or not isinstance(ediciones, list)
+            or not all(isinstance(edicion, dict) for edicion in ediciones)
+            or not all(es_id(i) for i in orden + eliminar + [edicion.get('id') for edicion in ediciones])
+            or (version is not None and not es_id(version))):
+        return jsonify({'success': False, 'message': 'Formato de cambios inválido'}), 400
+    eliminar = set(eliminar)
+    
+    # Todos los campos del formulario con una consulta; los cambios se validan antes de aplicar ninguno
+    campos = {campo.id: campo for campo in CampoFormulario.query.filter_by(formulario_id=id)}
+    ids_recibidos = set(orden) | eliminar | {edicion['id'] for edicion in ediciones}
+    if not ids_recibidos <= campos.keys():
+        return jsonify({'success': False, 'message': 'Hay campos que no pertenecen a este formulario'}), 400
+    # El orden debe nombrar cada campo que queda exactamente una vez
+    if orden and (len(orden) != len(set(orden)) or set(orden) - eliminar != campos.keys() - eliminar):
+        return jsonify({'success': False, 'message': 'El orden debe incluir todos los campos del formulario una sola vez'}), 400
+    for edicion in ediciones:
+        if not isinstance(edicion.get('titulo', ''), str) or not isinstance(edicion.get('descripcion') or '', str):
+            return jsonify({'success': False, 'message': 'El título y la descripción deben ser texto'}), 400
+        if not edicion.get('titulo', campos[edicion['id']].titulo).strip():
+            return jsonify({'success': False, 'message': 'El título del campo es obligatorio'}), 400
+    if not ids_recibidos:
+        return jsonify({'success': True, 'message': 'Sin cambios', 'version': formulario.version or 1})
+    
+    try:
+        # La versión se comprueba e incrementa en la misma sentencia: si otra pestaña o usuario
+        # guardó desde que se cargó el editor no se actualiza ninguna fila y no se aplica nada
+        actualizacion = db.update(Formulario).where(Formulario.id == id).values(version=db.func.coalesce(Formulario.version, 1) + 1)
+        if version is not None:
+            actualizacion = actualizacion.where(db.func.coalesce(Formulario.version, 1) == version)
+        if db.session.execute(actualizacion, execution_options={'synchronize_session': False}).rowcount != 1:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': 'El formulario fue modificado en otra sesión. Recarga la página.'}), 409
+        
+        for edicion in ediciones:
+            campo = campos[edicion['id']]
+            if 'titulo' in edicion:
+                campo.titulo = edicion['titulo'].strip()
+            if 'descripcion' in edicion:
+                campo.descripcion = (edicion['descripcion'] or '').strip()
+            if 'obligatorio' in edicion:
+                campo.obligatorio = bool(edicion['obligatorio'])
+            if edicion.get('configuracion') is not None:
+                campo.configuracion = json.dumps(edicion['configuracion']) if edicion['configuracion'] else None
+        
+        # El unit of work solo emite UPDATE para los campos cuyo orden cambió
+        for posicion, campo_id in enumerate([i for i in orden if i not in eliminar], 1):
+            campos[campo_id].orden = posicion
+        
+        for campo_id in eliminar:
+            db.session.delete(campos[campo_id])
+        
+        db.session.commit()
+        db.session.refresh(formulario)
+        return jsonify({'success': True, 'message': 'Cambios guardados', 'version': formulario.version})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error al guardar los campos: {str(e)}'}), 500
+
+# ==================== EXPORTACIÓN DE RESPUESTAS DE FORMULARIOS ====================
+
+# Columnas de cada respuesta que preceden a las columnas de los campos
+COLUMNAS_EXPORTACION = ['respuesta_id', 'id_cliente', 'fecha_diligenciamiento', 'diligenciado_por', 'estado']
+# Bytes de texto que se acumulan antes de entregar un fragmento al cliente
+TAMANO_FRAGMENTO_EXPORTACION = 64 * 1024
+
+def _campos_exportables(formulario):
+    """Campos con respuesta del esquema actual y el nombre de su columna (títulos repetidos con el ID)"""
+    campos = [campo for campo in obtener_esquema_formulario(formulario).campos if campo.tipo_campo != 'texto_informativo']
+    titulos = [campo.titulo for campo in campos]
+    return [(campo, campo.titulo if titulos.count(campo.titulo) == 1 else f'{campo.titulo} ({campo.id})')
+            for campo in campos]
+
+def _valor_exportado(tipo_campo, fila, estructurado):
+    """Valor de una respuesta de campo; estructurado conserva listas y objetos (NDJSON), si no, texto (CSV)"""
+    if tipo_campo == 'fecha':
+        return fila.valor_fecha.strftime('%Y-%m-%d') if fila.valor_fecha else None
+    if tipo_campo == 'foto':
+        fotos = [nombre for nombre in (fila.valor_archivo or '').split(',') if nombre]
+        return fotos if estructurado else ','.join(fotos)
+    if tipo_campo == 'firma':
+        if not (fila.valor_archivo or fila.valor_json):
+            return None
+        if not estructurado:
+            return fila.nombre_firmante or 'Firmado'
+        return {
+            'nombre': fila.nombre_firmante,
+            'documento': fila.documento_firmante,
+            'telefono': fila.telefono_firmante,
+            'empresa': fila.empresa_firmante,
+            'cargo': fila.cargo_firmante
+        }
+    return fila.valor_texto
+
+def iterar_respuestas_exportacion(formulario, campos, estructurado):
+    """
+    Recorre las respuestas del formulario y entrega (fila de la respuesta, {campo_id: valor}).
+    Una sola consulta ordenada por respuesta trae también los valores de los campos y se lee con
+    un cursor del lado del servidor en lotes de EXPORTACION_FILAS_POR_LOTE filas, de modo que la
+    memoria no depende del número de respuestas.
+    """
+    tipos = {campo.id: campo.tipo_campo for campo, _ in campos}
+    consulta = (
+        db.select(RespuestaFormulario.id, RespuestaFormulario.id_cliente, RespuestaFormulario.fecha_diligenciamiento,
+                  RespuestaFormulario.estado, User.nombre.label('usuario'), RespuestaCampo.campo_id,
+                  *[getattr(RespuestaCampo, columna) for columna in COLUMNAS_VALOR_RESPUESTA])
+        .outerjoin(User, User.id == RespuestaFormulario.diligenciado_por)
+        .outerjoin(RespuestaCampo, RespuestaCampo.respuesta_formulario_id == RespuestaFormulario.id)
+        .where(RespuestaFormulario.formulario_id == formulario.id)
+        .order_by(RespuestaFormulario.id)
+        .execution_options(stream_results=True, yield_per=app.config['EXPORTACION_FILAS_POR_LOTE'])
+    )
+    # Las filas de una misma respuesta llegan seguidas: se pivotan y se descartan antes de leer la siguiente
+    for _, filas in groupby(db.session.execute(consulta), key=attrgetter('id')):
+        valores = {}
+        for fila in filas:
+            if fila.campo_id in tipos:
+                valores[fila.campo_id] = _valor_exportado(tipos[fila.campo_id], fila, estructurado)
+        yield fila, valores
+
+def _en_fragmentos(lineas):
+    """Agrupa las líneas en fragmentos de ~TAMANO_FRAGMENTO_EXPORTACION para no escribir una vez por respuesta"""
+    pendientes, tamano = [], 0
+    for linea in lineas:
+        pendientes.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_FRAGMENTO_EXPORTACION:
+            yield ''.join(pendientes).encode('utf-8')
+            pendientes, tamano = [], 0
+    if pendientes:
+        yield ''.join(pendientes).encode('utf-8')
+
+def iterar_csv_respuestas(formulario):
+    """Líneas CSV de las respuestas: una fila por respuesta y una columna por campo"""
+    campos = _campos_exportables(formulario)
+    salida = io.StringIO()
+    writer = csv.writer(salida)
+    
+    def linea(valores):
+        writer.writerow(valores)
+        texto = salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+        return texto
+    
+    # BOM para que Excel reconozca UTF-8, como en construir_csv
+    yield '\ufeff' + linea(COLUMNAS_EXPORTACION + [nombre for _, nombre in campos])
+    for respuesta, valores in iterar_respuestas_exportacion(formulario, campos, False):
+        yield linea([
+            respuesta.id,
+            respuesta.id_cliente or '',
+            respuesta.fecha_diligenciamiento.strftime('%Y-%m-%d %H:%M') if respuesta.fecha_diligenciamiento else '',
+            respuesta.usuario or '',
+            respuesta.estado or ''
+        ] + [valores.get(campo.id) or '' for campo, _ in campos])
+
+def iterar_ndjson_respuestas(formulario):
+    """Líneas NDJSON de las respuestas: un objeto por respuesta con sus campos por título"""
+    campos = _campos_exportables(formulario)
+    for respuesta, valores in iterar_respuestas_exportacion(formulario, campos, True):
+        yield json.dumps({
+            'respuesta_id': respuesta.id,
+            'id_cliente': respuesta.id_cliente,
+            'fecha_diligenciamiento': respuesta.fecha_diligenciamiento.isoformat() if respuesta.fecha_diligenciamiento else None,
+            'diligenciado_por': respuesta.usuario,
+            'estado': respuesta.estado,
+            'campos': {nombre: valores.get(campo.id) for campo, nombre in campos}
+        }, ensure_ascii=False) + '\n'
+
+@app.route('/formularios/<int:id>/exportar')
+@login_required
+def exportar_respuestas_formulario(id):
+    """Exportar todas las respuestas de un formulario en CSV o NDJSON - solo administradores"""
+    if current_user.rol.nombre != 'Administrador':
+        flash('No tienes permisos para realizar esta acción', 'error')
+        return redirect(url_for('formularios'))
+    
+    formulario = Formulario.query.get_or_404(id)
+    formato = request.args.get('formato', 'csv')
+    if formato == 'csv':
+        lineas, mimetype = iterar_csv_respuestas(formulario), 'text/csv; charset=utf-8'
+    elif formato == 'ndjson':
+        lineas, mimetype = iterar_ndjson_respuestas(formulario), 'application/x-ndjson'
+    else:
+        flash('Formato de exportación no válido', 'error')
+        return redirect(url_for('formularios'))
+    
+    # La consulta se ejecuta mientras se envía la respuesta: se conserva el contexto de la petición
+    response = Response(stream_with_context(_en_fragmentos(lineas)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=respuestas_formulario_{formulario.id}_{datetime.now().strftime("%Y%m%d_%H%M")}.{formato}'
+    return response
+
+# ==================== BÚSQUEDA EN RESPUESTAS DE FORMULARIOS ====================
+
+# Los predicados de cada campo se traducen a una subconsulta sobre respuesta_campo que recorre
+# el índice (campo_id, valor_texto) o (campo_id, valor_fecha); la base de datos intersecta las
+# respuestas y pagina por ID, sin cargar en Python las respuestas que no cumplen.
+OPERADORES_BUSQUEDA = {
+    '=': lambda columna, valor: columna == valor,
+    '!=': lambda columna, valor: columna != valor,
+    '<': lambda columna, valor: columna < valor,
+    '<=': lambda columna, valor: columna <= valor,
+    '>': lambda columna, valor: columna > valor,
+    '>=': lambda columna, valor: columna >= valor,
+    # Solo el prefijo aprovecha el índice; "contiene" recorre los valores del campo
+    'empieza': lambda columna, valor: columna.startswith(valor, autoescape=True),
+    'contiene': lambda columna, valor: columna.contains(valor, autoescape=True)
+}
+OPERADORES_FECHA = ('=', '!=', '<', '<=', '>', '>=')
+TIPOS_BUSQUEDA_TEXTO = ('texto', 'textarea', 'seleccion', 'seleccion_multiple')
+BUSQUEDA_LIMITE_MAX = 500
+
+def _campo_busqueda(formulario, referencia):
+    """Campo del esquema por ID o por título (sin distinguir mayúsculas)"""
+    for campo in obtener_esquema_formulario(formulario).campos:
+        if str(campo.id) == referencia or campo.titulo.strip().lower() == referencia.strip().lower():
+            return campo
+    raise ValueError(f'El formulario no tiene el campo "{referencia}"')
+
+def condicion_busqueda(campo, operador, valor):
+    """Condición sobre el valor de RespuestaCampo para un predicado campo-operador-valor"""
+    if operador not in OPERADORES_BUSQUEDA:
+        raise ValueError(f'Operador no válido: {operador}')
+    if campo.tipo_campo == 'fecha':
+        if operador not in OPERADORES_FECHA:
+            raise ValueError(f'El operador "{operador}" no aplica al campo de fecha "{campo.titulo}"')
+        try:
+            valor = datetime.strptime(valor, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f'Fecha no válida para "{campo.titulo}": use AAAA-MM-DD')
+        columna = RespuestaCampo.valor_fecha
+    elif campo.tipo_campo in TIPOS_BUSQUEDA_TEXTO:
+        columna = RespuestaCampo.valor_texto
+    else:
+        raise ValueError(f'El campo "{campo.titulo}" no admite búsqueda')
+    return OPERADORES_BUSQUEDA[operador](columna, valor)
+
+def buscar_respuestas_formulario(formulario, predicados, despues=0, limite=100, usuario_id=None):
+    """
+    Respuestas del formulario que cumplen todos los predicados (campo, operador, valor), en orden de ID
+    a partir de 'despues'. Con usuario_id se limita a las respuestas diligenciadas por ese usuario.
+    """
+    # Un rango (>= y <) sobre el mismo campo va en una sola subconsulta: un recorrido acotado del índice
+    por_campo = {}
+    for referencia, operador, valor in predicados:
+        campo = _campo_busqueda(formulario, referencia)
+        por_campo.setdefault(campo.id, []).append(condicion_busqueda(campo, operador, valor))
+    condiciones = [
+        RespuestaFormulario.id.in_(
+            db.select(RespuestaCampo.respuesta_formulario_id).where(RespuestaCampo.campo_id == campo_id, *valores)
+        )
+        for campo_id, valores in por_campo.items()
+    ]
+    if usuario_id is not None:
+        condiciones.append(RespuestaFormulario.diligenciado_por == usuario_id)
+    consulta = (
+        db.select(RespuestaFormulario.id, RespuestaFormulario.fecha_diligenciamiento, RespuestaFormulario.estado,
+                  RespuestaFormulario.estado_pdf, User.nombre.label('usuario'))
+        .outerjoin(User, User.id == RespuestaFormulario.diligenciado_por)
+        .where(RespuestaFormulario.formulario_id == formulario.id, RespuestaFormulario.id > despues, *condiciones)
+        .order_by(RespuestaFormulario.id)
+        .limit(limite)
+    )
+    return db.session.execute(consulta).all()
+
+@app.route('/api/formularios/<int:id>/respuestas')
+@login_required
+def api_buscar_respuestas(id):
+    """
+    Busca respuestas de un formulario por el valor de sus campos.
+    
+    Cada parámetro 'f' es un predicado "<campo>:<operador>:<valor>", donde campo es el ID o el título
+    y operador uno de =, !=, <, <=, >, >=, empieza, contiene (fechas en AAAA-MM-DD). Los predicados se
+    combinan con Y. La página siguiente se pide con despues=<siguiente>.
+    Ejemplo: /api/formularios/3/respuestas?f=Estado del equipo:=:Falla&f=Fecha:>=:2024-01-01
+    """
+    formulario = Formulario.query.get_or_404(id)
+    try:
+        predicados = []
+        for texto in request.args.getlist('f'):
+            campo, operador, valor = texto.split(':', 2)
+            predicados.append((campo, operador, valor))
+        despues = int(request.args.get('despues', 0))
+        limite = max(1, min(int(request.args.get('limite', 100)), BUSQUEDA_LIMITE_MAX))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Parámetros no válidos: use f=<campo>:<operador>:<valor>'}), 400
+    
+    # Igual que con las incidencias: administradores y coordinadores ven todo, los demás solo lo suyo
+    usuario_id = None if current_user.rol.nombre in ['Administrador', 'Coordinador'] else current_user.id
+    try:
+        filas = buscar_respuestas_formulario(formulario, predicados, despues, limite + 1, usuario_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'respuestas': [{
+            'id': fila.id,
+            'fecha_diligenciamiento': fila.fecha_diligenciamiento.isoformat() if fila.fecha_diligenciamiento else None,
+            'diligenciado_por': fila.usuario,
+            'estado': fila.estado,
+            'estado_pdf': fila.estado_pdf,
+            'pdf': url_for('descargar_formulario_pdf', id=fila.id)
+        } for fila in filas[:limite]],
+        'siguiente': filas[limite - 1].id if len(filas) > limite else None
+    })
+
+# ==================== FIRMAS DIGITALES ====================
+
+# Las firmas se decodifican una sola vez al recibir el formulario y se guardan como PNG canónico
+FIRMAS_SUBCARPETA = os.path.join('formularios', 'firmas')
+FirmaPDF = namedtuple('FirmaPDF', ['ruta', 'ancho', 'alto', 'png_gris'])
+
+def es_firma_base64(valor):
+    """Las respuestas antiguas guardaban el data URL/base64 de la firma en lugar de la ruta del PNG"""
+    return bool(valor) and not valor.lower().endswith('.png')
+
+FIRMA_UMBRAL_TINTA = 160  # gris por debajo del cual un píxel se considera tinta
+FIRMA_MARGEN = 8  # píxeles de blanco que se conservan alrededor de la tinta
+FIRMA_TAMANO_MAX = (400, 200)  # resolución máxima del PNG guardado (la del canvas)
+
+def normalizar_imagen_firma(fuente):
+    """
+    Abre la imagen de una firma (ruta o archivo binario) y la normaliza: fondo blanco, recorte
+    al rectángulo de la tinta más un margen, tamaño máximo fijo y 1 bit por píxel.
+    """
+    with PILImage.open(fuente) as img:
+        img = img.convert('RGBA')
+    fondo = PILImage.new('RGB', img.size, (255, 255, 255))
+    fondo.paste(img, mask=img.getchannel('A'))
+    gris = fondo.convert('L')
+    
+    # Recortar el espacio en blanco alrededor de la tinta
+    caja = gris.point(lambda v: 255 if v < FIRMA_UMBRAL_TINTA else 0).getbbox()
+    if caja:
+        izquierda, arriba, derecha, abajo = caja
+        gris = gris.crop((
+            max(izquierda - FIRMA_MARGEN, 0),
+            max(arriba - FIRMA_MARGEN, 0),
+            min(derecha + FIRMA_MARGEN, gris.width),
+            min(abajo + FIRMA_MARGEN, gris.height)
+        ))
+    gris.thumbnail(FIRMA_TAMANO_MAX, PILImage.LANCZOS)
+    
+    # Umbral sin tramado: trazos negros puros sobre blanco
+    return gris.point(lambda v: 0 if v < FIRMA_UMBRAL_TINTA else 255, '1')
+
+def decodificar_firma(firma_data):
+    """
+    Decodifica una firma en base64 (con o sin prefijo data URL) y la normaliza.
+    Tolera saltos de línea, espacios y padding incompleto.
+    """
+    encoded = firma_data.split(',', 1)[1] if ',' in firma_data else firma_data
+    encoded = re.sub(r'[^A-Za-z0-9+/]', '', encoded)
+    encoded += '=' * (-len(encoded) % 4)
+    image_bytes = base64.b64decode(encoded)
+    if not image_bytes:
+        raise ValueError('Firma vacía')
+    return normalizar_imagen_firma(io.BytesIO(image_bytes))
+
+def guardar_firma(firma, campo_id, respuesta_id, png_filename=None):
+    """
+    Guarda el PNG canónico de la firma enviada y retorna su ruta relativa a UPLOAD_FOLDER.
+    firma es la parte binaria del multipart (FileStorage) o, en clientes antiguos, el data URL en base64.
+    png_filename fija el nombre del archivo (por defecto lleva la fecha y hora).
+    """
+    if isinstance(firma, str):
+        imagen = decodificar_firma(firma)
+    else:
+        # Parte binaria: PIL lee directamente del stream que Werkzeug dejó en disco o memoria
+        imagen = normalizar_imagen_firma(firma.stream)
+    
+    firmas_dir = os.path.join(app.config['UPLOAD_FOLDER'], FIRMAS_SUBCARPETA)
+    os.makedirs(firmas_dir, exist_ok=True)
+    png_filename = png_filename or f'firma_{campo_id}_{respuesta_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
+    # Escritura atómica: dos renderizados de la misma firma heredada pueden escribir el mismo nombre
+    temporal = os.path.join(firmas_dir, f'.{png_filename}.{uuid.uuid4().hex}')
+    imagen.save(temporal, format='PNG', optimize=True)
+    os.replace(temporal, os.path.join(firmas_dir, png_filename))
+    
+    return os.path.join(FIRMAS_SUBCARPETA, png_filename)
+
+@lru_cache(maxsize=1024)
+def _leer_firma(ruta, modificado):
+    """
+    Dimensiones de un PNG de firma; la fecha de modificación invalida la caché si el archivo cambia.
+    ReportLab incrusta las imágenes de 1 bit como RGB, así que para el PDF se guarda en caché una
+    copia en escala de grises (un solo canal, pocos KB) en lugar de usar el archivo directamente.
+    """
+    with PILImage.open(ruta) as img:
+        png_gris = None
+        if img.mode == '1':
+            buffer = io.BytesIO()
+            img.convert('L').save(buffer, format='PNG', optimize=True)
+            png_gris = buffer.getvalue()
+        return FirmaPDF(ruta, img.width, img.height, png_gris)
+
+def obtener_firma_pdf(respuesta_campo):
+    """
+    Firma lista para los PDF (ruta absoluta y dimensiones) servida desde caché, sin decodificar nada.
+    Una firma antigua en base64 se convierte a PNG la primera vez; el cambio de valor_archivo queda
+    en la sesión para el siguiente commit. El nombre del PNG se deriva del contenido, de modo que si
+    quien llama no confirma, los siguientes renderizados reutilizan el mismo archivo.
+    Retorna None si no hay una firma utilizable.
+    """
+    valor = respuesta_campo.valor_archivo
+    if not valor:
+        return None
+    
+    if es_firma_base64(valor):
+        png_filename = (f'firma_{respuesta_campo.campo_id}_{respuesta_campo.respuesta_formulario_id}_'
+                        f'{hashlib.sha256(valor.encode()).hexdigest()[:16]}.png')
+        try:
+            if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], FIRMAS_SUBCARPETA, png_filename)):
+                valor = os.path.join(FIRMAS_SUBCARPETA, png_filename)
+            else:
+                valor = guardar_firma(valor, respuesta_campo.campo_id, respuesta_campo.respuesta_formulario_id, png_filename)
+        except Exception as e:
+            print(f"Error decodificando firma del campo {respuesta_campo.campo_id}: {e}")
+            return None
+        respuesta_campo.valor_archivo = valor
+    
+    ruta = os.path.abspath(valor if os.path.isabs(valor) else os.path.join(app.config['UPLOAD_FOLDER'], valor))
+    try:
+        return _leer_firma(ruta, os.path.getmtime(ruta))
+    except OSError as e:
+        print(f"Firma no disponible {ruta}: {e}")
+        return None
+
+def normalizar_firmas_heredadas():
+    """
+    Convierte a PNG canónico las firmas de versiones anteriores: las guardadas en base64 y los
+    PNG sin recortar ni cuantizar. Retorna cuántas cambió.
+    """
+    respuestas = RespuestaCampo.query.join(CampoFormulario).filter(
+        CampoFormulario.tipo_campo == 'firma',
+        RespuestaCampo.valor_archivo.isnot(None)
+    ).all()
+    
+    convertidas = 0
+    for respuesta_campo in respuestas:
+        if es_firma_base64(respuesta_campo.valor_archivo):
+            if obtener_firma_pdf(respuesta_campo) is not None:
+                convertidas += 1
+            continue
+        
+        ruta = os.path.join(app.config['UPLOAD_FOLDER'], respuesta_campo.valor_archivo)
+        try:
+            with PILImage.open(ruta) as img:
+                if img.mode == '1':
+                    continue
+            normalizar_imagen_firma(ruta).save(ruta, format='PNG', optimize=True)
+            convertidas += 1
+        except OSError as e:
+            print(f"Firma no normalizada {ruta}: {e}")
+    db.session.commit()
+    return convertidas
+
+# Firmas capturadas como trazos: {"ancho", "alto", "trazos": [[[x, y, t_ms], ...], ...]}
+GROSOR_TRAZO_FIRMA = 2  # grosor del trazo en el canvas, en píxeles
+MAX_PUNTOS_FIRMA = 5000
+MAX_BYTES_TRAZOS_FIRMA = 256 * 1024
+
+def normalizar_trazos_firma(trazos_data):
+    """
+    Valida los trazos enviados por el canvas y retorna el JSON compacto que se guarda en valor_json.
+    Coordenadas con un decimal dentro del lienzo y tiempos en milisegundos; ValueError si no es válido.
+    """
+    if len(trazos_data) > MAX_BYTES_TRAZOS_FIRMA:
+        raise ValueError('Trazos de firma demasiado grandes')
+    
+    datos = json.loads(trazos_data)
+    ancho = float(datos['ancho'])
+    alto = float(datos['alto'])
+    if not (0 < ancho <= 4000 and 0 < alto <= 4000):
+        raise ValueError('Dimensiones de firma no válidas')
+    
+    trazos = []
+    total_puntos = 0
+    for trazo in datos['trazos']:
+        puntos = []
+        for punto in trazo:
+            x = min(max(float(punto[0]), 0), ancho)
+            y = min(max(float(punto[1]), 0), alto)
+            t = int(punto[2]) if len(punto) > 2 else 0
+            puntos.append([round(x, 1), round(y, 1), max(t, 0)])
+        if puntos:
+            trazos.append(puntos)
+            total_puntos += len(puntos)
+    
+    if not trazos:
+        raise ValueError('Firma sin trazos')
+    if total_puntos > MAX_PUNTOS_FIRMA:
+        raise ValueError('Firma con demasiados puntos')
+    
+    return json.dumps({'ancho': ancho, 'alto': alto, 'trazos': trazos}, separators=(',', ':'))
+
+def obtener_trazos_firma(respuesta_campo):
+    """Trazos de la firma guardados en valor_json, o None si la firma se guardó como imagen"""
+    if not respuesta_campo.valor_json:
+        return None
+    try:
+        datos = json.loads(respuesta_campo.valor_json)
+    except ValueError:
+        return None
+    return datos if isinstance(datos, dict) and datos.get('trazos') else None
+
+class FirmaVectorial(Flowable):
+    """Firma capturada como trazos, dibujada con trazados vectoriales (nítida a cualquier tamaño)"""
+    
+    def __init__(self, firma, ancho, alto):
+        Flowable.__init__(self)
+        self.firma = firma
+        self.escala = min(ancho / firma['ancho'], alto / firma['alto'])
+        self.width = firma['ancho'] * self.escala
+        self.height = firma['alto'] * self.escala
+    
+    def draw(self):
+        canvas = self.canv
+        escala = self.escala
+        alto = self.firma['alto']
+        grosor = max(GROSOR_TRAZO_FIRMA * escala, 0.5)
+        
+        canvas.saveState()
+        canvas.setStrokeColor(colors.black)
+        canvas.setFillColor(colors.black)
+        canvas.setLineWidth(grosor)
+        canvas.setLineCap(1)
+        canvas.setLineJoin(1)
+        for trazo in self.firma['trazos']:
+            # El canvas HTML tiene el origen arriba a la izquierda; el PDF abajo a la izquierda
+            puntos = [(punto[0] * escala, (alto - punto[1]) * escala) for punto in trazo]
+            if len(puntos) == 1:
+                canvas.circle(puntos[0][0], puntos[0][1], grosor / 2, stroke=0, fill=1)
+                continue
+            trazado = canvas.beginPath()
+            trazado.moveTo(*puntos[0])
+            for x, y in puntos[1:]:
+                trazado.lineTo(x, y)
+            canvas.drawPath(trazado, stroke=1, fill=0)
+        canvas.restoreState()
+
+def firma_flowable_pdf(respuesta_campo, ancho_max, alto_max=None):
+    """
+    Elemento del PDF con la firma de la respuesta ajustado a ancho_max x alto_max:
+    trazos vectoriales si se capturó así, o el PNG canónico desde la caché. None si no hay firma.
+    """
+    trazos = obtener_trazos_firma(respuesta_campo)
+    if trazos is not None:
+        return FirmaVectorial(trazos, ancho_max, alto_max or ancho_max * trazos['alto'] / trazos['ancho'])
+    
+    firma = obtener_firma_pdf(respuesta_campo)
+    if firma is None:
+        return None
+    escala = ancho_max / firma.ancho
+    if alto_max:
+        escala = min(escala, alto_max / firma.alto)
+    contar_imagen_pdf()
+    fuente = io.BytesIO(firma.png_gris) if firma.png_gris else firma.ruta
+    return Image(fuente, width=firma.ancho * escala, height=firma.alto * escala)
+
+@instrumentar_pdf('formulario_simple')
+@espacio_trabajo_pdf()
 def generar_pdf_simple(respuesta_formulario):
     """Generar PDF del formulario diligenciado - VERSIÓN SIMPLIFICADA"""
     try:
@@ -2759,31 +4905,9 @@ def generar_pdf_simple(respuesta_formulario):
             bottomMargin=apa_margin,
         )
         
-        styles = getSampleStyleSheet()
+        styles = estilos_pdf()
         story = []
         
-        # Registrar Calibri si está disponible; fallback a Helvetica
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            import os
-            calibri_paths = [
-                r"C:\\Windows\\Fonts\\calibri.ttf",
-                r"C:\\Windows\\Fonts\\Calibri.ttf",
-            ]
-            for p in calibri_paths:
-                if os.path.exists(p):
-                    pdfmetrics.registerFont(TTFont('Calibri', p))
-                    break
-            registered_fonts = set()
-            try:
-                registered_fonts = set(pdfmetrics.getRegisteredFontNames())
-            except Exception:
-                pass
-            use_calibri = 'Calibri' in registered_fonts
-        except Exception:
-            use_calibri = False
-
         # Estilos simples
         title_style = ParagraphStyle(
             'CustomTitle',
@@ -2792,7 +4916,7 @@ def generar_pdf_simple(respuesta_formulario):
             spaceAfter=20,
             alignment=1,
             textColor=colors.HexColor('#2c3e50'),
-            fontName='Helvetica-Bold'
+            fontName=FUENTES_PDF['bold']
         )
         
         field_style = ParagraphStyle(
@@ -2801,7 +4925,7 @@ def generar_pdf_simple(respuesta_formulario):
             fontSize=11,
             spaceAfter=10,
             spaceBefore=5,
-            fontName=('Calibri' if use_calibri else 'Helvetica'),
+            fontName=FUENTES_PDF['normal'],
             textColor=colors.HexColor('#2c3e50')
         )
         
@@ -2810,7 +4934,7 @@ def generar_pdf_simple(respuesta_formulario):
             parent=styles['Normal'],
             fontSize=11,
             spaceAfter=15,
-            fontName=('Calibri' if use_calibri else 'Helvetica'),
+            fontName=FUENTES_PDF['normal'],
             textColor=colors.HexColor('#34495e'),
             leftIndent=20
         )
@@ -2832,9 +4956,9 @@ def generar_pdf_simple(respuesta_formulario):
             ('ALIGN', (2, 0), (2, 0), 'RIGHT'),
             ('VALIGN', (0, 0), (-1, -1), 'TOP'),
             ('FONTSIZE', (1, 0), (1, 0), 16),
-            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
             ('FONTSIZE', (2, 0), (2, 0), 10),
-            ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+            ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
             ('LINEBELOW', (0, 0), (-1, -1), 2, colors.black),
         ]))
         
@@ -2846,11 +4970,10 @@ def generar_pdf_simple(respuesta_formulario):
             desc = getattr(respuesta_formulario.formulario, 'descripcion', '') or ''
             if isinstance(desc, str) and desc.strip():
                 desc_html = escape(desc).replace('\n', '<br/>')
-                from reportlab.lib.styles import ParagraphStyle
                 desc_style = ParagraphStyle(
                     name='DescStyle',
                     parent=styles['Normal'],
-                    fontName='Helvetica',
+                    fontName=FUENTES_PDF['normal'],
                     fontSize=10,
                     leading=13,
                     textColor=colors.HexColor('#34495e'),
@@ -2894,7 +5017,7 @@ def generar_pdf_simple(respuesta_formulario):
             elif campo.tipo_campo == 'fecha':
                 valor = respuesta_campo.valor_fecha.strftime('%d/%m/%Y') if respuesta_campo.valor_fecha else "Sin fecha"
             elif campo.tipo_campo == 'firma':
-                if respuesta_campo.valor_archivo:
+                if respuesta_campo.valor_archivo or respuesta_campo.valor_json:
                     # Información del firmante
                     info_firmante = []
                     if hasattr(respuesta_campo, 'nombre_firmante') and respuesta_campo.nombre_firmante:
@@ -2910,120 +5033,29 @@ def generar_pdf_simple(respuesta_formulario):
                     
                     valor = "<br/>".join(info_firmante) if info_firmante else "Firma digital registrada"
                     
-                    # Agregar la imagen de la firma (SIMPLIFICADO COMO INCIDENCIAS)
-                    try:
-                        import base64
-                        print(f"DEBUG SIMPLE: Procesando firma para campo {campo.id}")
-                        print(f"DEBUG SIMPLE: Valor archivo length: {len(respuesta_campo.valor_archivo) if respuesta_campo.valor_archivo else 0}")
-                        
-                        if respuesta_campo.valor_archivo.startswith('data:image'):
-                            firma_data = respuesta_campo.valor_archivo.split(',')[1]
-                            print(f"DEBUG SIMPLE: Firma en formato data:image detectada")
-                        else:
-                            firma_data = respuesta_campo.valor_archivo
-                            print(f"DEBUG SIMPLE: Firma en formato base64 directo")
-                        
-                        # Limpiar y agregar padding
-                        firma_data = firma_data.strip()
-                        missing_padding = len(firma_data) % 4
-                        if missing_padding:
-                            firma_data += '=' * (4 - missing_padding)
-                        
-                        try:
-                            print(f"DEBUG SIMPLE: Intentando decodificar base64...")
-                            firma_bytes = base64.b64decode(firma_data)
-                            print(f"DEBUG SIMPLE: Base64 decodificado exitosamente, tamaño: {len(firma_bytes)} bytes")
-                            
-                            # Validar que el archivo no esté vacío
-                            if len(firma_bytes) == 0:
-                                raise ValueError("Archivo de firma vacío")
-                                
-                            # Validar que tenga el header de imagen PNG
-                            if not firma_bytes.startswith(b'\x89PNG'):
-                                print(f"DEBUG SIMPLE: Advertencia - El archivo no parece ser PNG válido")
-                                
-                        except Exception as decode_error:
-                            print(f"ERROR SIMPLE: Error decodificando base64: {decode_error}")
-                            error_text = f"<b>Error:</b> Datos de firma inválidos o corruptos"
-                            error_paragraph = Paragraph(error_text, value_style)
-                            story.append(error_paragraph)
-                            continue
+                    # Agregar la firma (trazos vectoriales o PNG desde la caché) en un recuadro de 6x4 cm
+                    pdf_image = firma_flowable_pdf(respuesta_campo, 6 * 28.35, 4 * 28.35)
+                    if pdf_image is None:
+                        story.append(Paragraph("<b>Error:</b> Imagen de firma no válida o corrupta", value_style))
+                    else:
+                        # Agregar espacio antes de la imagen
+                        story.append(Spacer(1, 10))
                         
-                        # Crear imagen temporal
-                        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_firma_{campo.id}.png')
-                        with open(temp_path, 'wb') as f:
-                            f.write(firma_bytes)
+                        # Crear leyenda mejorada
+                        caption_text = f"Firma Digital - {campo.titulo}"
+                        caption = Paragraph(caption_text, value_style)
+                        story.append(caption)
                         
-                        print(f"DEBUG SIMPLE: Archivo temporal creado: {temp_path}")
+                        # Crear tabla para centrar la imagen con borde
+                        image_table = Table([[pdf_image]], colWidths=[pdf_image.width])
+                        image_table.setStyle(TableStyle([
+                            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+                            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+                            ('BOX', (0, 0), (0, 0), 1, colors.HexColor('#bdc3c7')),
+                            ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#f8f9fa')),
+                        ]))
                         
-                        # Procesar imagen EXACTAMENTE como en incidencias
-                        try:
-                            with PILImage.open(temp_path) as img:
-                                print(f"DEBUG SIMPLE: Imagen abierta exitosamente - Dimensiones: {img.width}x{img.height}")
-                                # Verificar que la imagen se puede cargar completamente
-                                img.verify()
-                                print(f"DEBUG SIMPLE: Imagen verificada exitosamente")
-                                
-                                # Reabrir la imagen después de verify() (verify() cierra el archivo)
-                                img = PILImage.open(temp_path)
-                                
-                            # Calcular dimensiones para visualización (sin redimensionar la imagen)
-                            max_width_cm = 3  # cm
-                            max_height_cm = 2  # cm
-                            max_width_points = max_width_cm * 28.35  # convertir cm a puntos
-                            max_height_points = max_height_cm * 28.35
-                            
-                            if img.width > max_width_points or img.height > max_height_points:
-                                ratio = min(max_width_points/img.width, max_height_points/img.height)
-                                new_width = int(img.width * ratio)
-                                new_height = int(img.height * ratio)
-                            else:
-                                new_width = img.width
-                                new_height = img.height
-                            
-                            # Guardar imagen temporalmente con máxima calidad y DPI original
-                            img.save(temp_path, quality=100, optimize=False)
-                            
-                            # Agregar espacio antes de la imagen
-                            story.append(Spacer(1, 10))
-                            
-                            # Crear leyenda mejorada
-                            caption_text = f"Firma Digital - {campo.titulo}"
-                            caption = Paragraph(caption_text, value_style)
-                            story.append(caption)
-                            
-                            # Agregar imagen centrada con borde usando dimensiones más grandes para mejor resolución
-                            pdf_image = Image(temp_path, width=new_width*2, height=new_height*2)
-                            
-                            # Crear tabla para centrar la imagen con borde
-                            image_table = Table([[pdf_image]], colWidths=[new_width*2])
-                            image_table.setStyle(TableStyle([
-                                ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                                ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                                ('BOX', (0, 0), (0, 0), 1, colors.HexColor('#bdc3c7')),
-                                ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#f8f9fa')),
-                            ]))
-                            
-                            story.append(image_table)
-                            
-                            # NO eliminar archivo temporal aquí - se eliminará después de generar el PDF
-                            
-                        except PILImage.UnidentifiedImageError as img_error:
-                            print(f"ERROR SIMPLE: Imagen no identificada para firma {campo.id}: {img_error}")
-                            error_text = f"<b>Error:</b> Imagen de firma no válida o corrupta"
-                            error_paragraph = Paragraph(error_text, value_style)
-                            story.append(error_paragraph)
-                            continue
-                        except Exception as img_error:
-                            print(f"ERROR SIMPLE: Error verificando imagen de firma {campo.id}: {img_error}")
-                            error_text = f"<b>Error:</b> Imagen de firma corrupta o incompleta"
-                            error_paragraph = Paragraph(error_text, value_style)
-                            story.append(error_paragraph)
-                            continue
-                            
-                    except Exception as e:
-                        print(f"Error procesando firma {campo.id}: {e}")
-                        continue
+                        story.append(image_table)
                 else:
                     valor = "Sin firma"
             elif campo.tipo_campo == 'foto':
@@ -3042,7 +5074,7 @@ def generar_pdf_simple(respuesta_formulario):
                         
                         if os.path.exists(foto_path):
                             try:
-                                with PILImage.open(foto_path) as img:
+                                with medir_etapa('imagenes'), PILImage.open(foto_path) as img:
                                     # Calcular dimensiones para visualización (sin redimensionar la imagen)
                                     max_width = 500
                                     max_height = 400
@@ -3056,7 +5088,7 @@ def generar_pdf_simple(respuesta_formulario):
                                         new_height = img.height
                                     
                                     # Guardar imagen temporalmente con máxima calidad y DPI original
-                                    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{foto_filename}')
+                                    temp_path = ruta_temporal_pdf(foto_filename)
                                     img.save(temp_path, quality=100, optimize=False)
                                     
                                     # Agregar al PDF
@@ -3066,6 +5098,8 @@ def generar_pdf_simple(respuesta_formulario):
                                     story.append(caption)
                                     
                                     pdf_image = Image(temp_path, width=new_width*2, height=new_height*2)
+                                    
+                                    contar_imagen_pdf()
                                     image_table = Table([[pdf_image]], colWidths=[new_width*2])
                                     image_table.setStyle(TableStyle([
                                         ('ALIGN', (0, 0), (0, 0), 'CENTER'),
@@ -3076,7 +5110,6 @@ def generar_pdf_simple(respuesta_formulario):
                                     
                                     story.append(image_table)
                                     contador_imagen += 1
-                                    os.remove(temp_path)
                                     
                             except Exception as e:
                                 print(f"Error procesando imagen {foto_filename}: {e}")
@@ -3093,7 +5126,7 @@ def generar_pdf_simple(respuesta_formulario):
         story.append(Spacer(1, 30))
         footer_text = """
         <para align=center>
-        <font name="Helvetica" size="9" color="#666666">
+        <font size="9" color="#666666">
         Formulario generado automáticamente por el Sistema ERP BACS<br/>
         Building Automation and Control System
         </font>
@@ -3102,7 +5135,8 @@ def generar_pdf_simple(respuesta_formulario):
         story.append(Paragraph(footer_text, styles['Normal']))
         
         # Construir el PDF
-        doc.build(story)
+        with medir_etapa('maquetacion'):
+            doc.build(story)
         buffer.seek(0)
         
         # Guardar archivo
@@ -3112,8 +5146,9 @@ def generar_pdf_simple(respuesta_formulario):
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         print(f"DEBUG: Guardando PDF simple en: {filepath}")
-        with open(filepath, 'wb') as f:
+        with medir_etapa('escritura'), open(filepath, 'wb') as f:
             f.write(buffer.getvalue())
+        registrar_bytes_pdf(buffer.getbuffer().nbytes)
         
         print(f"DEBUG: PDF simple generado exitosamente: {filename}")
         return filename
@@ -3125,100 +5160,13 @@ def generar_pdf_simple(respuesta_formulario):
         return None
 
 
-def procesar_firma_con_metodos_alternativos(firma_bytes, temp_path):
-    """Intentar procesar firma con métodos alternativos para imágenes truncadas"""
-    try:
-        # Método 1: Usar PIL con configuración para imágenes truncadas
-        from PIL import ImageFile
-        ImageFile.LOAD_TRUNCATED_IMAGES = True
-        
-        img = PILImage.open(io.BytesIO(firma_bytes))
-        img.save(temp_path, format='PNG', quality=100, optimize=False)
-        return img, temp_path
-        
-    except Exception as e:
-        print(f"DEBUG: Método PIL con LOAD_TRUNCATED_IMAGES falló: {e}")
-        
-        try:
-            # Método 2: Intentar reconstruir la imagen manualmente
-            # Buscar el final de la imagen PNG
-            if firma_bytes.startswith(b'\x89PNG'):
-                # PNG termina con IEND
-                end_marker = b'IEND\xaeB`\x82'
-                end_pos = firma_bytes.rfind(end_marker)
-                if end_pos != -1:
-                    # Reconstruir PNG completo
-                    reconstructed = firma_bytes[:end_pos + len(end_marker)]
-                    img = PILImage.open(io.BytesIO(reconstructed))
-                    img.save(temp_path, format='PNG', quality=100, optimize=False)
-                    return img, temp_path
-                else:
-                    # Si no encuentra el marcador de fin, intentar truncar en un punto razonable
-                    print(f"DEBUG: No se encontró marcador de fin PNG, intentando truncar...")
-                    # Buscar el último chunk válido
-                    pos = 8  # Saltar header PNG
-                    while pos < len(firma_bytes) - 8:
-                        if pos + 8 > len(firma_bytes):
-                            break
-                        chunk_length = int.from_bytes(firma_bytes[pos:pos+4], 'big')
-                        chunk_type = firma_bytes[pos+4:pos+8]
-                        if chunk_type == b'IEND':
-                            reconstructed = firma_bytes[:pos+8+4]  # Incluir CRC
-                            img = PILImage.open(io.BytesIO(reconstructed))
-                            img.save(temp_path, format='PNG', quality=100, optimize=False)
-                            return img, temp_path
-                        pos += 8 + chunk_length + 4  # Saltar al siguiente chunk
-            
-            # Si no es PNG, intentar con JPEG
-            elif firma_bytes.startswith(b'\xff\xd8\xff'):
-                # JPEG termina con FFD9
-                end_marker = b'\xff\xd9'
-                end_pos = firma_bytes.rfind(end_marker)
-                if end_pos != -1:
-                    reconstructed = firma_bytes[:end_pos + len(end_marker)]
-                    img = PILImage.open(io.BytesIO(reconstructed))
-                    img.save(temp_path, format='PNG', quality=100, optimize=False)
-                    return img, temp_path
-                    
-        except Exception as e2:
-            print(f"DEBUG: Método de reconstrucción falló: {e2}")
-        
-        # Método 3: Crear imagen placeholder si todo falla
-        try:
-            print(f"DEBUG: Creando imagen placeholder...")
-            placeholder = PILImage.new('RGB', (400, 200), color='white')
-            
-            # Agregar texto indicando que es una firma
-            from PIL import ImageDraw, ImageFont
-            draw = ImageDraw.Draw(placeholder)
-            
-            # Intentar usar una fuente, si no está disponible usar la por defecto
-            try:
-                font = ImageFont.truetype("arial.ttf", 20)
-            except:
-                font = ImageFont.load_default()
-            
-            text = "FIRMA DIGITAL"
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            x = (400 - text_width) // 2
-            y = (200 - text_height) // 2
-            
-            draw.text((x, y), text, fill='black', font=font)
-            draw.rectangle([10, 10, 390, 190], outline='gray', width=2)
-            
-            placeholder.save(temp_path, format='PNG', quality=100, optimize=False)
-            return placeholder, temp_path
-            
-        except Exception as e3:
-            print(f"DEBUG: Método placeholder falló: {e3}")
-            raise e3
-
-
-def generar_pdf_formulario(respuesta_formulario):
-    """Generar PDF del formulario diligenciado - Formato simple como el ejemplo deseado"""
+@instrumentar_pdf('formulario')
+@espacio_trabajo_pdf()
+def generar_pdf_formulario(respuesta_formulario, directorio=None):
+    """
+    Generar PDF del formulario diligenciado - Formato simple como el ejemplo deseado.
+    Se guarda en uploads/formularios/nombredelformulario salvo que se indique otro directorio.
+    """
     try:
         print(f"DEBUG: Iniciando generación de PDF para formulario {respuesta_formulario.formulario.nombre}")
         buffer = io.BytesIO()
@@ -3228,26 +5176,9 @@ def generar_pdf_formulario(respuesta_formulario):
                               leftMargin=40, rightMargin=40,
                               topMargin=40, bottomMargin=40)
         
-        styles = getSampleStyleSheet()
+        styles = estilos_pdf()
         story = []
         
-        # Registrar Calibri si está disponible; de lo contrario, usar Helvetica
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            import os
-            # Intentos comunes de ruta para Windows
-            calibri_paths = [
-                r"C:\\Windows\\Fonts\\calibri.ttf",
-                r"C:\\Windows\\Fonts\\Calibri.ttf",
-            ]
-            for p in calibri_paths:
-                if os.path.exists(p):
-                    pdfmetrics.registerFont(TTFont('Calibri', p))
-                    break
-        except Exception as font_err:
-            print(f"DEBUG: No se pudo registrar Calibri, usando Helvetica. Detalle: {font_err}")
-
         # Estilos personalizados
         title_style = ParagraphStyle(
             'CustomTitle',
@@ -3256,7 +5187,7 @@ def generar_pdf_formulario(respuesta_formulario):
             spaceAfter=20,
             alignment=1,
             textColor=colors.HexColor('#2c3e50'),
-            fontName='Helvetica-Bold'
+            fontName=FUENTES_PDF['bold']
         )
         
         field_style = ParagraphStyle(
@@ -3265,7 +5196,7 @@ def generar_pdf_formulario(respuesta_formulario):
             fontSize=11,
             spaceAfter=10,
             spaceBefore=5,
-            fontName='Calibri' if 'Calibri' in locals() or 'Calibri' in globals() else 'Helvetica',
+            fontName=FUENTES_PDF['normal'],
             textColor=colors.HexColor('#2c3e50')
         )
         
@@ -3274,7 +5205,7 @@ def generar_pdf_formulario(respuesta_formulario):
             parent=styles['Normal'],
             fontSize=11,
             spaceAfter=15,
-            fontName='Calibri' if 'Calibri' in locals() or 'Calibri' in globals() else 'Helvetica',
+            fontName=FUENTES_PDF['normal'],
             textColor=colors.HexColor('#34495e'),
             leftIndent=20
         )
@@ -3304,9 +5235,9 @@ def generar_pdf_formulario(respuesta_formulario):
             ('ALIGN', (2, 0), (2, 0), 'RIGHT'),     # Fecha a la derecha
             ('VALIGN', (0, 0), (-1, -1), 'TOP'),
             ('FONTSIZE', (1, 0), (1, 0), 16),
-            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, 0), FUENTES_PDF['bold']),
             ('FONTSIZE', (2, 0), (2, 0), 10),
-            ('FONTNAME', (2, 0), (2, 0), 'Helvetica'),
+            ('FONTNAME', (2, 0), (2, 0), FUENTES_PDF['normal']),
             ('LINEBELOW', (0, 0), (-1, -1), 2, colors.black),
         ]))
         # ========================================
@@ -3398,7 +5329,7 @@ def generar_pdf_formulario(respuesta_formulario):
                 valor = "<br/>".join(info_firmante) if info_firmante else "Firma digital"
                 
                 # Procesar imagen de la firma
-                if respuesta_campo.valor_archivo:
+                if respuesta_campo.valor_archivo or respuesta_campo.valor_json:
                     try:
                         # Construir información del firmante (en filas)
                         lineas_info = []
@@ -3415,41 +5346,13 @@ def generar_pdf_formulario(respuesta_formulario):
 
                         info_para = Paragraph("<br/>".join(lineas_info) if lineas_info else "Sin datos del firmante", value_style)
 
-                        # Determinar ruta de la firma PNG
-                        posible_path = os.path.join(app.config['UPLOAD_FOLDER'], respuesta_campo.valor_archivo) if not os.path.isabs(respuesta_campo.valor_archivo) else respuesta_campo.valor_archivo
-                        png_path = None
-                        if os.path.exists(posible_path):
-                            png_path = posible_path
-                            print(f"DEBUG: Firma para tabla (ruta existente): {png_path}")
-                        else:
-                            # Fallback: si viniera base64, decodificar y guardar
-                            import base64
-                            from io import BytesIO
-                            if ',' in respuesta_campo.valor_archivo:
-                                _, encoded = respuesta_campo.valor_archivo.split(',', 1)
-                            else:
-                                encoded = respuesta_campo.valor_archivo
-                            image_bytes = base64.b64decode(encoded)
-                            img = PILImage.open(BytesIO(image_bytes)).convert('RGBA')
-                            bg = PILImage.new("RGB", img.size, (255, 255, 255))
-                            bg.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-                            firmas_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', 'firmas')
-                            os.makedirs(firmas_dir, exist_ok=True)
-                            from datetime import datetime
-                            png_path = os.path.join(firmas_dir, f'firma_{campo.id}_{respuesta_formulario.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png')
-                            bg.save(png_path, format='PNG')
-                            print(f"DEBUG: Firma guardada en fallback para tabla: {png_path}")
-
-                        # Crear imagen escalada de firma
+                        # Firma escalada: trazos vectoriales o PNG canónico desde la caché
                         from reportlab.lib.pagesizes import A4
-                        img_tmp = PILImage.open(png_path)
-                        img_w, img_h = img_tmp.size
                         page_w, _ = A4
                         max_width = min(page_w * 0.4, 300)
-                        scale = max_width / img_w
-                        draw_w = img_w * scale
-                        draw_h = img_h * scale
-                        firma_image = Image(png_path, width=draw_w, height=draw_h)
+                        firma_image = firma_flowable_pdf(respuesta_campo, max_width)
+                        if firma_image is None:
+                            raise ValueError('firma no disponible')
 
                         # Crear tabla 2 columnas: info (izq) | firma (der)
                         tabla = Table([[info_para, firma_image]], colWidths=[page_w - max_width - 60, max_width])
@@ -3492,7 +5395,7 @@ def generar_pdf_formulario(respuesta_formulario):
                         if os.path.exists(foto_path):
                             try:
                                 # Verificar si es una imagen
-                                with PILImage.open(foto_path) as img:
+                                with medir_etapa('imagenes'), PILImage.open(foto_path) as img:
                                     # Redimensionar según orientación (6cm = ~170 puntos para mejor resolución)
                                     max_width_cm = 6  # cm
                                     max_height_cm = 6  # cm
@@ -3541,11 +5444,12 @@ def generar_pdf_formulario(respuesta_formulario):
                                     original_path = os.path.join(imagenes_dir, foto_filename)
                                     
                                     # Guardar imagen temporalmente con máxima calidad y DPI original
-                                    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{foto_filename}')
+                                    temp_path = ruta_temporal_pdf(foto_filename)
                                     img.save(temp_path, quality=100, optimize=False)
                                     
                                     # Agregar imagen centrada con borde usando dimensiones calculadas
                                     pdf_image = Image(temp_path, width=new_width, height=new_height)
+                                    contar_imagen_pdf()
                                     
                                     # Crear tabla para centrar la imagen con borde
                                     image_table = Table([[pdf_image]], colWidths=[new_width])
@@ -3574,7 +5478,7 @@ def generar_pdf_formulario(respuesta_formulario):
         story.append(Spacer(1, 30))
         footer_text = f"""
         <para align=center>
-        <font name="Helvetica" size="9" color="#666666">
+        <font size="9" color="#666666">
         Formulario generado automáticamente por el Sistema ERP BACS<br/>
         Building Automation and Control System
         </font>
@@ -3584,7 +5488,8 @@ def generar_pdf_formulario(respuesta_formulario):
         story.append(footer)
         
         # Construir el PDF
-        doc.build(story)
+        with medir_etapa('maquetacion'):
+            doc.build(story)
         buffer.seek(0)
         
         # Guardar archivo en la estructura solicitada: uploads/formularios/nombredelformulario/nombredeldocumento.pdf
@@ -3592,30 +5497,19 @@ def generar_pdf_formulario(respuesta_formulario):
         documento_nombre = f'documento_{respuesta_formulario.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
         
         # Crear directorio si no existe
-        formulario_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', formulario_nombre)
+        formulario_dir = directorio or os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', formulario_nombre)
         os.makedirs(formulario_dir, exist_ok=True)
         
         filepath = os.path.join(formulario_dir, documento_nombre)
         
         print(f"DEBUG: Guardando PDF en: {filepath}")
-        with open(filepath, 'wb') as f:
+        with medir_etapa('escritura'), open(filepath, 'wb') as f:
             f.write(buffer.getvalue())
+        registrar_bytes_pdf(buffer.getbuffer().nbytes)
         
         print(f"DEBUG: PDF generado exitosamente: {documento_nombre}")
         
-        # Limpiar archivos temporales después de generar el PDF
-        try:
-            import glob
-            # Patrones de archivos temporales que generamos (EXCEPTO firma_* que se limpia después)
-            patterns = ['temp_*', 'firma_respaldo_*']
-            for pattern in patterns:
-                temp_files = glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], pattern))
-                for temp_file in temp_files:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                        print(f"DEBUG: Archivo temporal eliminado: {temp_file}")
-        except Exception as cleanup_error:
-            print(f"DEBUG: Error limpiando archivos temporales: {cleanup_error}")
+        # Los archivos temporales se eliminan con el espacio de trabajo al terminar
         
         # NO eliminar archivos de firma - mantener para inspección
         print(f"DEBUG: Archivos de firma mantenidos en uploads/formularios/firmas/ para inspección")
@@ -3627,526 +5521,335 @@ def generar_pdf_formulario(respuesta_formulario):
         import traceback
         traceback.print_exc()
         
-        
+
         return None
 
-def procesar_firma_imagen(firma_data, campo, story, value_style):
-    """Procesar firma como imagen y agregarla al PDF - Solución simple y robusta"""
-    temp_path = None
-    try:
-        import base64
-        import datetime
-        import io
-        from PIL import Image as PILImage
-        from reportlab.platypus import Image
-        from reportlab.lib.utils import ImageReader
-        
-        print(f"DEBUG: Procesando imagen de firma para campo {campo.id}")
-        print(f"DEBUG: Longitud de datos base64: {len(firma_data)}")
-        
-        # Configurar PIL para manejar imágenes truncadas
-        from PIL import ImageFile
-        ImageFile.LOAD_TRUNCATED_IMAGES = True
-        
-        # Extraer datos base64
-        if ',' in firma_data:
-            base64_data = firma_data.split(',')[1]
-            print(f"DEBUG: Datos base64 extraídos, longitud: {len(base64_data)}")
+def ruta_pdf_formulario(respuesta_formulario, documento_nombre=None):
+    """Ruta en disco del PDF de una respuesta: uploads/formularios/nombredelformulario/nombredeldocumento.pdf"""
+    return _ruta_pdf(respuesta_formulario.formulario.nombre, documento_nombre or respuesta_formulario.archivo_pdf)
+
+def _ruta_pdf(formulario_nombre, documento_nombre):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', secure_filename(formulario_nombre), documento_nombre)
+
+def _renderizar_formulario(respuesta_id, actualizar=False, directorio=None):
+    """
+    Genera en un proceso de trabajo el PDF de una respuesta de formulario y retorna (respuesta_id, ruta).
+    Con actualizar=True el nuevo PDF queda registrado en la respuesta (y se guarda en uploads); si no,
+    se escribe en 'directorio'. ruta es None si falla.
+    """
+    with app.app_context():
+        respuesta_formulario = db.session.get(RespuestaFormulario, respuesta_id)
+        if respuesta_formulario is None:
+            return respuesta_id, None
+
+        directorio = None if actualizar else directorio
+        documento_nombre = generar_pdf_formulario(respuesta_formulario, directorio)
+        if actualizar:
+            if documento_nombre:
+                respuesta_formulario.archivo_pdf = documento_nombre
+            respuesta_formulario.estado_pdf = 'Listo' if documento_nombre else 'Error'
+            db.session.commit()
+        if not documento_nombre:
+            ruta = None
+        elif directorio:
+            ruta = os.path.join(directorio, documento_nombre)
         else:
-            base64_data = firma_data
-            print(f"DEBUG: Usando datos base64 directos")
-        
-        # Limpiar y agregar padding si es necesario
-        base64_data = base64_data.strip()
-        missing_padding = len(base64_data) % 4
-        if missing_padding:
-            base64_data += '=' * (4 - missing_padding)
-            print(f"DEBUG: Padding agregado, nueva longitud: {len(base64_data)}")
-        
-        # Decodificar base64
-        try:
-            firma_bytes = base64.b64decode(base64_data, validate=True)
-            print(f"DEBUG: Base64 decodificado exitosamente, tamaño: {len(firma_bytes)} bytes")
-        except Exception as e:
-            print(f"DEBUG: Error en decodificación con validación: {e}")
-            firma_bytes = base64.b64decode(base64_data, validate=False)
-            print(f"DEBUG: Base64 decodificado sin validación, tamaño: {len(firma_bytes)} bytes")
-        
-        # Crear archivo temporal único
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        temp_filename = f'temp_firma_{campo.id}_{timestamp}.png'
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-        
-        # Guardar imagen temporal
-        with open(temp_path, 'wb') as f:
-            f.write(firma_bytes)
-        
-        # Verificar que el archivo se creó
-        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-            raise ValueError("No se pudo crear el archivo temporal")
-        
-        print(f"DEBUG: Archivo temporal creado: {temp_path}, tamaño: {os.path.getsize(temp_path)} bytes")
-        
-        # PROCESAMIENTO SIMPLE Y ROBUSTO
+            ruta = ruta_pdf_formulario(respuesta_formulario, documento_nombre)
+        db.session.remove()
+
+    return respuesta_id, os.path.abspath(ruta) if ruta else None
+
+# ==================== PDF DE FORMULARIOS EN SEGUNDO PLANO ====================
+
+_ejecutor_pdf_formularios = None
+_bloqueo_ejecutor_pdf = threading.Lock()
+
+def _marcar_error_pdf_formulario(respuesta_id):
+    with app.app_context():
         try:
-            img = PILImage.open(temp_path)
-            print(f"DEBUG: Imagen original - Modo: {img.mode}, Dimensiones: {img.width}x{img.height}")
-            
-            # Convertir a RGB si es necesario
-            if img.mode == 'RGBA':
-                print(f"DEBUG: Convirtiendo RGBA a RGB con fondo blanco")
-                background = PILImage.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            elif img.mode != 'RGB':
-                print(f"DEBUG: Convirtiendo de {img.mode} a RGB")
-                img = img.convert('RGB')
-            
-            # PROCESAMIENTO INTELIGENTE: Detectar automáticamente el mejor método
-            print(f"DEBUG: Analizando imagen para determinar el mejor procesamiento")
-            
-            # Convertir a escala de grises para análisis
-            gray_img = img.convert('L')
-            
-            # Analizar el histograma para entender la imagen
-            histogram = gray_img.histogram()
-            total_pixels = sum(histogram)
-            
-            # Contar píxeles oscuros (0-50) y claros (200-255)
-            dark_pixels = sum(histogram[0:51])
-            light_pixels = sum(histogram[200:256])
-            
-            dark_percentage = (dark_pixels / total_pixels) * 100
-            light_percentage = (light_pixels / total_pixels) * 100
-            
-            print(f"DEBUG: Análisis - Oscuros: {dark_percentage:.1f}%, Claros: {light_percentage:.1f}%")
-            
-            # Decidir el mejor método basado en el análisis
-            if dark_percentage > 5:  # Hay suficiente contenido oscuro (firma negra)
-                print(f"DEBUG: Firma negra detectada, usando imagen original")
-                img_resized = img  # Usar imagen original
-            elif light_percentage > 80:  # Imagen muy clara (firma blanca/gris)
-                print(f"DEBUG: Firma clara detectada, invirtiendo colores")
-                img_resized = PILImage.eval(img, lambda x: 255 - x)  # Invertir
-            else:  # Caso intermedio
-                print(f"DEBUG: Caso intermedio, aplicando contraste")
-                # Aumentar contraste
-                from PIL import ImageEnhance
-                enhancer = ImageEnhance.Contrast(img)
-                img_resized = enhancer.enhance(2.0)
-            
-            # Dimensiones para ReportLab
-            target_width = img_resized.width
-            target_height = img_resized.height
-            
-            # Guardar imagen procesada
-            img_resized.save(temp_path, format='PNG', quality=100, optimize=False)
-            print(f"DEBUG: Imagen procesada guardada - Dimensiones: {target_width}x{target_height}")
-            
-            # Verificar que el archivo se guardó correctamente
-            if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-                raise ValueError("No se pudo guardar la imagen procesada")
-            
-            print(f"DEBUG: Archivo guardado verificado - Tamaño: {os.path.getsize(temp_path)} bytes")
-            
-            # Agregar al PDF
-            story.append(Spacer(1, 10))
-            
-            # Agregar leyenda para la firma
-            firma_leyenda = Paragraph("<b>Firma Digital:</b>", value_style)
-            story.append(firma_leyenda)
-            story.append(Spacer(1, 5))
-            
-            # Usar dimensiones fijas para mejor compatibilidad con ReportLab
-            display_width = target_width
-            display_height = target_height
-            
-            # Crear imagen para ReportLab de manera directa
-            try:
-                # Verificar que el archivo existe y tiene contenido
-                if not os.path.exists(temp_path):
-                    raise ValueError("Archivo temporal no existe")
-                
-                file_size = os.path.getsize(temp_path)
-                if file_size == 0:
-                    raise ValueError("Archivo temporal está vacío")
-                
-                print(f"DEBUG: Archivo verificado - Tamaño: {file_size} bytes")
-                
-                # Crear imagen para ReportLab usando dimensiones originales
-                # Limitar el tamaño máximo para que quepa en el PDF
-                max_width = 500
-                max_height = 300
-                
-                if target_width > max_width or target_height > max_height:
-                    # Calcular proporción para mantener aspecto
-                    ratio = min(max_width/target_width, max_height/target_height)
-                    display_width = int(target_width * ratio)
-                    display_height = int(target_height * ratio)
-                    print(f"DEBUG: Redimensionando para PDF: {display_width}x{display_height}")
-                else:
-                    display_width = target_width
-                    display_height = target_height
-                    print(f"DEBUG: Usando dimensiones originales para PDF: {display_width}x{display_height}")
-                
-                pdf_image = Image(temp_path, width=display_width, height=display_height)
-                print(f"DEBUG: Imagen ReportLab creada - {display_width}x{display_height}")
-                
-                # Agregar imagen con borde para mejor visibilidad
-                story.append(Spacer(1, 5))
-                
-                # Crear tabla para centrar la imagen con borde
-                image_table = Table([[pdf_image]], colWidths=[display_width])
-                image_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                    ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                    ('BOX', (0, 0), (0, 0), 2, colors.HexColor('#2c3e50')),
-                    ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#ffffff')),
-                    ('PADDING', (0, 0), (0, 0), 10),
-                ]))
-                
-                story.append(image_table)
-                print(f"DEBUG: Imagen agregada al PDF con borde exitosamente")
-                
-            except Exception as rl_error:
-                print(f"ERROR: Error creando imagen ReportLab: {rl_error}")
-                import traceback
-                traceback.print_exc()
-                
-                # Método de respaldo: crear imagen simple más grande
+            respuesta_formulario = db.session.get(RespuestaFormulario, respuesta_id)
+            if respuesta_formulario is not None and respuesta_formulario.estado_pdf == 'Generando':
+                respuesta_formulario.estado_pdf = 'Error'
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+def _al_terminar_pdf_formulario(futuro):
+    """Un proceso que falla antes de registrar el resultado no debe dejar la respuesta en 'Generando'"""
+    respuesta_id = futuro.respuesta_id
+    try:
+        _, ruta = futuro.result()
+        print(f"PDF de formulario {respuesta_id} generado en segundo plano: {ruta or 'error'}")
+    except Exception as e:
+        print(f"Error generando en segundo plano el PDF del formulario {respuesta_id}: {e}")
+        _marcar_error_pdf_formulario(respuesta_id)
+
+def encolar_pdf_formulario(respuesta_id):
+    """
+    Envía la generación del PDF de una respuesta ya confirmada a los procesos de fondo (compartidos
+    por todas las peticiones del proceso web). El resultado queda en archivo_pdf y estado_pdf.
+    """
+    global _ejecutor_pdf_formularios
+    try:
+        with _bloqueo_ejecutor_pdf:
+            for intento in range(2):
+                if _ejecutor_pdf_formularios is None:
+                    # 'spawn': un fork del proceso web (con hilos) puede heredar bloqueos tomados por otros hilos
+                    _ejecutor_pdf_formularios = ProcessPoolExecutor(
+                        max_workers=app.config['FORMULARIO_PDF_WORKERS'],
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_inicializar_worker_informes
+                    )
                 try:
-                    print(f"DEBUG: Creando imagen de respaldo")
-                    simple_img = PILImage.new('RGB', (400, 200), (255, 255, 255))
-                    from PIL import ImageDraw
-                    draw = ImageDraw.Draw(simple_img)
-                    
-                    # Dibujar un rectángulo más grande
-                    draw.rectangle([20, 20, 380, 180], outline=(0, 0, 0), width=3)
-                    
-                    # Agregar texto más grande
-                    draw.text((50, 50), "FIRMA DIGITAL", fill=(0, 0, 0))
-                    draw.text((50, 80), "Procesamiento de respaldo", fill=(100, 100, 100))
-                    
-                    simple_path = os.path.join(app.config['UPLOAD_FOLDER'], f'simple_firma_{campo.id}.png')
-                    simple_img.save(simple_path, format='PNG')
-                    
-                    # Crear imagen con borde
-                    pdf_image = Image(simple_path, width=400, height=200)
-                    image_table = Table([[pdf_image]], colWidths=[400])
-                    image_table.setStyle(TableStyle([
-                        ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                        ('BOX', (0, 0), (0, 0), 2, colors.HexColor('#2c3e50')),
-                        ('BACKGROUND', (0, 0), (0, 0), colors.HexColor('#ffffff')),
-                        ('PADDING', (0, 0), (0, 0), 10),
-                    ]))
-                    
-                    story.append(image_table)
-                    print(f"DEBUG: Imagen de respaldo agregada")
-                    
-                except Exception as backup_error:
-                    print(f"ERROR: Error con imagen de respaldo: {backup_error}")
-                    # Último recurso: texto
-                    error_text = f"<b>Firma Digital:</b> Error procesando imagen"
-                    error_paragraph = Paragraph(error_text, value_style)
-                    story.append(error_paragraph)
-            
-        except Exception as img_error:
-            print(f"ERROR: Error procesando imagen: {img_error}")
-            import traceback
-            traceback.print_exc()
-            # Agregar mensaje de error
-            error_text = f"<b>Firma Digital:</b> Error procesando imagen"
-            error_paragraph = Paragraph(error_text, value_style)
-            story.append(error_paragraph)
-        
+                    futuro = _ejecutor_pdf_formularios.submit(_renderizar_formulario, respuesta_id, True)
+                    break
+                except BrokenProcessPool:
+                    # Un proceso de trabajo murió: se recrea el grupo y se reintenta una vez
+                    _ejecutor_pdf_formularios = None
+                    if intento:
+                        raise
     except Exception as e:
-        print(f"ERROR: Error general procesando firma: {e}")
-        import traceback
-        traceback.print_exc()
-        # Agregar mensaje de error
-        error_text = f"<b>Firma Digital:</b> Error procesando firma"
-        error_paragraph = Paragraph(error_text, value_style)
-        story.append(error_paragraph)
+        # La respuesta ya está confirmada: se marca el error en lugar de dejarla en 'Generando'
+        print(f"Error encolando el PDF del formulario {respuesta_id}: {e}")
+        _marcar_error_pdf_formulario(respuesta_id)
+        return None
+    futuro.respuesta_id = respuesta_id
+    futuro.add_done_callback(_al_terminar_pdf_formulario)
+    return futuro
+
+def recuperar_pdf_abandonado(respuesta_formulario):
+    """
+    Genera en la petición el PDF de una respuesta que lleva en 'Generando' más de FORMULARIO_PDF_TIMEOUT_MIN
+    (el proceso web se reinició con trabajos en cola o el proceso de fondo murió sin avisar).
+    Solo una petición se queda con la respuesta; retorna True si la generó.
+    """
+    limite = datetime.utcnow() - timedelta(minutes=app.config['FORMULARIO_PDF_TIMEOUT_MIN'])
+    reclamada = db.session.execute(
+        db.update(RespuestaFormulario)
+        .where(RespuestaFormulario.id == respuesta_formulario.id,
+               RespuestaFormulario.estado_pdf == 'Generando',
+               db.or_(RespuestaFormulario.fecha_estado_pdf.is_(None), RespuestaFormulario.fecha_estado_pdf < limite))
+        .values(fecha_estado_pdf=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not reclamada:
+        return False
     
-    finally:
-        # NO eliminar el archivo temporal aquí - ReportLab aún lo necesita
-        # El archivo se eliminará automáticamente por la limpieza general al final
-        pass
+    documento_nombre = generar_pdf_formulario(respuesta_formulario)
+    if documento_nombre:
+        respuesta_formulario.archivo_pdf = documento_nombre
+    respuesta_formulario.estado_pdf = 'Listo' if documento_nombre else 'Error'
+    db.session.commit()
+    return True
 
+# ==================== REGENERACIÓN MASIVA DE PDF DE FORMULARIOS ====================
 
-def clean_base64(b64_str):
-    """Limpia la cadena Base64 removiendo prefijos y padding incorrecto."""
-    import re
-    
-    # 1. Quitar prefijo
-    if ',' in b64_str:
-        header, data = b64_str.split(',', 1)
-        print(f"DEBUG: Prefijo removido: {header}")
-    else:
-        data = b64_str
-    
-    # 2. Remover caracteres que no son válidos
-    # Sólo dejar A-Z a-z, 0-9, +, /, = (si estás usando base64 estándar)
-    data = re.sub(r'[^A-Za-z0-9+/=]', '', data)
-    
-    # 3. Corregir padding si falta
-    missing_padding = len(data) % 4
-    if missing_padding != 0:
-        data += '=' * (4 - missing_padding)
-        print(f"DEBUG: Padding agregado: {4 - missing_padding} caracteres")
-    
-    print(f"DEBUG: Base64 limpio - Longitud: {len(data)}")
-    return data
+# Cuando cambian el logo, las fuentes o la maquetación, los PDF guardados quedan desactualizados.
+# Un trabajo RegeneracionPDF los vuelve a generar en procesos de trabajo de baja prioridad, por
+# tandas en orden de ID; tras cada tanda guarda el progreso y el último ID, de modo que se puede
+# cancelar o reanudar (desde la web o con regenerar_pdfs.py) sin repetir lo ya hecho.
 
-def procesar_firma_simple(firma_data, campo, story, value_style):
-    """Procesar firma de manera simple y robusta - SOLO CAMBIO: umbral más permisivo"""
-    temp_path = None
+def _inicializar_worker_regeneracion():
+    """Procesos de regeneración con prioridad baja para no competir con las peticiones web"""
+    _inicializar_worker_informes()
     try:
-        import base64
-        import datetime
-        import io
-        import re
-        from PIL import Image as PILImage
-        from PIL import ImageFile
-        from reportlab.platypus import Image
-        from reportlab.lib.utils import ImageReader
-        
-        # Configurar PIL para manejar imágenes truncadas
-        ImageFile.LOAD_TRUNCATED_IMAGES = True
-        
-        print(f"DEBUG: Procesando firma simple para campo {campo.id}")
-        print(f"DEBUG: Longitud datos recibidos: {len(firma_data)}")
-        print(f"DEBUG: Primeros 100 caracteres: {firma_data[:100]}")
-        
-        # Verificar que la cadena no esté vacía
-        if not firma_data or len(firma_data) < 30:
-            raise ValueError("Firma base64 demasiado corta o vacía")
-        
-        # Crear archivo temporal único
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        temp_filename = f"firma_simple_{campo.id}_{timestamp}.png"
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-        
-        # Limpiar y decodificar base64
-        try:
-            # Limpiar la cadena base64
-            cleaned_base64 = clean_base64(firma_data)
-            
-            # Decodificar base64
-            image_data = base64.b64decode(cleaned_base64)
-            print(f"DEBUG: Base64 decodificado - Tamaño: {len(image_data)} bytes")
-            
-        except Exception as decode_error:
-            print(f"ERROR: Error decodificando base64: {decode_error}")
-            raise ValueError(f"Error decodificando base64: {decode_error}")
-        
-        # Procesar imagen con PIL
-        try:
-            # Abrir imagen
-            image = PILImage.open(io.BytesIO(image_data))
-            print(f"DEBUG: Imagen PIL abierta - Modo: {image.mode}, Dimensiones: {image.width}x{image.height}")
-            
-            # Convertir a RGB si es necesario
-            if image.mode in ('RGBA', 'LA'):
-                print(f"DEBUG: Convirtiendo {image.mode} a RGB con fondo blanco")
-                fondo = PILImage.new('RGB', image.size, (255, 255, 255))
-                alpha = image.split()[-1]
-                fondo.paste(image, mask=alpha)
-                image = fondo
-            else:
-                image = image.convert('RGB')
-            
-            # Verificar que la imagen tiene contenido (no solo fondo blanco)
-            # Convertir a escala de grises para análisis
-            gray_img = image.convert('L')
-            histogram = gray_img.histogram()
-            
-            # Contar píxeles no blancos (valor < 250) - MÁS PERMISIVO
-            non_white_pixels = sum(histogram[:250])
-            total_pixels = sum(histogram)
-            non_white_percentage = (non_white_pixels / total_pixels) * 100
-            
-            print(f"DEBUG: Análisis imagen - Píxeles no blancos: {non_white_percentage:.1f}%")
+        os.nice(app.config['REGENERACION_PDF_NICE'])
+    except (AttributeError, OSError):
+        pass  # Windows no tiene os.nice
+
+def _regenerar_pdf_formulario(respuesta_id):
+    """Vuelve a generar el PDF de una respuesta y elimina el anterior; retorna (respuesta_id, ruta)"""
+    with app.app_context():
+        respuesta_formulario = db.session.get(RespuestaFormulario, respuesta_id)
+        anterior = ruta_pdf_formulario(respuesta_formulario) if respuesta_formulario and respuesta_formulario.archivo_pdf else None
+        db.session.remove()
+    respuesta_id, ruta = _renderizar_formulario(respuesta_id, True)
+    if ruta and anterior and os.path.abspath(anterior) != ruta and os.path.exists(anterior):
+        os.remove(anterior)
+    return respuesta_id, ruta
+
+def _consulta_regeneracion(trabajo):
+    """Respuestas que abarca el trabajo (formulario y rango de fechas inclusivo)"""
+    consulta = RespuestaFormulario.query
+    if trabajo.formulario_id:
+        consulta = consulta.filter(RespuestaFormulario.formulario_id == trabajo.formulario_id)
+    if trabajo.fecha_desde:
+        consulta = consulta.filter(RespuestaFormulario.fecha_diligenciamiento >= datetime.combine(trabajo.fecha_desde, datetime.min.time()))
+    if trabajo.fecha_hasta:
+        consulta = consulta.filter(RespuestaFormulario.fecha_diligenciamiento < datetime.combine(trabajo.fecha_hasta + timedelta(days=1), datetime.min.time()))
+    return consulta
+
+def crear_regeneracion_pdfs(formulario_id=None, fecha_desde=None, fecha_hasta=None, creado_por=None):
+    """Registra un trabajo de regeneración con el total de respuestas que abarca"""
+    trabajo = RegeneracionPDF(formulario_id=formulario_id, fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, creado_por=creado_por)
+    trabajo.total = _consulta_regeneracion(trabajo).count()
+    db.session.add(trabajo)
+    db.session.commit()
+    return trabajo
+
+def reclamar_regeneracion_pdfs(trabajo_id):
+    """
+    Pasa el trabajo a 'En curso' si es reanudable, en una sola sentencia: entre varios procesos web
+    o el script, solo uno lo obtiene. Retorna True si este proceso quedó a cargo del trabajo.
+    """
+    ahora = datetime.utcnow()
+    limite = ahora - timedelta(minutes=REGENERACION_PDF_INACTIVIDAD_MIN)
+    reclamado = db.session.execute(
+        db.update(RegeneracionPDF)
+        .where(RegeneracionPDF.id == trabajo_id,
+               db.or_(RegeneracionPDF.estado.in_(('Pendiente', 'Interrumpida')),
+                      db.and_(RegeneracionPDF.estado == 'En curso', RegeneracionPDF.fecha_actualizacion < limite)))
+        .values(estado='En curso', fecha_actualizacion=ahora),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return reclamado == 1
+
+def ejecutar_regeneracion_pdfs(trabajo_id, workers=None, pausa=None, al_progresar=None, reclamado=False):
+    """
+    Ejecuta (o reanuda) un trabajo de regeneración hasta terminarlo o hasta que se cancele.
+    Cada tanda son hasta 4 respuestas por proceso; entre tandas se espera 'pausa' segundos.
+    Retorna None si el trabajo no es reanudable o ya lo ejecuta otro proceso (reclamado=True
+    cuando quien llama ya lo reclamó). Debe llamarse dentro de un contexto de aplicación.
+    """
+    workers = workers or app.config['REGENERACION_PDF_WORKERS']
+    pausa = app.config['REGENERACION_PDF_PAUSA'] if pausa is None else pausa
+    if not reclamado and not reclamar_regeneracion_pdfs(trabajo_id):
+        return None
+    trabajo = db.session.get(RegeneracionPDF, trabajo_id)
+    
+    # 'spawn': la web lo ejecuta en un hilo y un fork podría heredar bloqueos tomados por otros hilos
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_inicializar_worker_regeneracion) as ejecutor:
+        while True:
+            ids = [fila.id for fila in _consulta_regeneracion(trabajo)
+                   .filter(RespuestaFormulario.id > trabajo.ultimo_id)
+                   .with_entities(RespuestaFormulario.id)
+                   .order_by(RespuestaFormulario.id)
+                   .limit(workers * 4)]
+            if not ids:
+                trabajo.estado = 'Completada'
+                db.session.commit()
+                break
+            # Cerrar la transacción de lectura antes de que los procesos escriban
+            db.session.commit()
             
-            # CAMBIO ÚNICO: Ser más permisivo - solo considerar vacía si tiene menos del 0.1% de contenido
-            if non_white_percentage < 0.1:  # Cambiado de 1.0% a 0.1%
-                print(f"DEBUG: Imagen parece estar vacía, creando imagen de respaldo")
-                # Crear imagen de respaldo
-                image = PILImage.new('RGB', (400, 200), (255, 255, 255))
-                from PIL import ImageDraw, ImageFont
-                
+            errores = 0
+            for futuro in [ejecutor.submit(_regenerar_pdf_formulario, respuesta_id) for respuesta_id in ids]:
                 try:
-                    draw = ImageDraw.Draw(image)
-                    # Dibujar un rectángulo simple
-                    draw.rectangle([50, 50, 350, 150], outline=(0, 0, 0), width=2)
-                    
-                    # Agregar texto
-                    try:
-                        font = ImageFont.load_default()
-                        text = "FIRMA DIGITAL"
-                        bbox = draw.textbbox((0, 0), text, font=font)
-                        text_width = bbox[2] - bbox[0]
-                        text_height = bbox[3] - bbox[1]
-                        x = (400 - text_width) // 2
-                        y = (200 - text_height) // 2
-                        draw.text((x, y), text, fill=(0, 0, 0), font=font)
-                    except:
-                        pass
-                except Exception as draw_error:
-                    print(f"DEBUG: Error creando imagen de respaldo: {draw_error}")
-            else:
-                print(f"DEBUG: Imagen tiene contenido válido, procediendo con la imagen original")
-            
-            # Guardar imagen procesada
-            image.save(temp_path, format='PNG', quality=100)
-            print(f"DEBUG: Imagen guardada - Dimensiones: {image.width}x{image.height}")
+                    _, ruta = futuro.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"Error regenerando PDF: {e}")
+                    ruta = None
+                errores += ruta is None
             
-        except Exception as pil_error:
-            print(f"ERROR: Error procesando imagen con PIL: {pil_error}")
-            raise ValueError(f"Error procesando imagen: {pil_error}")
-        
-        # Crear imagen para ReportLab
-        try:
-            # Usar directamente la ruta del archivo
-            pdf_image = Image(temp_path, width=300, height=150)
-            print(f"DEBUG: Imagen ReportLab creada exitosamente")
-            
-        except Exception as e:
-            print(f"ERROR: Error creando imagen ReportLab: {e}")
-            raise ValueError("No se pudo crear imagen para PDF")
-        
-        # Agregar imagen al PDF
+            db.session.refresh(trabajo)
+            trabajo.procesadas += len(ids)
+            trabajo.errores += errores
+            trabajo.ultimo_id = ids[-1]
+            trabajo.fecha_actualizacion = datetime.utcnow()
+            cancelada = trabajo.estado == 'Cancelada'
+            db.session.commit()
+            if al_progresar:
+                al_progresar(trabajo)
+            if cancelada:
+                break
+            if pausa:
+                time.sleep(pausa)
+    return trabajo
+
+def _hilo_regeneracion(trabajo_id):
+    with app.app_context():
         try:
-            # Crear tabla para la firma
-            firma_data_table = Table([
-                ['Firma Digital:', pdf_image]
-            ], colWidths=[120, 300])
-            
-            # Estilo para la tabla de firma
-            firma_style = TableStyle([
-                ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-                ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (0, 0), 10),
-                ('TEXTCOLOR', (0, 0), (0, 0), '#2c3e50'),
-                ('BACKGROUND', (0, 0), (-1, -1), '#ffffff'),
-                ('GRID', (0, 0), (-1, -1), 1, '#2c3e50'),
-                ('PADDING', (0, 0), (-1, -1), 8),
-            ])
-            
-            firma_data_table.setStyle(firma_style)
-            story.append(firma_data_table)
-            story.append(Spacer(1, 12))
-            
-            print(f"DEBUG: Firma agregada al PDF exitosamente")
-            
+            ejecutar_regeneracion_pdfs(trabajo_id, reclamado=True)
         except Exception as e:
-            print(f"ERROR: Error agregando firma al PDF: {e}")
-            # Agregar texto de error como respaldo
-            error_text = f"Error procesando imagen de firma: {e}"
-            story.append(Paragraph(f"<b>Firma Digital:</b> {error_text}", value_style))
-            story.append(Spacer(1, 12))
-        
-        return temp_path
-        
-    except Exception as e:
-        print(f"ERROR: Error general procesando firma: {e}")
-        # Agregar texto de error como respaldo
-        error_text = f"Error procesando imagen de firma: {e}"
-        story.append(Paragraph(f"<b>Firma Digital:</b> {error_text}", value_style))
-        story.append(Spacer(1, 12))
-        return None
-    finally:
-        # NO eliminar el archivo temporal aquí - ReportLab aún lo necesita
-        pass
+            print(f"Regeneración de PDF {trabajo_id} interrumpida: {e}")
+            db.session.rollback()
+            trabajo = db.session.get(RegeneracionPDF, trabajo_id)
+            if trabajo.estado == 'En curso':
+                trabajo.estado = 'Interrumpida'
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+def iniciar_regeneracion_pdfs(trabajo_id):
+    """
+    Reclama el trabajo y lo ejecuta en un hilo del proceso web (los PDF se generan en procesos aparte).
+    Retorna False si no es reanudable o ya lo ejecuta otro proceso.
+    """
+    if not reclamar_regeneracion_pdfs(trabajo_id):
+        return False
+    threading.Thread(target=_hilo_regeneracion, args=(trabajo_id,), name=f'regeneracion_pdf_{trabajo_id}', daemon=True).start()
+    return True
+
+def _regeneracion_a_dict(trabajo):
+    return {
+        'id': trabajo.id,
+        'formulario': trabajo.formulario.nombre if trabajo.formulario else 'Todos',
+        'fecha_desde': trabajo.fecha_desde.isoformat() if trabajo.fecha_desde else None,
+        'fecha_hasta': trabajo.fecha_hasta.isoformat() if trabajo.fecha_hasta else None,
+        'estado': trabajo.estado,
+        'total': trabajo.total,
+        'procesadas': trabajo.procesadas,
+        'errores': trabajo.errores,
+        'porcentaje': trabajo.porcentaje,
+        'reanudable': trabajo.reanudable
+    }
 
-def procesar_firma_png(firma_data, campo, story, value_style):
-    """Procesar firma como imagen PNG - CÓDIGO EXACTO DE FirmasHTML"""
+@app.route('/formularios/regenerar-pdfs', methods=['POST'])
+@login_required
+def regenerar_pdfs_formularios():
+    """Lanzar la regeneración de los PDF de un formulario o rango de fechas - solo administradores"""
+    if current_user.rol.nombre != 'Administrador':
+        flash('No tienes permisos para realizar esta acción', 'error')
+        return redirect(url_for('formularios'))
+    
     try:
-        image_bytes = b""
-        print(f"DEBUG: === INICIANDO procesar_firma_png para campo {campo.id} ===")
-        print(f"DEBUG: Datos de firma recibidos: {len(firma_data)} caracteres")
-        
-        import base64
-        from datetime import datetime
-        from PIL import Image as PILImage
-        from io import BytesIO
-        from reportlab.platypus import Image, Spacer, Paragraph
-        
-        # Si firma_data es una ruta (cuando la guardamos en POST), úsala directamente
-        posible_path = os.path.join(app.config['UPLOAD_FOLDER'], firma_data) if not os.path.isabs(firma_data) else firma_data
-        if os.path.exists(posible_path):
-            print(f"DEBUG: Usando archivo de firma existente: {posible_path}")
-            png_path = posible_path
-            img = PILImage.open(png_path)
-            bg = img.convert('RGB')
-        else:
-            # Separar el prefijo data:url si existe (EXACTO como FirmasHTML)
-            if ',' in firma_data:
-                _, encoded = firma_data.split(',', 1)
-            else:
-                encoded = firma_data
+        formulario_id = int(request.form['formulario_id']) if request.form.get('formulario_id') else None
+        fecha_desde = datetime.strptime(request.form['desde'], '%Y-%m-%d').date() if request.form.get('desde') else None
+        fecha_hasta = datetime.strptime(request.form['hasta'], '%Y-%m-%d').date() if request.form.get('hasta') else None
+    except ValueError:
+        flash('Formulario o fechas no válidos', 'error')
+        return redirect(url_for('formularios'))
+    
+    trabajo = crear_regeneracion_pdfs(formulario_id, fecha_desde, fecha_hasta, current_user.id)
+    if not trabajo.total:
+        trabajo.estado = 'Completada'
+        db.session.commit()
+        flash('No hay respuestas en ese rango para regenerar', 'info')
+    else:
+        iniciar_regeneracion_pdfs(trabajo.id)
+        flash(f'Regeneración iniciada: {trabajo.total} PDF', 'success')
+    return redirect(url_for('formularios'))
 
-            print(f"DEBUG: Base64 extraído, longitud: {len(encoded)}")
+@app.route('/formularios/regenerar-pdfs/<int:id>/<accion>', methods=['POST'])
+@login_required
+def gestionar_regeneracion_pdfs(id, accion):
+    """Reanudar o cancelar un trabajo de regeneración - solo administradores"""
+    if current_user.rol.nombre != 'Administrador':
+        return jsonify({'success': False, 'message': 'No tienes permisos para realizar esta acción'}), 403
+    
+    trabajo = RegeneracionPDF.query.get_or_404(id)
+    if accion == 'cancelar' and trabajo.estado in ('Pendiente', 'En curso', 'Interrumpida'):
+        # El hilo en curso lo detecta al terminar la tanda actual
+        trabajo.estado = 'Cancelada'
+        db.session.commit()
+    elif accion == 'reanudar' and iniciar_regeneracion_pdfs(trabajo.id):
+        db.session.refresh(trabajo)
+    else:
+        return jsonify({'success': False, 'message': f'No se puede {accion} el trabajo en estado {trabajo.estado}'}), 400
+    return jsonify({'success': True, 'regeneracion': _regeneracion_a_dict(trabajo)})
 
-            # Decodificar base64 (EXACTO como FirmasHTML - SIN LIMPIEZA)
-            try:
-                image_bytes = base64.b64decode(encoded)
-                print(f"DEBUG: Base64 decodificado exitosamente, tamaño: {len(image_bytes)} bytes")
-            except Exception as e:
-                print(f"ERROR: Base64 decode failed: {e}")
-                print(f"DEBUG: Base64 problemático: {encoded[:100]}...")
-                raise e
-
-            # Guardar temporalmente la imagen PNG (EXACTO como FirmasHTML)
-            img = PILImage.open(BytesIO(image_bytes)).convert('RGBA')
-            bg = PILImage.new("RGB", img.size, (255, 255, 255))
-            bg.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-
-            # Crear estructura de carpetas organizada
-            firmas_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'formularios', 'firmas')
-            os.makedirs(firmas_dir, exist_ok=True)
-            png_filename = f'firma_{campo.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-            png_path = os.path.join(firmas_dir, png_filename)
-            bg.save(png_path, format='PNG')
-            print(f"DEBUG: Imagen PNG guardada en: {png_path}")
-        
-        # En este punto tenemos bg (imagen PIL en RGB) y png_path (ruta del PNG)
-        
-        # Verificar archivo
-        if os.path.exists(png_path):
-            file_size = os.path.getsize(png_path)
-            print(f"DEBUG: ✅ Archivo PNG creado exitosamente - Tamaño: {file_size} bytes")
-        else:
-            print(f"DEBUG: ❌ ERROR: Archivo PNG NO se creó")
-            raise Exception("No se pudo crear el archivo PNG de la firma")
-        
-        # Escalar la firma (EXACTO como FirmasHTML)
-        img_w, img_h = bg.size
-        from reportlab.lib.pagesizes import A4
-        page_w, page_h = A4
-        max_width = min(page_w * 0.4, 300)
-        scale = max_width / img_w
-        draw_w = img_w * scale
-        draw_h = img_h * scale
-        
-        print(f"DEBUG: Imagen original: {img_w}x{img_h}, Escalada: {draw_w}x{draw_h}")
-        
-        # Crear imagen para PDF (EXACTO como FirmasHTML)
-        pdf_image = Image(png_path, width=draw_w, height=draw_h)
-        story.append(pdf_image)
-        story.append(Spacer(1, 10))
-        
-        print(f"DEBUG: ✅ Firma PNG agregada al PDF exitosamente")
-            
-    except Exception as e:
-        print(f"ERROR: Error en procesar_firma_png: {e}")
-        # En caso de error, agregar texto de error
-        error_text = f"<b>Firma Digital:</b> Error procesando imagen ({str(e)[:50]}...)"
-        error_paragraph = Paragraph(error_text, value_style)
-        story.append(error_paragraph)
+@app.route('/api/regeneraciones-pdf')
+@login_required
+def api_regeneraciones_pdf():
+    """Progreso de los trabajos de regeneración más recientes"""
+    if current_user.rol.nombre != 'Administrador':
+        return jsonify({'success': False, 'message': 'No tienes permisos para realizar esta acción'}), 403
+    trabajos = RegeneracionPDF.query.order_by(RegeneracionPDF.id.desc()).limit(10).all()
+    return jsonify({'success': True, 'regeneraciones': [_regeneracion_a_dict(trabajo) for trabajo in trabajos]})
 
 if __name__ == '__main__':
     init_db()
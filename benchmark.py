@@ -0,0 +1,803 @@
+#!/usr/bin/env python3
+"""
+Benchmark de generación de PDF del ERP BACS con datos sintéticos
+
+Siembra una base SQLite (o una base MySQL local dedicada) con clientes, sedes,
+incidencias, fotos y firmas generadas, ejecuta cada generador de PDF en un
+proceso independiente y guarda en JSON el tiempo, el pico de memoria (RSS),
+el tamaño del PDF y el desglose por etapas, junto con la revisión de git.
+
+Uso:
+    python benchmark.py pdf --escalas 10x2,50x3,200x4 --repeticiones 3
+    python benchmark.py comparar base.json nuevo.json --umbral 10
+    python benchmark.py firmas --corpus uploads/formularios/firmas
+    python benchmark.py diligenciar --campos 10,40,80,160
+    python benchmark.py busqueda --filas 1000000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timedelta
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+ESCALAS_POR_DEFECTO = '10x2,50x3,200x4'
+RESOLUCION_FOTOS = (1280, 960)
+SISTEMAS = ['CCTV', 'Control de acceso', 'Detección de incendio']
+
+# ==================== ENTORNO ====================
+
+def preparar_entorno(directorio, db_url):
+    """Configura la base de datos y la carpeta de uploads antes de importar la aplicación"""
+    uploads = os.path.join(directorio, 'uploads')
+    os.makedirs(uploads, exist_ok=True)
+    os.environ['DATABASE_URL'] = db_url
+    os.environ['UPLOAD_FOLDER'] = uploads
+    # El logo y las fuentes se resuelven relativos a la carpeta de la aplicación
+    os.chdir(DIRECTORIO_APP)
+    if DIRECTORIO_APP not in sys.path:
+        sys.path.insert(0, DIRECTORIO_APP)
+
+def obtener_revision():
+    """Revisión de git del código medido (con marca si hay cambios sin confirmar)"""
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                           cwd=DIRECTORIO_APP, stderr=subprocess.DEVNULL).decode().strip()
+        cambios = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                          cwd=DIRECTORIO_APP, stderr=subprocess.DEVNULL).decode().strip()
+        return revision + ('-modificado' if cambios else '')
+    except Exception:
+        return 'desconocida'
+
+def leer_rss_pico_kb():
+    """Pico de memoria residente del proceso actual en KB (None si la plataforma no lo permite)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reporta bytes, Linux kilobytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def parsear_escalas(texto):
+    """Convierte '10x2,50x3' en [(10, 2), (50, 3)] (incidencias x imágenes por incidencia)"""
+    escalas = []
+    for parte in texto.split(','):
+        incidencias, _, imagenes = parte.strip().partition('x')
+        escalas.append((int(incidencias), int(imagenes or 0)))
+    return escalas
+
+# ==================== DATOS SINTÉTICOS ====================
+
+def generar_foto(ruta, semilla):
+    """Foto sintética con degradado, ruido y formas para que comprima como una foto real"""
+    from PIL import Image, ImageDraw
+
+    generador = random.Random(semilla)
+    ancho, alto = RESOLUCION_FOTOS
+    base = Image.linear_gradient('L').resize((ancho, alto)).convert('RGB')
+    ruido = Image.effect_noise((ancho, alto), generador.randint(20, 60)).convert('RGB')
+    foto = Image.blend(base, ruido, 0.4)
+    dibujo = ImageDraw.Draw(foto)
+    for _ in range(12):
+        x, y = generador.randint(0, ancho), generador.randint(0, alto)
+        color = tuple(generador.randint(0, 255) for _ in range(3))
+        dibujo.rectangle([x, y, x + generador.randint(40, 300), y + generador.randint(40, 300)], fill=color)
+    foto.save(ruta, 'JPEG', quality=85)
+
+def generar_firma(ruta, semilla):
+    """Firma sintética: trazos negros sobre fondo transparente como los del canvas"""
+    from PIL import Image, ImageDraw
+
+    generador = random.Random(semilla)
+    firma = Image.new('RGBA', (400, 200), (0, 0, 0, 0))
+    dibujo = ImageDraw.Draw(firma)
+    puntos = [(generador.randint(20, 380), generador.randint(30, 170)) for _ in range(25)]
+    dibujo.line(puntos, fill=(0, 0, 0, 255), width=3)
+    firma.save(ruta, 'PNG')
+
+def sembrar_datos(erp, num_incidencias, imagenes_por_incidencia):
+    """Recrea el esquema y siembra datos sintéticos para una escala"""
+    from werkzeug.security import generate_password_hash
+
+    upload_folder = erp.app.config['UPLOAD_FOLDER']
+    shutil.rmtree(upload_folder, ignore_errors=True)
+    firmas_dir = os.path.join(upload_folder, 'formularios', 'firmas')
+    imagenes_dir = os.path.join(upload_folder, 'formularios', 'imagenes')
+    os.makedirs(firmas_dir, exist_ok=True)
+    os.makedirs(imagenes_dir, exist_ok=True)
+
+    with erp.app.app_context():
+        erp.db.drop_all()
+        erp.db.create_all()
+
+        rol = erp.Rol('Administrador')
+        erp.db.session.add(rol)
+        erp.db.session.flush()
+
+        usuario = erp.User(nombre='Benchmark', tipo_documento='CC', numero_documento='1000',
+                           telefono='3000000000', correo='benchmark@erp.local',
+                           password_hash=generate_password_hash('benchmark'), rol_id=rol.id)
+        erp.db.session.add(usuario)
+
+        sistemas = [erp.Sistema(nombre) for nombre in SISTEMAS]
+        erp.db.session.add_all(sistemas)
+
+        sedes = []
+        for c in range(max(1, num_incidencias // 25)):
+            cliente = erp.Cliente(nombre=f'Cliente {c + 1}', tipo_documento='NIT', numero_documento=f'900{c:05d}',
+                                  correo=f'cliente{c + 1}@erp.local', telefono='6010000000')
+            erp.db.session.add(cliente)
+            erp.db.session.flush()
+            for s in range(2):
+                sede = erp.Sede(cliente_id=cliente.id, nombre=f'Sede {s + 1} - Cliente {c + 1}')
+                erp.db.session.add(sede)
+                sedes.append(sede)
+        erp.db.session.flush()
+
+        semilla = 0
+        for i in range(num_incidencias):
+            sede = sedes[i % len(sedes)]
+            archivos = []
+            for j in range(imagenes_por_incidencia):
+                nombre = f'bench_{i}_{j}.jpg'
+                generar_foto(os.path.join(upload_folder, nombre), semilla)
+                semilla += 1
+                archivos.append(nombre)
+
+            # Con tres o más fotos, la mitad (al menos dos) se agrupa en un collage
+            sueltas = archivos if len(archivos) < 3 else archivos[:min(len(archivos) // 2, len(archivos) - 2)]
+            configuracion = {
+                'imagenes_individuales': [{'archivo': a, 'titulo': f'Registro fotográfico {a}'} for a in sueltas],
+                'collages': [{'titulo': f'Collage actividad {i + 1}', 'imagenes': archivos[len(sueltas):]}] if len(archivos) >= 3 else []
+            }
+
+            erp.db.session.add(erp.Incidencia(
+                indice=f'BENCH{i:06d}',
+                titulo=f'Mantenimiento preventivo {i + 1}',
+                descripcion='Revisión de equipos, limpieza de cámaras y verificación de grabación. ' * random.Random(i).randint(1, 6),
+                estado=['Abierta', 'En proceso', 'Cerrada'][i % 3],
+                creado_por=usuario.id,
+                tecnico_asignado=usuario.id,
+                cliente_id=sede.cliente_id,
+                sede_id=sede.id,
+                sistema_id=sistemas[i % len(sistemas)].id,
+                adjuntos=','.join(archivos) if archivos else None,
+                titulos_imagenes=','.join(archivos) if archivos else None,
+                configuracion_imagenes=json.dumps(configuracion) if archivos else None
+            ))
+
+        # Formulario con firma y fotos; una respuesta por cada 10 incidencias
+        formulario = erp.Formulario(nombre='Acta de mantenimiento', descripcion='Formulario sintético', creado_por=usuario.id)
+        erp.db.session.add(formulario)
+        erp.db.session.flush()
+        campos = {}
+        for orden, tipo in enumerate(['texto', 'textarea', 'fecha', 'seleccion', 'foto', 'firma', 'texto_informativo']):
+            campo = erp.CampoFormulario(formulario_id=formulario.id, tipo_campo=tipo, titulo=f'Campo {tipo}', orden=orden,
+                                        configuracion=json.dumps({'opciones': ['Conforme', 'No conforme']}) if tipo == 'seleccion' else None)
+            erp.db.session.add(campo)
+            campos[tipo] = campo
+        erp.db.session.flush()
+
+        for r in range(max(1, num_incidencias // 10)):
+            respuesta = erp.RespuestaFormulario(formulario_id=formulario.id, diligenciado_por=usuario.id)
+            erp.db.session.add(respuesta)
+            erp.db.session.flush()
+
+            fotos = []
+            for j in range(imagenes_por_incidencia):
+                nombre = f'foto_bench_{r}_{j}.jpg'
+                generar_foto(os.path.join(imagenes_dir, nombre), semilla)
+                semilla += 1
+                fotos.append(nombre)
+            firma = f'firma_bench_{r}.png'
+            generar_firma(os.path.join(firmas_dir, firma), r)
+
+            valores = [
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['texto'].id, valor_texto='Técnico de prueba'),
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['textarea'].id, valor_texto='Observaciones del mantenimiento. ' * 8),
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['fecha'].id, valor_fecha=datetime(2024, 1, 1 + r % 28)),
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['seleccion'].id, valor_texto='Conforme'),
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['foto'].id, valor_archivo=','.join(fotos) or None),
+                erp.RespuestaCampo(respuesta_formulario_id=respuesta.id, campo_id=campos['firma'].id,
+                                   valor_archivo=os.path.join('formularios', 'firmas', firma),
+                                   nombre_firmante='Firmante de prueba', documento_firmante='123456', cargo_firmante='Supervisor')
+            ]
+            erp.db.session.add_all(valores)
+
+        erp.db.session.commit()
+
+# ==================== MEDICIÓN POR ETAPAS ====================
+
+class Etapas:
+    """Acumula el tiempo exclusivo de cada etapa (las etapas anidadas no se cuentan dos veces)"""
+
+    def __init__(self):
+        self.tiempos = {}
+        self._pila = []
+
+    def envolver(self, nombre, funcion):
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            self._pila.append(0.0)
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                hijos = self._pila.pop()
+                total = time.perf_counter() - inicio
+                self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + total - hijos
+                if self._pila:
+                    self._pila[-1] += total
+        return envoltura
+
+def instrumentar(erp, etapas):
+    """Envuelve las funciones de la aplicación que forman las etapas de un PDF"""
+    for nombre, funcion in [('imagenes', 'imagen_a_buffer'),
+                            ('collages', 'crear_collage_imagenes'),
+                            ('logo', 'obtener_logo_pdf')]:
+        if hasattr(erp, funcion):
+            setattr(erp, funcion, etapas.envolver(nombre, getattr(erp, funcion)))
+    erp.PILImage.Image.resize = etapas.envolver('redimensionado', erp.PILImage.Image.resize)
+    erp.SimpleDocTemplate.build = etapas.envolver('maquetacion', erp.SimpleDocTemplate.build)
+
+def contar_paginas(pdf_bytes):
+    return len(re.findall(rb'/Type /Page\b(?!s)', pdf_bytes))
+
+# ==================== GENERADORES ====================
+
+DATOS_INFORME = {
+    'cliente': 'Cliente Benchmark',
+    'atencion': 'Persona de contacto',
+    'cargo': 'Jefe de mantenimiento',
+    'alcance': 'Mantenimiento preventivo y correctivo',
+    'fecha': '2024-01-01',
+    'introduccion': 'Este informe presenta las actividades realizadas durante el período de mantenimiento. ' * 4,
+    'conclusiones': 'Se completaron todas las actividades programadas.',
+    'version': '1'
+}
+
+def _generar_informe_html(erp, incidencias):
+    return erp.construir_pdf_informe_html_format(incidencias, DATOS_INFORME)
+
+def _generar_profesional(erp, incidencias):
+    return erp.construir_pdf_profesional(incidencias)
+
+def _generar_formulario(erp, incidencias):
+    pdf = b''
+    for respuesta in erp.RespuestaFormulario.query.all():
+        documento = erp.generar_pdf_formulario(respuesta)
+        if documento:
+            ruta = os.path.join(erp.app.config['UPLOAD_FOLDER'], 'formularios',
+                                erp.secure_filename(respuesta.formulario.nombre), documento)
+            with open(ruta, 'rb') as f:
+                pdf += f.read()
+    return pdf
+
+GENERADORES = {
+    'informe_html': _generar_informe_html,
+    'profesional': _generar_profesional,
+    'formulario': _generar_formulario
+}
+
+def _medir_generador(generador, cola):
+    """Se ejecuta en un proceso nuevo: el pico de RSS corresponde solo a este generador"""
+    try:
+        cola.put(_medicion_generador(generador))
+    except Exception as e:
+        # El error viaja al proceso principal, que lo registra en lugar de esperar un resultado
+        cola.put({'error': f'{type(e).__name__}: {e}', 'traza': traceback.format_exc()})
+
+def _medicion_generador(generador):
+    import app as erp
+
+    etapas = Etapas()
+    instrumentar(erp, etapas)
+
+    with erp.app.app_context():
+        rss_inicial = leer_rss_pico_kb()
+        inicio = time.perf_counter()
+
+        inicio_consulta = time.perf_counter()
+        incidencias_ids = [incidencia_id for (incidencia_id,) in erp.db.session.query(erp.Incidencia.id)]
+        incidencias = erp.cargar_instantaneas_incidencias(incidencias_ids)
+        etapas.tiempos['consulta'] = time.perf_counter() - inicio_consulta
+
+        # Los generadores imprimen mensajes de depuración; no deben contar en la medición
+        with contextlib.redirect_stdout(io.StringIO()):
+            pdf_bytes = GENERADORES[generador](erp, incidencias)
+
+        tiempo = time.perf_counter() - inicio
+
+    etapas.tiempos['otros'] = max(0.0, tiempo - sum(etapas.tiempos.values()))
+    return {
+        'tiempo_s': round(tiempo, 4),
+        'rss_inicial_kb': rss_inicial,
+        'rss_pico_kb': leer_rss_pico_kb(),
+        'tamano_bytes': len(pdf_bytes),
+        'paginas': contar_paginas(pdf_bytes),
+        'etapas_s': {nombre: round(valor, 4) for nombre, valor in sorted(etapas.tiempos.items())}
+    }
+
+def medir(generador, limite_s=3600):
+    """Resultado del generador medido en un proceso aparte, o {'error': ...} si falla o muere"""
+    contexto = multiprocessing.get_context('spawn')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_medir_generador, args=(generador, cola))
+    proceso.start()
+    fin = time.monotonic() + limite_s
+    try:
+        while True:
+            try:
+                return cola.get(timeout=1)
+            except queue.Empty:
+                if not proceso.is_alive():
+                    return {'error': f'el proceso terminó sin resultado (código {proceso.exitcode})'}
+                if time.monotonic() > fin:
+                    proceso.terminate()
+                    return {'error': f'sin resultado tras {limite_s}s'}
+    finally:
+        proceso.join()
+
+# ==================== COMANDOS ====================
+
+def resumir(resultados):
+    """Mediana por generador y escala"""
+    grupos = {}
+    for r in resultados:
+        if 'error' in r:
+            continue
+        grupos.setdefault((r['generador'], r['incidencias'], r['imagenes_por_incidencia']), []).append(r)
+    resumen = []
+    for (generador, incidencias, imagenes), filas in sorted(grupos.items()):
+        resumen.append({
+            'generador': generador,
+            'incidencias': incidencias,
+            'imagenes_por_incidencia': imagenes,
+            'tiempo_mediana_s': round(statistics.median(f['tiempo_s'] for f in filas), 4),
+            'rss_pico_max_kb': max((f['rss_pico_kb'] or 0) for f in filas) or None,
+            'tamano_bytes': filas[-1]['tamano_bytes'],
+            'paginas': filas[-1]['paginas']
+        })
+    return resumen
+
+def comando_pdf(args):
+    directorio = args.directorio or tempfile.mkdtemp(prefix='erp_benchmark_')
+    db_url = args.db or 'sqlite:///' + os.path.join(directorio, 'benchmark.db')
+    if not db_url.startswith('sqlite') and not args.forzar:
+        print("❌ El benchmark borra y recrea las tablas: use una base dedicada y confirme con --forzar")
+        return 1
+
+    # Resolver la salida antes de cambiar a la carpeta de la aplicación
+    archivo = os.path.abspath(args.salida or f"benchmark_{obtener_revision()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    preparar_entorno(directorio, db_url)
+    import app as erp
+
+    generadores = args.generadores.split(',') if args.generadores else list(GENERADORES)
+    resultados = []
+
+    print("⏱️  Benchmark de generación de PDF")
+    print("=" * 50)
+    for num_incidencias, imagenes in parsear_escalas(args.escalas):
+        print(f"🌱 Sembrando {num_incidencias} incidencias con {imagenes} imágenes cada una...")
+        inicio = time.perf_counter()
+        sembrar_datos(erp, num_incidencias, imagenes)
+        print(f"   Datos listos en {time.perf_counter() - inicio:.1f}s")
+
+        for generador in generadores:
+            for repeticion in range(args.repeticiones):
+                resultado = medir(generador)
+                resultado.update({
+                    'generador': generador,
+                    'incidencias': num_incidencias,
+                    'imagenes_por_incidencia': imagenes,
+                    'repeticion': repeticion + 1
+                })
+                resultados.append(resultado)
+                if 'error' in resultado:
+                    print(f"   ❌ {generador:<14} #{repeticion + 1}: {resultado['error']}")
+                    continue
+                print(f"   {generador:<14} #{repeticion + 1}: {resultado['tiempo_s']:.3f}s, "
+                      f"{resultado['tamano_bytes'] / 1024:.0f} KB, {resultado['paginas']} páginas, "
+                      f"RSS pico {resultado['rss_pico_kb'] or '-'} KB")
+
+    salida = {
+        'revision': obtener_revision(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'base_datos': db_url.split(':', 1)[0],
+        'resolucion_fotos': list(RESOLUCION_FOTOS),
+        'resumen': resumir(resultados),
+        'resultados': resultados
+    }
+    with open(archivo, 'w', encoding='utf-8') as f:
+        json.dump(salida, f, indent=2, ensure_ascii=False)
+
+    print("=" * 50)
+    print(f"📄 Resultados guardados en {archivo}")
+    if not args.directorio:
+        shutil.rmtree(directorio, ignore_errors=True)
+    fallidos = sorted({r['generador'] for r in resultados if 'error' in r})
+    if fallidos:
+        print(f"❌ Generadores con errores: {', '.join(fallidos)}")
+        return 1
+    return 0
+
+def comando_comparar(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding='utf-8') as f:
+        nuevo = json.load(f)
+
+    clave = lambda r: (r['generador'], r['incidencias'], r['imagenes_por_incidencia'])
+    tiempos_base = {clave(r): r for r in base['resumen']}
+    regresiones = 0
+
+    print(f"📊 {base['revision']} → {nuevo['revision']}")
+    for r in nuevo['resumen']:
+        anterior = tiempos_base.get(clave(r))
+        if not anterior:
+            continue
+        cambio = (r['tiempo_mediana_s'] / anterior['tiempo_mediana_s'] - 1) * 100 if anterior['tiempo_mediana_s'] else 0
+        marca = '❌' if cambio > args.umbral else '✅'
+        if cambio > args.umbral:
+            regresiones += 1
+        print(f"   {marca} {r['generador']:<14} {r['incidencias']}x{r['imagenes_por_incidencia']}: "
+              f"{anterior['tiempo_mediana_s']:.3f}s → {r['tiempo_mediana_s']:.3f}s ({cambio:+.1f}%)")
+
+    return 1 if regresiones else 0
+
+def medir_pdf_firmas(imagenes, ancho_pt=300):
+    """Tamaño de un PDF con una página por firma, cada una dibujada a ancho_pt de ancho"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    lienzo = canvas.Canvas(buffer, pagesize=letter)
+    for imagen in imagenes:
+        lector = ImageReader(imagen)
+        ancho, alto = lector.getSize()
+        lienzo.drawImage(lector, 72, 400, width=ancho_pt, height=ancho_pt * alto / ancho, mask='auto')
+        lienzo.showPage()
+    lienzo.save()
+    return len(buffer.getvalue())
+
+def comando_firmas(args):
+    directorio = tempfile.mkdtemp(prefix='erp_benchmark_firmas_')
+    # Resolver rutas antes de cambiar a la carpeta de la aplicación
+    corpus = os.path.abspath(args.corpus) if args.corpus else None
+    archivo = os.path.abspath(args.salida) if args.salida else None
+    preparar_entorno(directorio, 'sqlite:///' + os.path.join(directorio, 'benchmark.db'))
+    import app as erp
+
+    if corpus:
+        rutas = sorted(os.path.join(corpus, n) for n in os.listdir(corpus) if n.lower().endswith('.png'))
+    else:
+        rutas = []
+        for semilla in range(args.cantidad):
+            ruta = os.path.join(directorio, f'firma_{semilla}.png')
+            generar_firma(ruta, semilla)
+            rutas.append(ruta)
+    if not rutas:
+        print(f"❌ No hay firmas PNG en {corpus}")
+        return 1
+
+    print(f"✍️  Normalización de {len(rutas)} firmas")
+    print("=" * 50)
+    originales, normalizadas = [], []
+    bytes_originales = bytes_normalizados = 0
+    inicio = time.perf_counter()
+    for i, ruta in enumerate(rutas):
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        normalizada = os.path.join(directorio, f'normalizada_{i}.png')
+        erp.normalizar_imagen_firma(io.BytesIO(datos)).save(normalizada, format='PNG', optimize=True)
+        bytes_originales += len(datos)
+        bytes_normalizados += os.path.getsize(normalizada)
+        originales.append(io.BytesIO(datos))
+        # Lo mismo que incrusta firma_flowable_pdf: la copia en gris de la caché o el propio PNG
+        firma = erp._leer_firma(normalizada, os.path.getmtime(normalizada))
+        normalizadas.append(io.BytesIO(firma.png_gris) if firma.png_gris else normalizada)
+    tiempo = time.perf_counter() - inicio
+
+    pdf_original = medir_pdf_firmas(originales)
+    pdf_normalizado = medir_pdf_firmas(normalizadas)
+    reduccion = lambda antes, despues: round((1 - despues / antes) * 100, 1) if antes else 0.0
+
+    salida = {
+        'revision': obtener_revision(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'corpus': corpus or f'sintético ({args.cantidad})',
+        'firmas': len(rutas),
+        'normalizacion_ms_por_firma': round(tiempo / len(rutas) * 1000, 3),
+        'almacenamiento_bytes': {'original': bytes_originales, 'normalizado': bytes_normalizados,
+                                 'reduccion_pct': reduccion(bytes_originales, bytes_normalizados)},
+        'pdf_bytes': {'original': pdf_original, 'normalizado': pdf_normalizado,
+                      'reduccion_pct': reduccion(pdf_original, pdf_normalizado)}
+    }
+    print(f"   Almacenamiento: {bytes_originales / 1024:.1f} KB → {bytes_normalizados / 1024:.1f} KB "
+          f"({salida['almacenamiento_bytes']['reduccion_pct']}% menos)")
+    print(f"   PDF:            {pdf_original / 1024:.1f} KB → {pdf_normalizado / 1024:.1f} KB "
+          f"({salida['pdf_bytes']['reduccion_pct']}% menos)")
+    print(f"   Normalización:  {salida['normalizacion_ms_por_firma']} ms por firma")
+
+    if archivo:
+        with open(archivo, 'w', encoding='utf-8') as f:
+            json.dump(salida, f, indent=2, ensure_ascii=False)
+        print(f"📄 Resultados guardados en {archivo}")
+    shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+TIPOS_CAMPO_DILIGENCIAR = ['texto', 'textarea', 'fecha', 'seleccion']
+
+def crear_formulario_campos(erp, num_campos):
+    """Formulario con num_campos campos de texto, fecha y selección más una firma; retorna (id, datos del POST)"""
+    with erp.app.app_context():
+        usuario = erp.User.query.first()
+        formulario = erp.Formulario(nombre=f'Formulario {num_campos} campos', creado_por=usuario.id)
+        erp.db.session.add(formulario)
+        erp.db.session.flush()
+        campos = [erp.CampoFormulario(formulario_id=formulario.id, tipo_campo=TIPOS_CAMPO_DILIGENCIAR[i % len(TIPOS_CAMPO_DILIGENCIAR)],
+                                      titulo=f'Campo {i + 1}', orden=i,
+                                      configuracion=json.dumps({'opciones': ['Conforme', 'No conforme']}) if i % len(TIPOS_CAMPO_DILIGENCIAR) == 3 else None)
+                  for i in range(num_campos)]
+        firma = erp.CampoFormulario(formulario_id=formulario.id, tipo_campo='firma', titulo='Firma', orden=num_campos)
+        erp.db.session.add_all(campos + [firma])
+        erp.db.session.commit()
+
+        datos = {}
+        for campo in campos:
+            datos[f'campo_{campo.id}'] = {'fecha': '2024-01-15', 'seleccion': 'Conforme'}.get(campo.tipo_campo, f'Valor del campo {campo.titulo}')
+        trazos = {'ancho': 400, 'alto': 200, 'trazos': [[[20 + i * 7, 100 + (i % 5) * 10, i * 16] for i in range(50)]]}
+        datos[f'trazos_{firma.id}'] = json.dumps(trazos)
+        datos[f'nombre_{firma.id}'] = 'Firmante de prueba'
+        return formulario.id, datos
+
+def comando_diligenciar(args):
+    directorio = tempfile.mkdtemp(prefix='erp_benchmark_diligenciar_')
+    archivo = os.path.abspath(args.salida) if args.salida else None
+    preparar_entorno(directorio, 'sqlite:///' + os.path.join(directorio, 'benchmark.db'))
+    import app as erp
+    from sqlalchemy import event
+
+    sembrar_datos(erp, 0, 0)
+    # PDF dentro de la petición para poder separar el tiempo de guardado del de renderizado
+    erp.app.config['FORMULARIO_PDF_WORKERS'] = 0
+    etapas = Etapas()
+    erp.generar_pdf_formulario = etapas.envolver('pdf', erp.generar_pdf_formulario)
+    sentencias = {'total': 0}
+    with erp.app.app_context():
+        event.listen(erp.db.engine, 'before_cursor_execute',
+                     lambda *a: sentencias.__setitem__('total', sentencias['total'] + 1))
+
+    cliente = erp.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['_user_id'] = '1'
+        sesion['_fresh'] = True
+
+    print("⏱️  Latencia de envío de formularios")
+    print("=" * 50)
+    resultados = []
+    for num_campos in [int(n) for n in args.campos.split(',')]:
+        formulario_id, datos = crear_formulario_campos(erp, num_campos)
+        tiempos, tiempos_pdf, consultas = [], [], []
+        for _ in range(args.repeticiones):
+            etapas.tiempos.clear()
+            sentencias['total'] = 0
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                respuesta = cliente.post(f'/formularios/{formulario_id}/diligenciar', data=datos)
+            tiempos.append(time.perf_counter() - inicio)
+            tiempos_pdf.append(etapas.tiempos.get('pdf', 0.0))
+            consultas.append(sentencias['total'])
+            if respuesta.status_code != 302:
+                print(f"❌ El envío con {num_campos} campos falló ({respuesta.status_code})")
+                return 1
+
+        resultado = {
+            'campos': num_campos,
+            'tiempo_mediana_s': round(statistics.median(tiempos), 4),
+            'guardado_mediana_s': round(statistics.median(t - p for t, p in zip(tiempos, tiempos_pdf)), 4),
+            'pdf_mediana_s': round(statistics.median(tiempos_pdf), 4),
+            'sentencias_sql': max(consultas)
+        }
+        resultados.append(resultado)
+        print(f"   {num_campos:>4} campos: {resultado['tiempo_mediana_s']:.3f}s "
+              f"(guardado {resultado['guardado_mediana_s']:.3f}s, PDF {resultado['pdf_mediana_s']:.3f}s), "
+              f"{resultado['sentencias_sql']} sentencias SQL")
+
+    if archivo:
+        salida = {
+            'revision': obtener_revision(),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'repeticiones': args.repeticiones,
+            'resultados': resultados
+        }
+        with open(archivo, 'w', encoding='utf-8') as f:
+            json.dump(salida, f, indent=2, ensure_ascii=False)
+        print(f"📄 Resultados guardados en {archivo}")
+    shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+ESTADOS_EQUIPO = ['Operativo'] * 90 + ['Mantenimiento'] * 9 + ['Falla']
+INDICES_BUSQUEDA = ['ix_respuesta_campo_campo_texto', 'ix_respuesta_campo_campo_fecha']
+
+def sembrar_respuestas(erp, num_filas, num_campos):
+    """Formulario de inspección con num_filas valores en respuesta_campo (num_campos por respuesta); retorna su ID"""
+    generador = random.Random(47)
+    with erp.app.app_context():
+        usuario = erp.User.query.first()
+        formulario = erp.Formulario(nombre='Inspección de equipos', creado_por=usuario.id)
+        erp.db.session.add(formulario)
+        erp.db.session.flush()
+        campos = [erp.CampoFormulario(formulario_id=formulario.id, tipo_campo='seleccion', titulo='Estado del equipo', orden=0,
+                                      configuracion=json.dumps({'opciones': sorted(set(ESTADOS_EQUIPO))})),
+                  erp.CampoFormulario(formulario_id=formulario.id, tipo_campo='fecha', titulo='Fecha de inspección', orden=1)]
+        campos += [erp.CampoFormulario(formulario_id=formulario.id, tipo_campo='texto', titulo=f'Observación {i}', orden=i)
+                   for i in range(2, num_campos)]
+        erp.db.session.add_all(campos)
+        erp.db.session.commit()
+        ids_campos = [campo.id for campo in campos]
+
+        tabla_respuestas = erp.RespuestaFormulario.__table__
+        tabla_valores = erp.RespuestaCampo.__table__
+        num_respuestas = num_filas // num_campos
+        primera = (erp.db.session.query(erp.db.func.max(erp.RespuestaFormulario.id)).scalar() or 0) + 1
+        lote = 5000
+        for inicio in range(primera, primera + num_respuestas, lote):
+            ids = range(inicio, min(inicio + lote, primera + num_respuestas))
+            respuestas, valores = [], []
+            for respuesta_id in ids:
+                fecha = datetime(2023, 1, 1) + timedelta(days=generador.randrange(730))
+                respuestas.append({'id': respuesta_id, 'formulario_id': formulario.id, 'diligenciado_por': usuario.id,
+                                   'fecha_diligenciamiento': fecha, 'estado': 'Completado'})
+                for campo_id in ids_campos:
+                    fila = dict.fromkeys(erp.COLUMNAS_VALOR_RESPUESTA)
+                    fila.update(respuesta_formulario_id=respuesta_id, campo_id=campo_id)
+                    valores.append(fila)
+                valores[-num_campos]['valor_texto'] = generador.choice(ESTADOS_EQUIPO)
+                valores[-num_campos + 1]['valor_fecha'] = datetime(fecha.year, fecha.month, fecha.day)
+                for fila in valores[-num_campos + 2:]:
+                    fila['valor_texto'] = f'Sin novedad {generador.randrange(1000)}'
+            erp.db.session.execute(tabla_respuestas.insert(), respuestas)
+            erp.db.session.execute(tabla_valores.insert(), valores)
+            erp.db.session.commit()
+        return formulario.id
+
+def comando_busqueda(args):
+    directorio = tempfile.mkdtemp(prefix='erp_benchmark_busqueda_')
+    archivo = os.path.abspath(args.salida) if args.salida else None
+    preparar_entorno(directorio, 'sqlite:///' + os.path.join(directorio, 'benchmark.db'))
+    import app as erp
+    from sqlalchemy import text
+
+    sembrar_datos(erp, 0, 0)
+    print(f"🌱 Sembrando {args.filas} valores de respuesta ({args.campos} campos por respuesta)...")
+    inicio = time.perf_counter()
+    formulario_id = sembrar_respuestas(erp, args.filas, args.campos)
+    print(f"   listo en {time.perf_counter() - inicio:.1f}s")
+
+    consultas = {
+        'estado_falla': [('Estado del equipo', '=', 'Falla')],
+        'fecha_una_semana': [('Fecha de inspección', '>=', '2024-03-01'), ('Fecha de inspección', '<', '2024-03-08')],
+        'falla_en_un_mes': [('Estado del equipo', '=', 'Falla'), ('Fecha de inspección', '>=', '2024-03-01'),
+                            ('Fecha de inspección', '<', '2024-04-01')]
+    }
+
+    def medir_consultas():
+        medidas = {}
+        with erp.app.app_context():
+            formulario = erp.db.session.get(erp.Formulario, formulario_id)
+            for nombre, predicados in consultas.items():
+                tiempos = []
+                for _ in range(args.repeticiones):
+                    inicio = time.perf_counter()
+                    filas = erp.buscar_respuestas_formulario(formulario, predicados, limite=args.filas)
+                    tiempos.append(time.perf_counter() - inicio)
+                medidas[nombre] = {'tiempo_mediana_s': round(statistics.median(tiempos), 4), 'resultados': len(filas)}
+        return medidas
+
+    def medir_carga_completa():
+        # Lo que había que hacer antes: traer todos los valores del campo y filtrar en Python
+        with erp.app.app_context():
+            campo = erp.CampoFormulario.query.filter_by(formulario_id=formulario_id, titulo='Estado del equipo').one()
+            inicio = time.perf_counter()
+            coincidencias = [valor.respuesta_formulario_id for valor in erp.RespuestaCampo.query.filter_by(campo_id=campo.id)
+                             if valor.valor_texto == 'Falla']
+            return {'tiempo_s': round(time.perf_counter() - inicio, 4), 'resultados': len(coincidencias)}
+
+    print("⏱️  Búsqueda en respuestas de formularios")
+    print("=" * 50)
+    con_indices = medir_consultas()
+    with erp.app.app_context():
+        with erp.db.engine.begin() as conexion:
+            for indice in INDICES_BUSQUEDA:
+                conexion.execute(text(f'DROP INDEX {indice}'))
+    sin_indices = medir_consultas()
+    carga_completa = medir_carga_completa()
+
+    for nombre in consultas:
+        print(f"   {nombre:<18} {con_indices[nombre]['tiempo_mediana_s']:>8.4f}s con índices, "
+              f"{sin_indices[nombre]['tiempo_mediana_s']:>8.4f}s sin índices "
+              f"({con_indices[nombre]['resultados']} respuestas)")
+    print(f"   {'carga_completa':<18} {carga_completa['tiempo_s']:>8.4f}s filtrando en Python "
+          f"({carga_completa['resultados']} respuestas)")
+
+    if archivo:
+        salida = {
+            'revision': obtener_revision(),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'filas': args.filas,
+            'campos': args.campos,
+            'repeticiones': args.repeticiones,
+            'con_indices': con_indices,
+            'sin_indices': sin_indices,
+            'carga_completa': carga_completa
+        }
+        with open(archivo, 'w', encoding='utf-8') as f:
+            json.dump(salida, f, indent=2, ensure_ascii=False)
+        print(f"📄 Resultados guardados en {archivo}")
+    shutil.rmtree(directorio, ignore_errors=True)
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de generación de PDF del ERP BACS')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    pdf = subparsers.add_parser('pdf', help='Mide los generadores de PDF con datos sintéticos')
+    pdf.add_argument('--escalas', default=ESCALAS_POR_DEFECTO, help='Lista incidencias x imágenes, p. ej. 10x2,50x3')
+    pdf.add_argument('--generadores', help=f"Subconjunto de: {', '.join(GENERADORES)}")
+    pdf.add_argument('--repeticiones', type=int, default=3)
+    pdf.add_argument('--db', help='URL de base de datos dedicada (por defecto SQLite temporal)')
+    pdf.add_argument('--forzar', action='store_true', help='Permite recrear las tablas en una base que no es SQLite')
+    pdf.add_argument('--directorio', help='Carpeta de trabajo para la base y los uploads (se conserva)')
+    pdf.add_argument('--salida', help='Archivo JSON de resultados')
+    pdf.set_defaults(funcion=comando_pdf)
+
+    comparar = subparsers.add_parser('comparar', help='Compara dos archivos de resultados')
+    comparar.add_argument('base')
+    comparar.add_argument('nuevo')
+    comparar.add_argument('--umbral', type=float, default=10.0, help='Porcentaje de regresión tolerado')
+    comparar.set_defaults(funcion=comando_comparar)
+
+    firmas = subparsers.add_parser('firmas', help='Mide el ahorro de la normalización de firmas')
+    firmas.add_argument('--corpus', help='Carpeta con firmas PNG reales (por defecto firmas sintéticas)')
+    firmas.add_argument('--cantidad', type=int, default=50, help='Firmas sintéticas si no se indica --corpus')
+    firmas.add_argument('--salida', help='Archivo JSON de resultados')
+    firmas.set_defaults(funcion=comando_firmas)
+
+    diligenciar = subparsers.add_parser('diligenciar', help='Mide la latencia de envío de formularios según el número de campos')
+    diligenciar.add_argument('--campos', default='10,40,80,160', help='Lista de cantidades de campos')
+    diligenciar.add_argument('--repeticiones', type=int, default=5)
+    diligenciar.add_argument('--salida', help='Archivo JSON de resultados')
+    diligenciar.set_defaults(funcion=comando_diligenciar)
+
+    busqueda = subparsers.add_parser('busqueda', help='Mide la búsqueda de respuestas por valor de campo')
+    busqueda.add_argument('--filas', type=int, default=1000000, help='Valores de respuesta a sembrar')
+    busqueda.add_argument('--campos', type=int, default=10, help='Campos por respuesta (mínimo 3)')
+    busqueda.add_argument('--repeticiones', type=int, default=3)
+    busqueda.add_argument('--salida', help='Archivo JSON de resultados')
+    busqueda.set_defaults(funcion=comando_busqueda)
+
+    args = parser.parse_args()
+    return args.funcion(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,13 +5,57 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'tu_clave_secreta_muy_segura_aqui_2024'
-    SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{os.environ.get('DB_USER', 'root')}:{os.environ.get('DB_PASSWORD', '')}@{os.environ.get('DB_HOST', 'localhost')}/{os.environ.get('DB_NAME', 'erp_bacs')}"
+    # DATABASE_URL permite apuntar a otra base (p. ej. SQLite para el benchmark)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f"mysql+pymysql://{os.environ.get('DB_USER', 'root')}:{os.environ.get('DB_PASSWORD', '')}@{os.environ.get('DB_HOST', 'localhost')}/{os.environ.get('DB_NAME', 'erp_bacs')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Configuración de archivos
-    UPLOAD_FOLDER = 'uploads'
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # Subidas reanudables por fragmentos (fotos y adjuntos grandes, conexiones móviles inestables)
+    SUBIDA_TAMANO_FRAGMENTO = int(os.environ.get('SUBIDA_TAMANO_FRAGMENTO', 1024 * 1024))
+    SUBIDA_TAMANO_MAX = int(os.environ.get('SUBIDA_TAMANO_MAX', 200 * 1024 * 1024))
+    SUBIDA_EXPIRACION_HORAS = int(os.environ.get('SUBIDA_EXPIRACION_HORAS', 24))
+    
+    # Reducción de fotos en el navegador antes de subirlas (lado mayor en píxeles, 0 = sin reducir)
+    IMAGEN_CLIENTE_LADO_MAX = int(os.environ.get('IMAGEN_CLIENTE_LADO_MAX', 1600))
+    IMAGEN_CLIENTE_CALIDAD = float(os.environ.get('IMAGEN_CLIENTE_CALIDAD', 0.8))
+    
+    # Fuentes para PDF: Helvetica (estándar, sin archivos) o una familia TTF como Carlito, compatible con Calibri
+    FONTS_FOLDER = os.environ.get('FONTS_FOLDER', 'files/fonts')
+    PDF_FONT_FAMILY = os.environ.get('PDF_FONT_FAMILY', 'Helvetica')
+    
+    # Informes por volúmenes (selecciones muy grandes de incidencias)
+    INFORME_VOLUMEN_MAX_INCIDENCIAS = int(os.environ.get('INFORME_VOLUMEN_MAX_INCIDENCIAS', 200))
+    INFORME_VOLUMEN_MAX_PAGINAS = int(os.environ.get('INFORME_VOLUMEN_MAX_PAGINAS', 150))
+    INFORME_WORKERS = int(os.environ.get('INFORME_WORKERS', os.cpu_count() or 2))
+    
+    # Procesos de fondo para el PDF de los formularios diligenciados (0 = generarlo dentro de la petición)
+    FORMULARIO_PDF_WORKERS = int(os.environ.get('FORMULARIO_PDF_WORKERS', 2))
+    # Minutos en 'Generando' tras los que el PDF se da por abandonado y se genera al abrir la descarga
+    FORMULARIO_PDF_TIMEOUT_MIN = int(os.environ.get('FORMULARIO_PDF_TIMEOUT_MIN', 5))
+    
+    # Sincronización de formularios diligenciados sin conexión (el tamaño total lo limita MAX_CONTENT_LENGTH)
+    SINCRONIZACION_MAX_RESPUESTAS = int(os.environ.get('SINCRONIZACION_MAX_RESPUESTAS', 50))
+    
+    # Exportación de respuestas de formularios: filas leídas por lote del cursor del servidor
+    EXPORTACION_FILAS_POR_LOTE = int(os.environ.get('EXPORTACION_FILAS_POR_LOTE', 2000))
+    
+    # Regeneración masiva de PDF de formularios: procesos, pausa entre tandas (s) y prioridad (os.nice)
+    REGENERACION_PDF_WORKERS = int(os.environ.get('REGENERACION_PDF_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    REGENERACION_PDF_PAUSA = float(os.environ.get('REGENERACION_PDF_PAUSA', 0.5))
+    REGENERACION_PDF_NICE = int(os.environ.get('REGENERACION_PDF_NICE', 10))
+    
+    # Informes recurrentes pregenerados en horario valle
+    INFORMES_RECURRENTES_ARCHIVO = os.environ.get('INFORMES_RECURRENTES_ARCHIVO', 'informes_recurrentes.json')
+    INFORMES_CACHE_FOLDER = os.environ.get('INFORMES_CACHE_FOLDER', os.path.join(UPLOAD_FOLDER, 'informes_cache'))
+    INFORMES_PROGRAMADOR_ACTIVO = os.environ.get('INFORMES_PROGRAMADOR_ACTIVO', 'False').lower() == 'true'
+    INFORMES_HORA_PREGENERACION = os.environ.get('INFORMES_HORA_PREGENERACION', '02:00')
+    
+    # Token para leer /metricas sin sesión (Authorization: Bearer ...); vacío = solo administradores
+    METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+    
     # Usuario inicial
     INITIAL_USER_EMAIL = os.environ.get('INITIAL_USER_EMAIL')
     INITIAL_USER_PASSWORD = os.environ.get('INITIAL_USER_PASSWORD')
@@ -16,7 +16,7 @@ def main():
     
     try:
         # Importar y ejecutar la aplicación
-        from app import app, init_db
+        from app import app, init_db, iniciar_programador_informes
         
         print("✅ Aplicación importada correctamente")
         
@@ -24,6 +24,10 @@ def main():
         print("📊 Inicializando base de datos...")
         init_db()
         
+        # Con debug=True el programador solo corre en el proceso hijo del recargador
+        if app.config['INFORMES_PROGRAMADOR_ACTIVO'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            iniciar_programador_informes()
+        
         print("🌐 Iniciando servidor web...")
         print("📍 URL: http://localhost:5000")
         print("=" * 50)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Script para generar informes sin pasar por la interfaz web (trabajos por lote o en otro servidor)
+
+Usa el mismo código de renderizado que las rutas de la aplicación. Ejemplos:
+    python generar_informe.py csv --cliente 3 --desde 2024-01-01 --hasta 2024-01-31
+    python generar_informe.py profesional --ids 10,11,12 --agrupacion cliente
+    python generar_informe.py estructurado --desde 2024-01-01 --hasta 2024-01-31 --por-cliente --workers 4
+    python generar_informe.py estructurado --estado Cerrada --volumenes paginas --limite 80 --salida informes/
+    python generar_informe.py formularios --formulario 2 --workers 4 --salida formularios/
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def lista_ids(valor):
+    """Convierte '1,2,5-8' en [1, 2, 5, 6, 7, 8]"""
+    ids = []
+    for parte in valor.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if '-' in parte:
+            inicio, fin = parte.split('-', 1)
+            ids.extend(range(int(inicio), int(fin) + 1))
+        else:
+            ids.append(int(parte))
+    return ids
+
+def fecha(valor):
+    return datetime.strptime(valor, '%Y-%m-%d')
+
+def agregar_filtros(parser):
+    parser.add_argument('--ids', type=lista_ids, help='IDs de incidencias (ej: 1,2,5-8)')
+    parser.add_argument('--cliente', type=int, action='append', help='ID de cliente (se puede repetir)')
+    parser.add_argument('--sede', type=int, action='append', help='ID de sede (se puede repetir)')
+    parser.add_argument('--sistema', type=int, action='append', help='ID de sistema (se puede repetir)')
+    parser.add_argument('--tecnico', type=int, action='append', help='ID del técnico asignado (se puede repetir)')
+    parser.add_argument('--estado', action='append', help='Estado de la incidencia (se puede repetir)')
+    parser.add_argument('--desde', type=fecha, help='Fecha de inicio mínima AAAA-MM-DD')
+    parser.add_argument('--hasta', type=fecha, help='Fecha de inicio máxima AAAA-MM-DD (incluida)')
+
+def agregar_salida(parser, ayuda):
+    parser.add_argument('--salida', help=ayuda)
+
+def buscar_incidencias(args):
+    """IDs de las incidencias que cumplen los filtros, en orden"""
+    from app import Incidencia
+
+    consulta = Incidencia.query.with_entities(Incidencia.id)
+    if args.ids:
+        consulta = consulta.filter(Incidencia.id.in_(args.ids))
+    if args.cliente:
+        consulta = consulta.filter(Incidencia.cliente_id.in_(args.cliente))
+    if args.sede:
+        consulta = consulta.filter(Incidencia.sede_id.in_(args.sede))
+    if args.sistema:
+        consulta = consulta.filter(Incidencia.sistema_id.in_(args.sistema))
+    if args.tecnico:
+        consulta = consulta.filter(Incidencia.tecnico_asignado.in_(args.tecnico))
+    if args.estado:
+        consulta = consulta.filter(Incidencia.estado.in_(args.estado))
+    if args.desde:
+        consulta = consulta.filter(Incidencia.fecha_inicio >= args.desde)
+    if args.hasta:
+        consulta = consulta.filter(Incidencia.fecha_inicio < args.hasta + timedelta(days=1))
+    return [incidencia_id for (incidencia_id,) in consulta.order_by(Incidencia.id)]
+
+def ruta_salida(salida, nombre_por_defecto):
+    """Si la salida es un directorio (o termina en /) el archivo se crea dentro con el nombre por defecto"""
+    if not salida:
+        return nombre_por_defecto
+    if salida.endswith(os.sep) or os.path.isdir(salida):
+        os.makedirs(salida, exist_ok=True)
+        return os.path.join(salida, nombre_por_defecto)
+    directorio = os.path.dirname(salida)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    return salida
+
+def directorio_salida(salida, por_defecto):
+    directorio = salida or por_defecto
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+def escribir(ruta, contenido):
+    with open(ruta, 'wb') as f:
+        f.write(contenido)
+    print(f"📄 {ruta} ({len(contenido) / 1024:.1f} KB)")
+
+def datos_informe(args, incidencias):
+    """datos_informe del informe estructurado: archivo JSON opcional más los valores de la línea de comandos"""
+    clientes = sorted({incidencia.cliente.nombre for incidencia in incidencias})
+    datos = {
+        'cliente': clientes[0] if len(clientes) == 1 else 'Cliente del Informe',
+        'atencion': 'Persona de Contacto',
+        'cargo': 'Cargo del Contacto',
+        'alcance': 'Alcance del Proyecto',
+        'fecha': datetime.now().strftime('%d/%m/%Y'),
+        'introduccion': 'Este informe presenta las actividades realizadas durante el período de mantenimiento y soporte técnico.',
+        'conclusiones': 'Se han completado exitosamente todas las actividades programadas.',
+        'version': '1'
+    }
+    if args.datos:
+        with open(args.datos, encoding='utf-8') as f:
+            datos.update(json.load(f))
+    for clave in ('atencion', 'cargo', 'alcance', 'introduccion', 'conclusiones', 'version'):
+        valor = getattr(args, clave)
+        if valor:
+            datos[clave] = valor
+    if args.nombre_cliente:
+        datos['cliente'] = args.nombre_cliente
+    return datos
+
+def comando_csv(args):
+    from app import construir_csv, cargar_instantaneas_incidencias
+
+    incidencias = cargar_instantaneas_incidencias(buscar_incidencias(args))
+    if not incidencias:
+        print("⚠️ Ninguna incidencia cumple los filtros")
+        return 1
+
+    ruta = ruta_salida(args.salida, f'informe_incidencias_{datetime.now().strftime("%Y%m%d_%H%M")}.csv')
+    escribir(ruta, construir_csv(incidencias))
+    return 0
+
+def comando_profesional(args):
+    from app import construir_pdf_profesional, cargar_instantaneas_incidencias
+
+    incidencias = cargar_instantaneas_incidencias(buscar_incidencias(args))
+    if not incidencias:
+        print("⚠️ Ninguna incidencia cumple los filtros")
+        return 1
+
+    pdf_bytes = construir_pdf_profesional(incidencias, args.agrupacion)
+    if not pdf_bytes:
+        print("❌ Error generando el informe profesional")
+        return 1
+
+    ruta = ruta_salida(args.salida, f'informe_profesional_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf')
+    escribir(ruta, pdf_bytes)
+    return 0
+
+def comando_estructurado(args):
+    from app import (
+        app, Cliente, construir_pdf_informe_html_format, cargar_instantaneas_incidencias,
+        dividir_en_volumenes, renderizar_en_paralelo, _renderizar_volumen_informe,
+        _renderizar_informe_cliente, preparar_datos_informe_cliente
+    )
+    from werkzeug.utils import secure_filename
+
+    incidencias = cargar_instantaneas_incidencias(buscar_incidencias(args))
+    if not incidencias:
+        print("⚠️ Ninguna incidencia cumple los filtros")
+        return 1
+
+    marca = datetime.now().strftime("%Y%m%d_%H%M")
+
+    if args.por_cliente:
+        # Un informe por cliente, con los textos de la plantilla aplicados a cada uno
+        incidencias_por_cliente = {}
+        for incidencia in incidencias:
+            incidencias_por_cliente.setdefault(incidencia.cliente.id, []).append(incidencia)
+
+        inicio = args.desde or min(incidencia.fecha_inicio for incidencia in incidencias).replace(hour=0, minute=0, second=0, microsecond=0)
+        fin = (args.hasta or max(incidencia.fecha_inicio for incidencia in incidencias)).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        etiqueta = f'{inicio:%Y%m%d}-{fin - timedelta(days=1):%Y%m%d}'
+        plantilla = {}
+        if args.datos:
+            with open(args.datos, encoding='utf-8') as f:
+                plantilla.update(json.load(f))
+        for clave in ('alcance', 'introduccion', 'conclusiones'):
+            if getattr(args, clave):
+                plantilla[clave] = getattr(args, clave)
+
+        tareas = []
+        for cliente in Cliente.query.filter(Cliente.id.in_(incidencias_por_cliente)).order_by(Cliente.nombre):
+            nombre_archivo = f'informe_{cliente.id:04d}_{secure_filename(cliente.nombre) or "cliente"}_{etiqueta}.pdf'
+            datos = preparar_datos_informe_cliente(cliente, inicio, fin, etiqueta, plantilla)
+            tareas.append((nombre_archivo, incidencias_por_cliente[cliente.id], datos))
+
+        directorio = directorio_salida(args.salida, f'informes_clientes_{etiqueta}')
+        print(f"📊 {len(tareas)} informes de clientes con {app.config['INFORME_WORKERS']} procesos...")
+        for nombre, pdf_bytes in renderizar_en_paralelo(_renderizar_informe_cliente, tareas):
+            escribir(os.path.join(directorio, nombre), pdf_bytes)
+        return 0
+
+    datos = datos_informe(args, incidencias)
+
+    if args.volumenes:
+        volumenes = dividir_en_volumenes(incidencias, args.volumenes, args.limite)
+        total = len(volumenes)
+        tareas = [
+            (vol['incidencias'], datos, vol['figura_inicial'], vol['actividad_inicial'], numero, total)
+            for numero, vol in enumerate(volumenes, 1)
+        ]
+        directorio = directorio_salida(args.salida, f'informe_volumenes_{marca}')
+        print(f"📊 Informe dividido en {total} volúmenes con {app.config['INFORME_WORKERS']} procesos...")
+        for nombre, pdf_bytes in renderizar_en_paralelo(_renderizar_volumen_informe, tareas):
+            escribir(os.path.join(directorio, nombre), pdf_bytes)
+        return 0
+
+    pdf_bytes = construir_pdf_informe_html_format(incidencias, datos)
+    if not pdf_bytes:
+        print("❌ Error generando el informe estructurado")
+        return 1
+    escribir(ruta_salida(args.salida, f'informe_html_format_{marca}.pdf'), pdf_bytes)
+    return 0
+
+def comando_formularios(args):
+    from app import RespuestaFormulario, renderizar_en_paralelo, _renderizar_formulario
+    from functools import partial
+
+    consulta = RespuestaFormulario.query.with_entities(RespuestaFormulario.id)
+    if args.ids:
+        consulta = consulta.filter(RespuestaFormulario.id.in_(args.ids))
+    if args.formulario:
+        consulta = consulta.filter(RespuestaFormulario.formulario_id.in_(args.formulario))
+    if args.desde:
+        consulta = consulta.filter(RespuestaFormulario.fecha_diligenciamiento >= args.desde)
+    if args.hasta:
+        consulta = consulta.filter(RespuestaFormulario.fecha_diligenciamiento < args.hasta + timedelta(days=1))
+    respuestas_ids = [respuesta_id for (respuesta_id,) in consulta.order_by(RespuestaFormulario.id)]
+
+    if not respuestas_ids:
+        print("⚠️ Ninguna respuesta de formulario cumple los filtros")
+        return 1
+
+    # Solo con --actualizar los PDF se guardan en uploads/formularios (quedan registrados en la respuesta)
+    if args.actualizar:
+        directorio = directorio_salida(args.salida, None) if args.salida else None
+    else:
+        directorio = os.path.abspath(directorio_salida(args.salida, f'formularios_{datetime.now().strftime("%Y%m%d_%H%M")}'))
+    print(f"📝 Generando {len(respuestas_ids)} PDF de formularios...")
+
+    errores = 0
+    tareas = [(respuesta_id,) for respuesta_id in respuestas_ids]
+    renderizar = partial(_renderizar_formulario, actualizar=args.actualizar, directorio=None if args.actualizar else directorio)
+    for respuesta_id, ruta in renderizar_en_paralelo(renderizar, tareas):
+        if not ruta:
+            errores += 1
+            print(f"❌ Respuesta {respuesta_id}: error generando el PDF")
+            continue
+        if args.actualizar and directorio:
+            destino = os.path.join(directorio, os.path.basename(ruta))
+            shutil.copyfile(ruta, destino)
+            ruta = destino
+        print(f"📄 Respuesta {respuesta_id}: {ruta}")
+
+    print(f"✅ {len(respuestas_ids) - errores} PDF generados, {errores} con error")
+    return 1 if errores else 0
+
+def main():
+    ayuda_workers = 'Procesos de renderizado en paralelo (por defecto INFORME_WORKERS)'
+    parser = argparse.ArgumentParser(description='Genera informes de ERP BACS desde la línea de comandos')
+    parser.add_argument('--workers', type=int, help=ayuda_workers)
+    # --workers también se acepta después del subcomando; SUPPRESS evita que pise el valor dado antes
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--workers', type=int, default=argparse.SUPPRESS, help=ayuda_workers)
+    subparsers = parser.add_subparsers(dest='tipo', required=True)
+
+    p_csv = subparsers.add_parser('csv', parents=[comunes], help='Informe CSV de incidencias')
+    agregar_filtros(p_csv)
+    agregar_salida(p_csv, 'Archivo o directorio de salida')
+    p_csv.set_defaults(funcion=comando_csv)
+
+    p_profesional = subparsers.add_parser('profesional', parents=[comunes], help='Informe PDF profesional')
+    agregar_filtros(p_profesional)
+    p_profesional.add_argument('--agrupacion', choices=['estado', 'cliente', 'tecnico', 'sistema'], default='estado')
+    agregar_salida(p_profesional, 'Archivo o directorio de salida')
+    p_profesional.set_defaults(funcion=comando_profesional)
+
+    p_estructurado = subparsers.add_parser('estructurado', parents=[comunes], help='Informe PDF estructurado (formato HTML)')
+    agregar_filtros(p_estructurado)
+    p_estructurado.add_argument('--datos', help='Archivo JSON con los datos del informe (cliente, atencion, cargo, ...)')
+    p_estructurado.add_argument('--nombre-cliente', help='Nombre del cliente en el encabezado')
+    p_estructurado.add_argument('--atencion')
+    p_estructurado.add_argument('--cargo')
+    p_estructurado.add_argument('--alcance')
+    p_estructurado.add_argument('--introduccion')
+    p_estructurado.add_argument('--conclusiones')
+    p_estructurado.add_argument('--version')
+    p_estructurado.add_argument('--por-cliente', action='store_true', help='Un informe por cliente, renderizados en paralelo')
+    p_estructurado.add_argument('--volumenes', choices=['incidencias', 'paginas'], help='Dividir en volúmenes renderizados en paralelo')
+    p_estructurado.add_argument('--limite', type=int, help='Incidencias o páginas por volumen')
+    agregar_salida(p_estructurado, 'Archivo de salida, o directorio con --por-cliente/--volumenes')
+    p_estructurado.set_defaults(funcion=comando_estructurado)
+
+    p_formularios = subparsers.add_parser('formularios', parents=[comunes], help='PDF de respuestas de formularios')
+    p_formularios.add_argument('--ids', type=lista_ids, help='IDs de respuestas (ej: 1,2,5-8)')
+    p_formularios.add_argument('--formulario', type=int, action='append', help='ID del formulario (se puede repetir)')
+    p_formularios.add_argument('--desde', type=fecha, help='Fecha de diligenciamiento mínima AAAA-MM-DD')
+    p_formularios.add_argument('--hasta', type=fecha, help='Fecha de diligenciamiento máxima AAAA-MM-DD (incluida)')
+    p_formularios.add_argument('--actualizar', action='store_true', help='Registrar el nuevo PDF en la respuesta')
+    agregar_salida(p_formularios, 'Directorio de salida (por defecto formularios_<fecha>; con --actualizar los PDF '
+                                  'quedan en uploads/formularios y se copian aquí)')
+    p_formularios.set_defaults(funcion=comando_formularios)
+
+    args = parser.parse_args()
+
+    from app import app
+
+    if args.workers:
+        app.config['INFORME_WORKERS'] = max(1, args.workers)
+
+    with app.app_context():
+        return args.funcion(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
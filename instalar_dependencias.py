@@ -6,6 +6,18 @@ Script para instalar todas las dependencias necesarias para el ERP BACS
 import subprocess
 import sys
 import os
+import urllib.request
+
+# Fuente abierta (SIL OFL) métricamente compatible con Calibri, usada en los PDF
+CARPETA_FUENTES = os.environ.get('FONTS_FOLDER', os.path.join('files', 'fonts'))
+URL_FUENTES = "https://github.com/google/fonts/raw/main/ofl/carlito/"
+ARCHIVOS_FUENTES = [
+    "Carlito-Regular.ttf",
+    "Carlito-Bold.ttf",
+    "Carlito-Italic.ttf",
+    "Carlito-BoldItalic.ttf",
+    "OFL.txt"
+]
 
 def instalar_dependencias():
     """Instalar todas las dependencias necesarias"""
@@ -47,6 +59,28 @@ def instalar_dependencias():
     
     return True
 
+def descargar_fuentes():
+    """Descargar la fuente Carlito en la carpeta de fuentes si aún no está"""
+    
+    os.makedirs(CARPETA_FUENTES, exist_ok=True)
+    print(f"🔤 Verificando fuentes en {CARPETA_FUENTES}...")
+    
+    for archivo in ARCHIVOS_FUENTES:
+        destino = os.path.join(CARPETA_FUENTES, archivo)
+        if os.path.exists(destino):
+            print(f"✅ {archivo} - OK")
+            continue
+        try:
+            print(f"📥 Descargando {archivo}...")
+            urllib.request.urlretrieve(URL_FUENTES + archivo, destino)
+            print(f"✅ {archivo} descargado correctamente")
+        except Exception as e:
+            print(f"⚠️  No se pudo descargar {archivo}: {e}")
+            print("   Los PDF usarán Helvetica hasta que la fuente esté disponible.")
+            return False
+    
+    return True
+
 def verificar_dependencias():
     """Verificar que todas las dependencias estén instaladas"""
     
@@ -99,3 +133,6 @@ if __name__ == "__main__":
         else:
             print("\n❌ Error en la instalación. Revisa los mensajes anteriores.")
             sys.exit(1)
+    
+    print()
+    descargar_fuentes()
@@ -6,7 +6,7 @@ Este script crea todas las tablas necesarias y datos iniciales
 
 import os
 import sys
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 # Agregar el directorio actual al path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -47,6 +47,34 @@ def migrar_base_datos():
             db.create_all()
             print("OK - Tablas creadas correctamente")
             
+            # Columnas agregadas a tablas existentes (create_all no altera tablas ya creadas)
+            columnas_nuevas = [
+                ('formulario', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+                ('respuesta_formulario', 'estado_pdf', 'VARCHAR(20)'),
+                ('respuesta_formulario', 'fecha_estado_pdf', 'DATETIME'),
+                ('respuesta_formulario', 'id_cliente', 'VARCHAR(64)')
+            ]
+            inspector = inspect(db.engine)
+            for tabla, columna, definicion in columnas_nuevas:
+                if columna not in [c['name'] for c in inspector.get_columns(tabla)]:
+                    with db.engine.begin() as conexion:
+                        conexion.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+                    print(f"OK - Columna {tabla}.{columna} creada")
+            
+            # MySQL solo indexa un prefijo de las columnas TEXT
+            from app import PREFIJO_INDICE_VALOR_TEXTO
+            prefijo = f'({PREFIJO_INDICE_VALOR_TEXTO})' if db.engine.dialect.name == 'mysql' else ''
+            indices_nuevos = [
+                ('respuesta_formulario', 'ix_respuesta_formulario_id_cliente', 'id_cliente', True),
+                ('respuesta_campo', 'ix_respuesta_campo_campo_texto', f'campo_id, valor_texto{prefijo}', False),
+                ('respuesta_campo', 'ix_respuesta_campo_campo_fecha', 'campo_id, valor_fecha', False)
+            ]
+            for tabla, indice, columna, unico in indices_nuevos:
+                if indice not in [i['name'] for i in inspector.get_indexes(tabla)]:
+                    with db.engine.begin() as conexion:
+                        conexion.execute(text(f"CREATE {'UNIQUE ' if unico else ''}INDEX {indice} ON {tabla} ({columna})"))
+                    print(f"OK - Indice {indice} creado")
+            
             # Crear datos iniciales
             print("Creando datos iniciales...")
             
@@ -129,6 +157,12 @@ def migrar_base_datos():
                 db.session.commit()
                 print("OK - Indices creados")
             
+            # Convertir firmas antiguas guardadas en base64 a PNG canónico
+            from app import normalizar_firmas_heredadas
+            firmas_convertidas = normalizar_firmas_heredadas()
+            if firmas_convertidas:
+                print(f"OK - {firmas_convertidas} firmas antiguas normalizadas a PNG de 1 bit")
+            
             print("=" * 60)
             print("MIGRACION COMPLETADA EXITOSAMENTE!")
             print("=" * 60)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Script para pregenerar los informes recurrentes configurados (para cron / programador de tareas)
+
+Ejemplo de cron (todos los días a las 2:00):
+    0 2 * * * cd /ruta/ERP_BACS && python pregenerar_informes.py
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Pregenera los informes recurrentes en la caché de informes')
+    parser.add_argument('--fecha', help='Fecha de referencia AAAA-MM-DD (por defecto hoy)')
+    parser.add_argument('--informe', action='append', help='Nombre del informe a generar (se puede repetir)')
+    parser.add_argument('--forzar', action='store_true', help='Regenerar aunque exista en caché')
+    parser.add_argument('--listar', action='store_true', help='Solo listar los informes en caché')
+    args = parser.parse_args()
+    
+    from app import app, pregenerar_informes_recurrentes, listar_informes_cache
+    
+    with app.app_context():
+        if args.listar:
+            for metadatos in listar_informes_cache():
+                print(f"📄 {metadatos['archivo']} - {metadatos['cliente']} ({metadatos['etiqueta']}), "
+                      f"{metadatos['incidencias']} incidencias, generado {metadatos['generado']}")
+            return 0
+        
+        referencia = datetime.strptime(args.fecha, '%Y-%m-%d') if args.fecha else None
+        print("📊 Pregenerando informes recurrentes...")
+        generados = pregenerar_informes_recurrentes(referencia, args.forzar, args.informe)
+        print(f"✅ {len(generados)} informe(s) generado(s)")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
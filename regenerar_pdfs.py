@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Script para regenerar en bloque los PDF de formularios diligenciados (tras cambiar logo, fuentes o maquetación)
+
+Los PDF se generan en procesos de baja prioridad, por tandas y con una pausa entre tandas. El progreso
+se guarda tras cada tanda: si el script se interrumpe, se continúa con --reanudar.
+
+Ejemplos:
+    python regenerar_pdfs.py --formulario 3 --desde 2024-01-01 --hasta 2024-06-30
+    python regenerar_pdfs.py --workers 1 --pausa 2
+    python regenerar_pdfs.py --reanudar 7
+    python regenerar_pdfs.py --listar
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Regenera los PDF de los formularios diligenciados')
+    parser.add_argument('--formulario', type=int, help='ID del formulario (por defecto todos)')
+    parser.add_argument('--desde', help='Fecha de diligenciamiento inicial AAAA-MM-DD')
+    parser.add_argument('--hasta', help='Fecha de diligenciamiento final AAAA-MM-DD (inclusive)')
+    parser.add_argument('--workers', type=int, help='Procesos de generación (por defecto REGENERACION_PDF_WORKERS)')
+    parser.add_argument('--pausa', type=float, help='Segundos de espera entre tandas (por defecto REGENERACION_PDF_PAUSA)')
+    parser.add_argument('--reanudar', type=int, metavar='ID', help='Continuar un trabajo interrumpido')
+    parser.add_argument('--listar', action='store_true', help='Solo listar los trabajos recientes')
+    args = parser.parse_args()
+    
+    from app import app, db, RegeneracionPDF, crear_regeneracion_pdfs, ejecutar_regeneracion_pdfs
+    
+    with app.app_context():
+        if args.listar:
+            for trabajo in RegeneracionPDF.query.order_by(RegeneracionPDF.id.desc()).limit(20):
+                print(f"📄 #{trabajo.id} {trabajo.formulario.nombre if trabajo.formulario else 'Todos'} "
+                      f"({trabajo.fecha_desde or '...'} a {trabajo.fecha_hasta or '...'}): {trabajo.estado}, "
+                      f"{trabajo.procesadas}/{trabajo.total}, {trabajo.errores} errores")
+            return 0
+        
+        if args.reanudar:
+            trabajo = db.session.get(RegeneracionPDF, args.reanudar)
+            if trabajo is None:
+                print(f"❌ No existe el trabajo {args.reanudar}")
+                return 1
+            if not trabajo.reanudable:
+                print(f"❌ El trabajo {trabajo.id} está {trabajo.estado} y no se puede reanudar")
+                return 1
+            print(f"🔁 Reanudando el trabajo {trabajo.id} desde la respuesta {trabajo.ultimo_id}")
+        else:
+            desde = datetime.strptime(args.desde, '%Y-%m-%d').date() if args.desde else None
+            hasta = datetime.strptime(args.hasta, '%Y-%m-%d').date() if args.hasta else None
+            trabajo = crear_regeneracion_pdfs(args.formulario, desde, hasta)
+            print(f"📊 Trabajo {trabajo.id}: {trabajo.total} PDF por regenerar")
+        
+        def mostrar_progreso(trabajo):
+            print(f"   {trabajo.procesadas}/{trabajo.total} ({trabajo.porcentaje}%), {trabajo.errores} errores")
+        
+        try:
+            resultado = ejecutar_regeneracion_pdfs(trabajo.id, args.workers, args.pausa, mostrar_progreso)
+        except KeyboardInterrupt:
+            db.session.rollback()
+            trabajo = db.session.get(RegeneracionPDF, trabajo.id)
+            trabajo.estado = 'Interrumpida'
+            db.session.commit()
+            print(f"\n⏸️  Interrumpido. Continúa con: python regenerar_pdfs.py --reanudar {trabajo.id}")
+            return 1
+        
+        if resultado is None:
+            print(f"❌ El trabajo {trabajo.id} ya se está ejecutando en otro proceso")
+            return 1
+        trabajo = resultado
+        print(f"✅ Trabajo {trabajo.id} {trabajo.estado.lower()}: {trabajo.procesadas} PDF, {trabajo.errores} errores")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+// Subidas reanudables por fragmentos para fotos y adjuntos
+//
+// Los inputs de archivo marcados con data-subida se suben antes de enviar el formulario:
+// se abre una sesión en /api/subidas, se envían fragmentos con PUT indicando el offset y se
+// finaliza con la suma SHA-256. El formulario viaja después sin los archivos, solo con los
+// identificadores en campos ocultos "subida_<nombre del input>". Si la conexión se cae, el
+// siguiente intento retoma cada archivo desde el último byte confirmado por el servidor.
+//
+// Las fotos JPEG/WebP se reducen antes en el navegador al lado máximo (data-lado-max) y la
+// calidad (data-calidad) del input, salvo que el formulario marque .conservar-original.
+const SubidasFragmentadas = (function() {
+    const REINTENTOS = 5;
+    const CLAVE_ALMACEN = 'subidas_fragmentadas';
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    function claveArchivo(archivo) {
+        return [archivo.name, archivo.size, archivo.lastModified].join(':');
+    }
+
+    function leerAlmacen() {
+        try {
+            return JSON.parse(localStorage.getItem(CLAVE_ALMACEN)) || {};
+        } catch (e) {
+            return {};
+        }
+    }
+
+    function recordarSubida(archivo, id) {
+        const almacen = leerAlmacen();
+        if (id) {
+            almacen[claveArchivo(archivo)] = id;
+        } else {
+            delete almacen[claveArchivo(archivo)];
+        }
+        try {
+            localStorage.setItem(CLAVE_ALMACEN, JSON.stringify(almacen));
+        } catch (e) {
+            // Sin almacenamiento local solo se pierde la reanudación entre recargas
+        }
+    }
+
+    async function pedirJSON(url, opciones) {
+        const respuesta = await fetch(url, Object.assign({credentials: 'same-origin'}, opciones));
+        let datos = {};
+        try {
+            datos = await respuesta.json();
+        } catch (e) {
+            // Respuesta sin JSON (p. ej. error del proxy)
+        }
+        datos.status = respuesta.status;
+        return datos;
+    }
+
+    async function conReintentos(operacion) {
+        for (let intento = 0; ; intento++) {
+            try {
+                return await operacion();
+            } catch (error) {
+                if (intento >= REINTENTOS) {
+                    throw error;
+                }
+                // Espera creciente: 1, 2, 4, 8... segundos
+                await esperar(1000 * Math.pow(2, intento));
+            }
+        }
+    }
+
+    async function sumaSHA256(archivo) {
+        // crypto.subtle solo existe en contextos seguros (HTTPS o localhost)
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const resumen = await window.crypto.subtle.digest('SHA-256', await archivo.arrayBuffer());
+        return Array.from(new Uint8Array(resumen)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    function decodificarImagen(archivo) {
+        if (typeof createImageBitmap !== 'undefined') {
+            // from-image aplica la orientación EXIF, que se pierde al recomprimir
+            return createImageBitmap(archivo, {imageOrientation: 'from-image'});
+        }
+        return new Promise(function(resolve, reject) {
+            const url = URL.createObjectURL(archivo);
+            const imagen = new Image();
+            imagen.onload = function() {
+                URL.revokeObjectURL(url);
+                resolve(imagen);
+            };
+            imagen.onerror = function() {
+                URL.revokeObjectURL(url);
+                reject(new Error('Imagen no legible'));
+            };
+            imagen.src = url;
+        });
+    }
+
+    async function reducirImagen(archivo, ladoMax, calidad) {
+        // PNG, GIF y documentos se suben tal cual (transparencias, diagramas, PDF)
+        if (!ladoMax || !/^image\/(jpeg|webp)$/.test(archivo.type)) {
+            return archivo;
+        }
+        let imagen;
+        try {
+            imagen = await decodificarImagen(archivo);
+        } catch (e) {
+            return archivo;
+        }
+        const escala = Math.min(1, ladoMax / Math.max(imagen.width, imagen.height));
+        if (escala >= 1) {
+            if (imagen.close) imagen.close();
+            return archivo;
+        }
+        const ancho = Math.round(imagen.width * escala);
+        const alto = Math.round(imagen.height * escala);
+
+        let blob;
+        if (typeof OffscreenCanvas !== 'undefined' && OffscreenCanvas.prototype.convertToBlob) {
+            const lienzo = new OffscreenCanvas(ancho, alto);
+            lienzo.getContext('2d').drawImage(imagen, 0, 0, ancho, alto);
+            blob = await lienzo.convertToBlob({type: 'image/jpeg', quality: calidad});
+        } else {
+            const lienzo = document.createElement('canvas');
+            lienzo.width = ancho;
+            lienzo.height = alto;
+            lienzo.getContext('2d').drawImage(imagen, 0, 0, ancho, alto);
+            blob = await new Promise(resolve => lienzo.toBlob(resolve, 'image/jpeg', calidad));
+        }
+        if (imagen.close) imagen.close();
+
+        if (!blob || blob.size >= archivo.size) {
+            return archivo;
+        }
+        // Se conserva el nombre: los collages de la incidencia hacen referencia a él
+        return new File([blob], archivo.name, {type: 'image/jpeg', lastModified: archivo.lastModified});
+    }
+
+    async function abrirSesion(archivo) {
+        const id = leerAlmacen()[claveArchivo(archivo)];
+        if (id) {
+            const estado = await pedirJSON(`/api/subidas/${id}`);
+            if (estado.success) {
+                return estado;
+            }
+        }
+        const nueva = await pedirJSON('/api/subidas', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({nombre: archivo.name, tamano: archivo.size})
+        });
+        if (!nueva.success) {
+            throw new Error(nueva.message || 'No se pudo iniciar la subida');
+        }
+        recordarSubida(archivo, nueva.id);
+        return nueva;
+    }
+
+    async function subir(archivo, alProgresar) {
+        let sesion = await conReintentos(() => abrirSesion(archivo));
+        if (sesion.completa) {
+            return sesion.id;
+        }
+        const tamanoFragmento = sesion.tamano_fragmento || 1024 * 1024;
+        let recibido = sesion.recibido || 0;
+
+        while (recibido < archivo.size) {
+            const fragmento = archivo.slice(recibido, recibido + tamanoFragmento);
+            const resultado = await conReintentos(async function() {
+                let respuesta;
+                try {
+                    respuesta = await pedirJSON(`/api/subidas/${sesion.id}?offset=${recibido}`, {
+                        method: 'PUT',
+                        headers: {'Content-Type': 'application/octet-stream'},
+                        body: fragmento
+                    });
+                } catch (error) {
+                    // Conexión perdida a mitad del fragmento: preguntar hasta dónde llegó
+                    const estado = await pedirJSON(`/api/subidas/${sesion.id}`);
+                    if (estado.success && estado.recibido > recibido) {
+                        return estado;
+                    }
+                    throw error;
+                }
+                if (respuesta.status === 409 && respuesta.recibido !== undefined) {
+                    return respuesta;  // El servidor indica el offset correcto
+                }
+                if (respuesta.status >= 500 || respuesta.recibido === undefined) {
+                    throw new Error(respuesta.message || 'Error al subir el fragmento');
+                }
+                return respuesta;
+            });
+            recibido = resultado.recibido;
+            if (alProgresar) {
+                alProgresar(recibido, archivo.size);
+            }
+        }
+
+        const sha256 = await sumaSHA256(archivo);
+        const final = await conReintentos(() => pedirJSON(`/api/subidas/${sesion.id}/finalizar`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({sha256: sha256})
+        }));
+        if (!final.success) {
+            // Suma distinta: el servidor reinició la sesión, el próximo intento la sube de nuevo
+            throw new Error(final.message || 'No se pudo completar la subida');
+        }
+        return sesion.id;
+    }
+
+    function inputsPendientes(formulario) {
+        return Array.from(formulario.querySelectorAll('input[type="file"][data-subida]'))
+            .filter(input => !input.disabled && input.files && input.files.length > 0);
+    }
+
+    function hayPendientes(formulario) {
+        return typeof fetch !== 'undefined' && inputsPendientes(formulario).length > 0;
+    }
+
+    async function prepararFormulario(formulario, alProgresar) {
+        const conservar = formulario.querySelector('.conservar-original');
+        const subidos = [];
+        for (const input of inputsPendientes(formulario)) {
+            const ids = [];
+            for (const original of Array.from(input.files)) {
+                const archivo = (conservar && conservar.checked) ? original
+                    : await reducirImagen(original, Number(input.dataset.ladoMax || 0), Number(input.dataset.calidad || 0.8));
+                ids.push(await subir(archivo, alProgresar ? (enviados, total) => alProgresar(archivo, enviados, total) : null));
+                subidos.push(archivo);
+            }
+            ids.forEach(function(id) {
+                const oculto = document.createElement('input');
+                oculto.type = 'hidden';
+                oculto.name = `subida_${input.name}`;
+                oculto.value = id;
+                formulario.appendChild(oculto);
+            });
+            // Los archivos ya están en el servidor: no volver a enviarlos en el formulario
+            input.disabled = true;
+        }
+        // El formulario ya referencia las subidas; olvidar las sesiones para no reutilizarlas
+        subidos.forEach(archivo => recordarSubida(archivo, null));
+    }
+
+    // Envío por defecto de los formularios marcados con data-subidas: subir primero y enviar después
+    function interceptarEnvio(formulario) {
+        const estado = formulario.querySelector('.subidas-estado');
+        formulario.addEventListener('submit', function(e) {
+            if (e.defaultPrevented || !hayPendientes(formulario)) {
+                return;
+            }
+            e.preventDefault();
+            prepararFormulario(formulario, function(archivo, enviados, total) {
+                if (estado) {
+                    estado.textContent = `Subiendo ${archivo.name}: ${Math.round(enviados * 100 / total)}%`;
+                }
+            }).then(function() {
+                formulario.submit();
+            }).catch(function(error) {
+                if (estado) {
+                    estado.textContent = '';
+                }
+                alert('No se pudieron subir los archivos: ' + error.message + '\nVuelve a intentarlo; la subida continuará donde quedó.');
+            });
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        document.querySelectorAll('form[data-subidas]').forEach(interceptarEnvio);
+    });
+
+    return {subir: subir, reducirImagen: reducirImagen, hayPendientes: hayPendientes, prepararFormulario: prepararFormulario};
+})();